@@ -0,0 +1,116 @@
+"""
+Airflow DAGs for the connectors that load BigQuery, one DAG per source.
+
+Each run fans out over shards of the source's entities with dynamic task
+mapping: every shard of GA4 properties, GBP locations or BrightLocal
+places gets its own mapped fetch task, which runs the connector with
+--fetch-only and saves the shard's raw responses (see raw_store.py). A
+slow or failing location only holds up, and retries, its own shard. Once
+all shards are fetched, a single load task replays their responses and
+loads them exactly like a standalone run, change detection included.
+
+The load only ever replays the manifests its fetch tasks returned (never
+"the latest run"), and first saves them as the parts of one run, so a
+manual --replay of the latest run also replays every shard.
+
+Fetch tasks run in one Airflow pool per source, which caps the calls in
+flight against each API across all runs. Create the pools once:
+
+    airflow pools set ga_api 4 "GA4 Data API"
+    airflow pools set gbp_api 4 "Business Profile Performance API"
+    airflow pools set brightlocal_api 2 "BrightLocal API"
+
+Requires Airflow 2.4+ with this repository on the workers' PYTHONPATH
+(e.g. symlink this file into the dags folder). The raw store has to be on
+storage all workers share, since load tasks read what fetch tasks wrote.
+"""
+from datetime import timedelta
+
+import pendulum
+from airflow.decorators import dag, task
+from airflow.exceptions import AirflowFailException
+from airflow.operators.python import get_current_context
+
+import bright_local_scaling
+import ga
+import gbp_overwrite
+from raw_store import RAW_STORE_DIR, write_run_set
+
+# Per source: connector module, entities to shard and the flag that passes a
+# shard to the connector, entities per shard, and the pool of its fetch tasks
+SOURCES = {
+    "ga": {
+        "module": ga, "ids": lambda: ga.PROPERTY_IDS, "shard_flag": "--properties",
+        "shard_size": 10, "pool": "ga_api",
+    },
+    "gbp_overwrite": {
+        "module": gbp_overwrite, "ids": lambda: gbp_overwrite.LOCATION_IDS, "shard_flag": "--locations",
+        "shard_size": 25, "pool": "gbp_api",
+    },
+    "bright_local_scaling": {
+        "module": bright_local_scaling, "ids": lambda: bright_local_scaling.profile_ids,
+        "shard_flag": "--places", "shard_size": bright_local_scaling.BATCH_SIZE, "pool": "brightlocal_api",
+    },
+}
+
+DEFAULT_SCHEDULE = "@daily"
+START_DATE = pendulum.datetime(2025, 1, 1, tz="UTC")
+
+DEFAULT_ARGS = {
+    "retries": 2,
+    "retry_delay": timedelta(minutes=5),
+    "retry_exponential_backoff": True,
+}
+
+
+def shard(ids, size):
+    """Splits ids into consecutive lists of at most size ids."""
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def build_dag(source, schedule=DEFAULT_SCHEDULE, shard_size=None, raw_store_dir=RAW_STORE_DIR,
+              fetch_args=(), load_args=()):
+    """
+    Builds the DAG of one source in SOURCES. fetch_args are passed to every
+    fetch task (e.g. ["--incremental"]; the load follows the fetch's mode),
+    load_args to the load task (e.g. ["--metrics-textfile", path]).
+    """
+    config = SOURCES[source]
+    module = config["module"]
+    shard_size = shard_size or config["shard_size"]
+
+    @dag(
+        dag_id=f"{source}_connector", schedule=schedule, start_date=START_DATE, catchup=False,
+        max_active_runs=1, default_args=DEFAULT_ARGS, tags=["connectors", source],
+    )
+    def connector():
+        @task
+        def list_shards():
+            return shard(list(config["ids"]()), shard_size)
+
+        @task(pool=config["pool"])
+        def fetch(ids):
+            context = get_current_context()
+            run_name = f"{context['ts_nodash']}-shard{context['ti'].map_index:04d}"
+            return module.main([
+                "--fetch-only", "--run-part", "--raw-store", raw_store_dir, "--run-name", run_name,
+                config["shard_flag"], ",".join(ids), *fetch_args,
+            ])
+
+        @task
+        def load(manifests):
+            manifests = list(manifests)
+            if not manifests:
+                # An empty --replay would load whatever run came last
+                raise AirflowFailException(f"No {source} shards were fetched; nothing to load.")
+            context = get_current_context()
+            write_run_set(raw_store_dir, module.METRICS_SOURCE, manifests, name=context["ts_nodash"])
+            module.main(["--raw-store", raw_store_dir, "--replay", *manifests, *load_args])
+
+        load(fetch.expand(ids=list_shards()))
+
+    return connector()
+
+
+for _source in SOURCES:
+    globals()[f"{_source}_connector"] = build_dag(_source)
@@ -0,0 +1,101 @@
+"""
+Benchmark for BigQuery load serialization.
+
+Compares the NDJSON payload load_table_from_json builds in memory with the
+Parquet staging file written by parquet_sink, on synthetic rows for the GA
+SCHEMA and the detailed review schema. Reports wall time, throughput and
+upload size for each format.
+
+Run from the repository root:
+    python -m benchmarks.bq_serialization --rows 1000000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from bright_local_scaling import DETAILED_SCHEMA
+from ga import SCHEMA
+from parquet_sink import write_parquet
+
+
+def synthetic_ga_rows(count, properties=200, seed=1):
+    rng = random.Random(seed)
+    dates = [f"2025{1 + d // 28:02d}{1 + d % 28:02d}" for d in range(365)]
+    for i in range(count):
+        sessions = rng.randrange(5000)
+        yield {
+            "property_id": str(300000000 + i % properties),
+            "date": dates[(i // properties) % len(dates)],
+            "sessions": sessions,
+            "engaged_sessions": sessions * 2 // 3,
+            "event_count": sessions * 7,
+            "key_events": rng.randrange(50),
+        }
+
+
+def synthetic_review_rows(count, places=500, seed=1):
+    rng = random.Random(seed)
+    words = ["great", "service", "friendly", "staff", "slow", "clean", "price", "would", "recommend"]
+    for i in range(count):
+        yield {
+            "author": f"Reviewer {rng.randrange(100000)}",
+            "rating": float(rng.randint(1, 5)),
+            "date": f"2025-{1 + rng.randrange(12):02d}-{1 + rng.randrange(28):02d}",
+            "text": " ".join(rng.choice(words) for _ in range(rng.randrange(5, 60))),
+            "rid": f"ChZDSUhNMG9nS0VJQ0FnSUR{i:010d}",
+            "author_avatar": f"https://lh3.googleusercontent.com/a/{rng.getrandbits(64):016x}",
+            "place_id": f"ChIJ{i % places:08d}place",
+        }
+
+
+def ndjson_size(rows):
+    # Same encoding as Client.load_table_from_json
+    data_str = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+    return len(data_str.encode())
+
+
+def parquet_size(rows, schema, compression):
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        write_parquet(rows, schema, path, compression=compression)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def measure(fn, rows):
+    start = time.perf_counter()
+    size = fn(rows)
+    return size, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    datasets = (
+        ("ga", SCHEMA, synthetic_ga_rows),
+        ("reviews", DETAILED_SCHEMA, synthetic_review_rows),
+    )
+    formats = (
+        ("ndjson", lambda rows, schema: ndjson_size(rows)),
+        ("parquet-snappy", lambda rows, schema: parquet_size(rows, schema, "snappy")),
+        ("parquet-zstd", lambda rows, schema: parquet_size(rows, schema, "zstd")),
+    )
+
+    print(f"{'schema':<10}{'format':<16}{'seconds':>10}{'rows/s':>14}{'MiB':>10}{'bytes/row':>12}")
+    for name, schema, generate in datasets:
+        rows = list(generate(args.rows))
+        for fmt, fn in formats:
+            size, elapsed = measure(lambda r: fn(r, schema), rows)
+            print(f"{name:<10}{fmt:<16}{elapsed:>10.2f}{args.rows / elapsed:>14,.0f}"
+                  f"{size / 2**20:>10.1f}{size / args.rows:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
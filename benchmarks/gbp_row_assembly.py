@@ -0,0 +1,123 @@
+"""
+Benchmark for GBP daily metric row assembly.
+
+Compares the previous linear-scan lookup (one `next(r for r in all_rows ...)`
+per datedValue) with MetricRowBuilder on synthetic
+fetchMultiDailyMetricsTimeSeries responses.
+
+Run from the repository root:
+    python -m benchmarks.gbp_row_assembly --locations 1000 --days 480
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from gbp_metrics import MetricRowBuilder, format_date, parse_metric_value
+
+METRICS = [
+    'BUSINESS_IMPRESSIONS_DESKTOP_MAPS',
+    'BUSINESS_IMPRESSIONS_DESKTOP_SEARCH',
+    'BUSINESS_IMPRESSIONS_MOBILE_MAPS',
+    'BUSINESS_IMPRESSIONS_MOBILE_SEARCH',
+    'BUSINESS_CONVERSATIONS',
+    'BUSINESS_DIRECTION_REQUESTS',
+    'CALL_CLICKS',
+    'WEBSITE_CLICKS',
+    'BUSINESS_BOOKINGS',
+    'BUSINESS_FOOD_ORDERS',
+    'BUSINESS_FOOD_MENU_CLICKS',
+]
+
+
+def synthetic_response(days, start=date(2024, 1, 1)):
+    dated_values = []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        entry = {"date": {"year": d.year, "month": d.month, "day": d.day}}
+        if i % 7:
+            entry["value"] = str(i % 97)
+        dated_values.append(entry)
+    return [{
+        "dailyMetricTimeSeries": [
+            {"dailyMetric": m, "timeSeries": {"datedValues": dated_values}}
+            for m in METRICS
+        ]
+    }]
+
+
+def assemble_linear_scan(responses):
+    # Reference implementation of the old main() loop.
+    all_rows = []
+    for loc_id, data in responses:
+        for m in data[0].get("dailyMetricTimeSeries", []):
+            name = m.get("dailyMetric")
+            for entry in m.get("timeSeries", {}).get("datedValues", []):
+                date_str = format_date(entry["date"])
+                row = next(
+                    (r for r in all_rows
+                     if r["date"] == date_str and r["profile_id"] == loc_id),
+                    None
+                )
+                if not row:
+                    row = {"date": date_str, "profile_id": loc_id}
+                    all_rows.append(row)
+                row[name] = parse_metric_value(entry)
+    return all_rows
+
+
+def assemble_keyed(responses):
+    builder = MetricRowBuilder()
+    for loc_id, data in responses:
+        builder.add_location(loc_id, data)
+    return builder.rows()
+
+
+def time_it(fn, responses):
+    start = time.perf_counter()
+    rows = fn(responses)
+    return time.perf_counter() - start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=480)
+    parser.add_argument(
+        "--max-linear-locations", type=int, default=8,
+        help="Largest location count to run the quadratic reference at."
+    )
+    args = parser.parse_args()
+
+    response = synthetic_response(args.days)
+    values_per_location = len(METRICS) * args.days
+
+    print(f"{'impl':<12}{'locations':>10}{'rows':>10}{'seconds':>12}{'us/value':>12}")
+    sizes = []
+    n = 1
+    while n <= args.locations:
+        sizes.append(n)
+        n *= 2
+    if sizes[-1] != args.locations:
+        sizes.append(args.locations)
+
+    for impl, fn, limit in (
+        ("linear-scan", assemble_linear_scan, args.max_linear_locations),
+        ("keyed", assemble_keyed, args.locations),
+    ):
+        for n in sizes:
+            if n > limit:
+                break
+            responses = [(f"loc{i}", response) for i in range(n)]
+            elapsed, rows = time_it(fn, responses)
+            per_value = elapsed / (n * values_per_location) * 1e6
+            print(f"{impl:<12}{n:>10}{len(rows):>10}{elapsed:>12.3f}{per_value:>12.3f}")
+
+    # Both implementations must produce identical rows in identical order.
+    sample = [(f"loc{i}", response) for i in range(min(2, args.locations))]
+    assert assemble_linear_scan(sample) == assemble_keyed(sample)
+    print("Outputs match on sample; us/value should stay flat for 'keyed' "
+          "and grow with locations for 'linear-scan'.")
+
+
+if __name__ == "__main__":
+    main()
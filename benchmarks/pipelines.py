@@ -0,0 +1,278 @@
+"""
+Offline benchmark of the connector pipelines, stage by stage.
+
+Runs the fetch, transform and serialize code of the GBP, GA4, WhatConverts
+and BrightLocal connectors against local stand-ins (benchmarks.stand_ins)
+fed by the synthetic generator (benchmarks.synthetic), so no credentials
+or network access are needed. For every stage it reports items and
+items/s, per-request latency (p50 / p95) for fetch stages, and peak
+process RSS during the stage along with its growth over the stage.
+
+The HTTP stand-ins run in a child process; the GA4 stand-in client runs
+in-process. Generating the payloads is part of the measured fetch latency,
+so compare fetch figures between runs with the same knobs rather than
+against the live APIs. Connector progress output is hidden unless
+--verbose is set.
+
+Run from the repository root:
+    python -m benchmarks.pipelines --locations 500 --properties 100 --leads 500000 --places 1000
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from google.cloud import bigquery
+
+import bright_local_scaling
+import whatconvert
+from benchmarks.stand_ins import StandInAnalyticsClient, start_stand_in_process
+from benchmarks.synthetic import DEFAULT_DAYS, DEFAULT_START, place_ids
+from ga import SCHEMA as GA_SCHEMA, iter_rows_concurrent
+from ga_quota import QuotaScheduler
+from gbp_metrics import MetricRowBuilder, build_params, fetch_locations
+from http_client import make_session
+from instrumentation import current_rss
+from parquet_sink import write_parquet, write_parquet_partitions
+from rate_limit import print_rate_report
+from review_summary import add_reviews, empty_columns, summarize_reviews, summary_records
+
+PIPELINES = ("gbp", "ga", "whatconverts", "bright_local")
+# How often RSS is sampled while a stage runs
+RSS_SAMPLE_SECONDS = 0.005
+
+
+class Stage:
+    def __init__(self, pipeline, name):
+        self.pipeline = pipeline
+        self.name = name
+        self.items = 0
+        self.latencies = []
+        self.seconds = None
+        self.start_rss = None
+        self.peak_rss = None
+
+
+class StageRecorder:
+    """Times stages and samples RSS on a background thread while each one runs."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.stages = []
+
+    @contextlib.contextmanager
+    def measure(self, pipeline, name, session=None):
+        """
+        Context manager yielding a Stage; set stage.items inside it. With a
+        requests session, the latency of every response is recorded.
+        """
+        stage = Stage(pipeline, name)
+        stage.start_rss = stage.peak_rss = current_rss()
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(RSS_SAMPLE_SECONDS):
+                rss = current_rss()
+                if rss is not None:
+                    stage.peak_rss = max(stage.peak_rss, rss)
+
+        def record_latency(response, *args, **kwargs):
+            stage.latencies.append(response.elapsed.total_seconds())
+
+        if session is not None:
+            session.hooks["response"].append(record_latency)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        start = time.perf_counter()
+        try:
+            with output:
+                yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            stop.set()
+            sampler.join()
+            if session is not None:
+                session.hooks["response"].remove(record_latency)
+            self.stages.append(stage)
+            print_stage(stage)
+
+
+def print_header():
+    print(f"{'pipeline':<14}{'stage':<11}{'items':>10}{'seconds':>9}{'items/s':>12}"
+          f"{'requests':>10}{'p50 ms':>9}{'p95 ms':>9}{'peak MiB':>10}{'+MiB':>8}")
+
+
+def print_stage(stage):
+    rate = stage.items / stage.seconds if stage.seconds else 0
+    p50 = p95 = "-"
+    if stage.latencies:
+        p50 = f"{statistics.median(stage.latencies) * 1000:.1f}"
+        if len(stage.latencies) > 1:
+            p95 = f"{statistics.quantiles(stage.latencies, n=20)[18] * 1000:.1f}"
+    peak = growth = "-"
+    if stage.peak_rss is not None:
+        peak = f"{stage.peak_rss / 2**20:.1f}"
+        growth = f"{(stage.peak_rss - stage.start_rss) / 2**20:.1f}"
+    print(f"{stage.pipeline:<14}{stage.name:<11}{stage.items:>10}{stage.seconds:>9.2f}{rate:>12,.0f}"
+          f"{len(stage.latencies):>10}{p50:>9}{p95:>9}{peak:>10}{growth:>8}")
+
+
+# ---- Pipelines ----
+
+def run_gbp(args, base_url, recorder, staging_dir):
+    session = make_session(pool_size=args.workers)
+    params = build_params(DEFAULT_START, DEFAULT_START + timedelta(days=args.days - 1))
+    location_ids = [f"{i:010d}" for i in range(args.locations)]
+
+    with recorder.measure("gbp", "fetch", session) as stage:
+        responses = [
+            (loc_id, data)
+            for loc_id, data, error in fetch_locations(
+                session, f"{base_url}/gbp/v1", location_ids, params, max_in_flight=args.workers
+            )
+            if not error
+        ]
+        stage.items = len(responses)
+
+    with recorder.measure("gbp", "transform") as stage:
+        builder = MetricRowBuilder()
+        for loc_id, data in responses:
+            builder.add_location(loc_id, data)
+        rows = builder.rows()
+        stage.items = len(rows)
+
+    # Same schema gbp_overwrite.py loads
+    schema = [
+        bigquery.SchemaField("date", "DATE"),
+        bigquery.SchemaField("profile_id", "STRING"),
+    ] + [bigquery.SchemaField(m, "INTEGER", mode="NULLABLE") for m in sorted(builder.metric_names)]
+    with recorder.measure("gbp", "serialize") as stage:
+        stage.items = write_parquet(rows, schema, os.path.join(staging_dir, "gbp.parquet"))
+
+
+def run_ga(args, base_url, recorder, staging_dir):
+    client = StandInAnalyticsClient(args.latency_ms / 1000)
+    property_ids = [str(300000000 + i) for i in range(args.properties)]
+    date_ranges = [(DEFAULT_START.isoformat(), (DEFAULT_START + timedelta(days=args.days - 1)).isoformat())]
+
+    with recorder.measure("ga", "fetch") as stage:
+        client.latencies = stage.latencies
+        errors = {}
+        rows = list(iter_rows_concurrent(client, property_ids, date_ranges, QuotaScheduler(), errors))
+        stage.items = len(rows)
+
+    with recorder.measure("ga", "serialize") as stage:
+        write_parquet_partitions(rows, GA_SCHEMA, "date", staging_dir=os.path.join(staging_dir, "ga"))
+        stage.items = len(rows)
+
+
+def run_whatconverts(args, base_url, recorder, staging_dir):
+    session = whatconvert.make_session("benchmark", "benchmark", args.workers)
+    start = datetime.combine(DEFAULT_START, datetime.min.time())
+    end = start + timedelta(days=args.days, seconds=-1)
+    shards = whatconvert.build_shards(start, end, window_days=args.window_days)
+
+    with recorder.measure("whatconverts", "fetch", session) as stage:
+        leads = whatconvert.fetch_all_leads(session, f"{base_url}/whatconverts/leads", shards, args.workers)
+        stage.items = len(leads)
+
+    with recorder.measure("whatconverts", "transform") as stage:
+        whatconvert.aggregate_leads(whatconvert.project_leads(leads))
+        stage.items = len(leads)
+
+
+def run_bright_local(args, base_url, recorder, staging_dir):
+    # The connector's functions read these module settings on every call
+    bright_local_scaling.BATCH_URL = f"{base_url}/brightlocal/batch"
+    bright_local_scaling.FETCH_REVIEWS_URL = f"{base_url}/brightlocal/ld/fetch-reviews"
+    places = place_ids(args.places)
+    batch_size = bright_local_scaling.BATCH_SIZE
+
+    with recorder.measure("bright_local", "fetch", bright_local_scaling.SESSION) as stage:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            batch_ids = []
+            for i in range(0, len(places), batch_size):
+                batch_id, job_ids = bright_local_scaling.submit_batch("", places[i:i + batch_size], executor)
+                if batch_id and job_ids:
+                    batch_ids.append(batch_id)
+            # Stand-in jobs are complete as soon as their batch is committed, so one poll suffices
+            statuses = executor.map(lambda b: bright_local_scaling.get_batch_jobs("", b), batch_ids)
+            reviews = [
+                review
+                for jobs in statuses
+                for job in jobs or []
+                for review in bright_local_scaling.extract_job_reviews(job)
+            ]
+        stage.items = len(reviews)
+
+    with recorder.measure("bright_local", "transform") as stage:
+        columns = empty_columns()
+        add_reviews(columns, reviews)
+        summary = summary_records(summarize_reviews(columns, as_of=DEFAULT_START + timedelta(days=DEFAULT_DAYS)))
+        # The "timestamp" -> "date" mapping load_reviews_detailed_into_bigquery applies
+        detailed = [dict(review, date=review.get("timestamp")) for review in reviews]
+        stage.items = len(reviews)
+
+    with recorder.measure("bright_local", "serialize") as stage:
+        stage.items = write_parquet(detailed, bright_local_scaling.DETAILED_SCHEMA,
+                                    os.path.join(staging_dir, "reviews.parquet"))
+        write_parquet(summary, bright_local_scaling.SUMMARY_SCHEMA, os.path.join(staging_dir, "summary.parquet"))
+
+
+RUNNERS = {
+    "gbp": run_gbp,
+    "ga": run_ga,
+    "whatconverts": run_whatconverts,
+    "bright_local": run_bright_local,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pipelines", default=",".join(PIPELINES),
+                        help=f"Comma-separated pipelines to run, from: {', '.join(PIPELINES)}.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS,
+                        help=f"Days of GBP and GA data per location / property (at most {DEFAULT_DAYS}).")
+    parser.add_argument("--locations", type=int, default=200, help="GBP locations.")
+    parser.add_argument("--properties", type=int, default=50, help="GA4 properties.")
+    parser.add_argument("--leads", type=int, default=200000, help="WhatConverts leads over the date range.")
+    parser.add_argument("--accounts", type=int, default=50, help="WhatConverts accounts.")
+    parser.add_argument("--window-days", type=int, default=30, help="WhatConverts shard window.")
+    parser.add_argument("--places", type=int, default=500, help="BrightLocal places.")
+    parser.add_argument("--reviews-per-place", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency added to every stand-in response.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests per pipeline.")
+    parser.add_argument("--verbose", action="store_true", help="Show the connectors' own output.")
+    args = parser.parse_args()
+    args.days = min(args.days, DEFAULT_DAYS)
+
+    names = [name.strip() for name in args.pipelines.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown pipeline(s): {', '.join(unknown)}")
+
+    process, base_url = start_stand_in_process(
+        latency=args.latency_ms / 1000, leads=args.leads, accounts=args.accounts,
+        reviews_per_place=args.reviews_per_place,
+    )
+    recorder = StageRecorder(verbose=args.verbose)
+    try:
+        print(f"Stand-in APIs on {base_url}, {args.latency_ms:g} ms added latency.")
+        print_header()
+        with tempfile.TemporaryDirectory() as staging_dir:
+            for name in names:
+                RUNNERS[name](args, base_url, recorder, staging_dir)
+    finally:
+        process.terminate()
+    print_rate_report()
+
+
+if __name__ == "__main__":
+    main()
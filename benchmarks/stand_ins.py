@@ -0,0 +1,229 @@
+"""
+Local stand-ins for the source APIs, serving synthetic payloads.
+
+StandInServer answers the HTTP endpoints the connectors call, under one
+prefix per source:
+
+    /gbp/v1/locations/{id}:fetchMultiDailyMetricsTimeSeries
+    /whatconverts/leads
+    /brightlocal/batch, /brightlocal/ld/fetch-reviews
+
+BrightLocal jobs complete as soon as their batch is committed. The GA4
+Data API is gRPC, so StandInAnalyticsClient replaces the
+BetaAnalyticsDataClient in-process instead.
+
+To point a connector at the stand-ins by hand, run from the repository root:
+    python -m benchmarks.stand_ins --port 8000 --leads 100000
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import (
+    DEFAULT_DAYS,
+    DEFAULT_START,
+    LeadSpace,
+    brightlocal_job,
+    ga_rows,
+    gbp_response,
+)
+
+WHATCONVERTS_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs, so the connectors' pooled sessions reuse connections
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            query.update(parse_qs(self.rfile.read(length).decode()))
+        params = {key: values[-1] for key, values in query.items()}
+        time.sleep(self.server.latency)
+
+        if url.path.startswith("/gbp/") and url.path.endswith(":fetchMultiDailyMetricsTimeSeries"):
+            loc_id = url.path.rsplit("/", 1)[1].split(":")[0]
+            self._send(200, gbp_response(loc_id, _daily_range(params, "start_date"),
+                                         _daily_range(params, "end_date")))
+        elif url.path == "/whatconverts/leads":
+            self._send(200, self.server.leads.page(
+                datetime.strptime(params["start_date"], WHATCONVERTS_DATE_FORMAT),
+                datetime.strptime(params["end_date"], WHATCONVERTS_DATE_FORMAT),
+                params.get("account_id"),
+                int(params.get("page_number", 1)),
+                int(params.get("leads_per_page", 2500)),
+            ))
+        elif url.path == "/brightlocal/batch":
+            self._batch(method, params)
+        elif url.path == "/brightlocal/ld/fetch-reviews" and method == "POST":
+            place_id = parse_qs(urlparse(params["profile-url"]).query)["placeid"][0]
+            job_id = self.server.add_job(params["batch-id"], place_id)
+            self._send(201, {"success": True, "job-id": job_id})
+        else:
+            self._send(404, {"error": f"no stand-in for {method} {url.path}"})
+
+    def _batch(self, method, params):
+        if method == "POST":
+            self._send(201, {"success": True, "batch-id": self.server.add_batch()})
+        elif method == "PUT":
+            self._send(200, {"success": True})
+        else:
+            jobs = [
+                brightlocal_job(job_id, place_id, self.server.reviews_per_place)
+                for job_id, place_id in self.server.batch_jobs(params["batch-id"])
+            ]
+            self._send(200, {"success": True, "status": "Finished", "results": {"LdFetchReviews": jobs}})
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _daily_range(params, bound):
+    return date(int(params[f"dailyRange.{bound}.year"]),
+                int(params[f"dailyRange.{bound}.month"]),
+                int(params[f"dailyRange.{bound}.day"]))
+
+
+class StandInServer(ThreadingHTTPServer):
+    """HTTP stand-in for GBP, WhatConverts and BrightLocal; latency is added to every response."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, leads=100000, accounts=50, reviews_per_place=100):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.latency = latency
+        self.leads = LeadSpace(leads, accounts)
+        self.reviews_per_place = reviews_per_place
+        self._ids = itertools.count(1)
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_batch(self):
+        with self._lock:
+            batch_id = next(self._ids)
+            self._batches[str(batch_id)] = []
+            return batch_id
+
+    def add_job(self, batch_id, place_id):
+        with self._lock:
+            job_id = next(self._ids)
+            self._batches[str(batch_id)].append((job_id, place_id))
+            return job_id
+
+    def batch_jobs(self, batch_id):
+        with self._lock:
+            return list(self._batches.get(str(batch_id), []))
+
+
+def _serve(ready, **kwargs):
+    server = StandInServer(**kwargs)
+    ready.put(server.base_url)
+    server.serve_forever()
+
+
+def start_stand_in_process(**kwargs):
+    """
+    Starts a StandInServer in a child process, so serving the payloads takes
+    neither the GIL nor the memory of the process being measured. Returns
+    (process, base_url); terminate() the process when done.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ready,), kwargs=kwargs, daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+class StandInAnalyticsClient:
+    """
+    In-process stand-in for BetaAnalyticsDataClient's run_report and
+    batch_run_reports, answering with synthetic daily rows. Every call
+    sleeps `latency` seconds and records its duration in `latencies`.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.latencies = []
+
+    def run_report(self, request):
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        report = self._report(request)
+        self.latencies.append(time.perf_counter() - start)
+        return report
+
+    def batch_run_reports(self, request):
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        reports = [self._report(report_request) for report_request in request.requests]
+        self.latencies.append(time.perf_counter() - start)
+        return SimpleNamespace(reports=reports)
+
+    def _report(self, request):
+        prop = request.property.split("/")[-1]
+        date_range = request.date_ranges[0]
+        rows = ga_rows(prop, date.fromisoformat(date_range.start_date), date.fromisoformat(date_range.end_date))
+        page = rows[request.offset:request.offset + request.limit]
+        return SimpleNamespace(
+            rows=[
+                SimpleNamespace(
+                    dimension_values=[SimpleNamespace(value=row[0])],
+                    metric_values=[SimpleNamespace(value=str(value)) for value in row[1:]],
+                )
+                for row in page
+            ],
+            row_count=len(rows),
+            property_quota=None,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the synthetic source APIs locally.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--leads", type=int, default=100000)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--reviews-per-place", type=int, default=100)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.latency_ms / 1000, args.leads, args.accounts, args.reviews_per_place)
+    print(f"Serving stand-in APIs on {server.base_url} "
+          f"({DEFAULT_DAYS} days of data from {DEFAULT_START}); Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Synthetic API payloads for the offline benchmarks.
+
+Every payload is generated on demand and is deterministic: the same
+location, property, day or page always yields the same data, so the
+stand-in servers hold no state proportional to the dataset size and the
+scale knobs (locations, properties, leads, places, reviews per place) can
+be raised freely.
+"""
+import random
+import zlib
+from datetime import date, datetime, timedelta
+
+from gbp_metrics import DAILY_METRICS
+
+# First day of the synthetic data; every source covers DEFAULT_DAYS days from here
+DEFAULT_START = date(2025, 1, 1)
+DEFAULT_DAYS = 365
+
+LEAD_TYPES = ["Phone Call", "Web Form", "phone call", "Chat", "Email", "Text Message"]
+# Fields every synthetic lead shares; LeadSpace.lead() fills in the rest
+LEAD_TEMPLATE = {
+    "user_id": "0" * 32,
+    "lead_status": "Unique",
+    "quotable": "Not Set",
+    "quote_value": 0,
+    "sales_value": 0,
+    "spotted_keywords": None,
+    "lead_score": None,
+    "lead_state": "Completed",
+    "lead_source": "google",
+    "lead_medium": "cpc",
+    "lead_campaign": "Brand",
+    "lead_content": None,
+    "lead_keyword": "plumber near me",
+    "lead_url": "https://example.com/contact",
+    "landing_url": "https://example.com/",
+    "ip_address": "203.0.113.7",
+    "city": "Springfield",
+    "state": "IL",
+    "country": "US",
+    "additional_fields": {"Service": "Repair", "Budget": "500"},
+    "customer_journey": {"first_touch": {"source": "google"}},
+}
+REVIEW_WORDS = ["great", "service", "friendly", "staff", "slow", "clean", "price", "would", "recommend"]
+
+
+def mix(n):
+    """Cheap deterministic 32-bit hash of an integer (Knuth's multiplicative hash)."""
+    return (n * 2654435761) & 0xFFFFFFFF
+
+
+def iter_days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+# ---- GBP fetchMultiDailyMetricsTimeSeries ----
+
+def gbp_response(loc_id, start, end, metrics=DAILY_METRICS):
+    """Response body for one location and an inclusive date range; about one day in seven has no value."""
+    base = zlib.crc32(str(loc_id).encode())
+    days = list(iter_days(start, end))
+    series = []
+    for m, metric in enumerate(metrics):
+        dated_values = []
+        for day in days:
+            entry = {"date": {"year": day.year, "month": day.month, "day": day.day}}
+            h = mix(base + m * 100000 + day.toordinal())
+            if h % 7:
+                entry["value"] = str((h >> 3) % 500)
+            dated_values.append(entry)
+        series.append({"dailyMetric": metric, "timeSeries": {"datedValues": dated_values}})
+    return {"multiDailyMetricTimeSeries": [{"dailyMetricTimeSeries": series}]}
+
+
+# ---- GA4 run_report ----
+
+def ga_rows(prop, start, end):
+    """(date as YYYYMMDD, sessions, engaged sessions, events, key events) per day of an inclusive range."""
+    base = zlib.crc32(str(prop).encode())
+    rows = []
+    for day in iter_days(start, end):
+        h = mix(base + day.toordinal())
+        sessions = h % 5000
+        rows.append((f"{day:%Y%m%d}", sessions, sessions * 2 // 3, sessions * 7, (h >> 16) % 50))
+    return rows
+
+
+# ---- WhatConverts leads ----
+
+class LeadSpace:
+    """
+    `leads` leads spread evenly over `accounts` accounts and `days` days
+    from `start`. Leads are addressed by (day, account, n) cells, so a page
+    of any date window / account shard is generated without materializing
+    the others.
+    """
+
+    def __init__(self, leads, accounts=50, days=DEFAULT_DAYS, start=DEFAULT_START):
+        self.leads = leads
+        self.accounts = accounts
+        self.days = days
+        self.start = start
+
+    def cell_count(self, day_index, account_index):
+        cells = self.days * self.accounts
+        cell = day_index * self.accounts + account_index
+        return self.leads // cells + (1 if cell < self.leads % cells else 0)
+
+    def _cells(self, start, end, account_id):
+        first = max((start.date() - self.start).days, 0)
+        last = min((end.date() - self.start).days, self.days - 1)
+        accounts = range(self.accounts)
+        if account_id is not None:
+            index = int(account_id) - 1000
+            accounts = [index] if 0 <= index < self.accounts else []
+        for day_index in range(first, last + 1):
+            for account_index in accounts:
+                yield day_index, account_index, self.cell_count(day_index, account_index)
+
+    def page(self, start, end, account_id=None, page_number=1, per_page=2500):
+        """One page of the leads API response for a date window and an optional account."""
+        cells = list(self._cells(start, end, account_id))
+        total = sum(count for _, _, count in cells)
+        skip = (page_number - 1) * per_page
+        leads = []
+        for day_index, account_index, count in cells:
+            if skip >= count:
+                skip -= count
+                continue
+            for n in range(skip, count):
+                if len(leads) == per_page:
+                    break
+                leads.append(self.lead(day_index, account_index, n))
+            skip = 0
+            if len(leads) == per_page:
+                break
+        return {
+            "page_number": page_number,
+            "leads_per_page": per_page,
+            "total_pages": max(1, -(-total // per_page)),
+            "total_leads": total,
+            "leads": leads,
+        }
+
+    def lead(self, day_index, account_index, n):
+        lead_id = (day_index * self.accounts + account_index) * 100000 + n
+        h = mix(lead_id)
+        account_id = 1000 + account_index
+        account = f"Account {account_index}"
+        created = self.start + timedelta(days=day_index)
+        return dict(
+            LEAD_TEMPLATE,
+            account_id=account_id,
+            account=account,
+            profile_id=account_id * 10,
+            profile=f"{account} Website",
+            lead_id=lead_id,
+            lead_type=LEAD_TYPES[h % len(LEAD_TYPES)],
+            date_created=f"{created:%Y-%m-%d}T{(h >> 8) % 24:02d}:15:00Z",
+        )
+
+
+# ---- BrightLocal fetch-reviews ----
+
+def place_ids(count):
+    return [f"ChIJ{i:08d}place" for i in range(count)]
+
+
+def brightlocal_reviews(place_id, count, end=DEFAULT_START + timedelta(days=DEFAULT_DAYS - 1)):
+    """Reviews of one place as the LdFetchReviews results return them, newest first."""
+    rng = random.Random(f"reviews:{place_id}")
+    reviews = []
+    for n in range(count):
+        posted = datetime.combine(end, datetime.min.time()) - timedelta(
+            days=n * 3 + rng.randrange(3), seconds=rng.randrange(86400)
+        )
+        reviews.append({
+            "author": f"Reviewer {rng.randrange(100000)}",
+            "rating": rng.randint(1, 5),
+            "timestamp": f"{posted:%Y-%m-%d %H:%M:%S}",
+            "text": " ".join(rng.choice(REVIEW_WORDS) for _ in range(rng.randrange(5, 60))),
+            "rid": f"{place_id}-{n:08d}",
+            "author_avatar": f"https://lh3.googleusercontent.com/a/{rng.getrandbits(64):016x}",
+        })
+    return reviews
+
+
+def brightlocal_job(job_id, place_id, reviews_per_place):
+    """A completed LdFetchReviews job as it appears in the batch results."""
+    return {
+        "job-id": job_id,
+        "status": "Completed",
+        "payload": {"profile-url": f"https://search.google.com/local/writereview?placeid={place_id}"},
+        "results": [{"reviews": brightlocal_reviews(place_id, reviews_per_place)}],
+    }
@@ -0,0 +1,110 @@
+"""
+Benchmark for the WhatConverts lead aggregation.
+
+Compares the previous transform (DataFrame over the full raw lead dicts,
+lowercasing lead_type twice, object-dtype groupby) with
+project_leads() + aggregate_leads() on synthetic leads, reporting wall
+time, throughput and peak traced memory for each.
+
+Run from the repository root:
+    python -m benchmarks.whatconverts_aggregation --leads 1000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from whatconvert import aggregate_leads, project_leads
+
+LEAD_TYPES = ["Phone Call", "Web Form", "phone call", "Chat", "Email", "Text Message"]
+
+
+def synthetic_leads(count, accounts=50, days=90, seed=1):
+    rng = random.Random(seed)
+    dates = [f"2025-{1 + d // 28:02d}-{1 + d % 28:02d}" for d in range(days)]
+    account_names = [(1000 + a, f"Account {a}") for a in range(accounts)]
+    leads = []
+    for i in range(count):
+        account_id, account = rng.choice(account_names)
+        leads.append({
+            "account_id": account_id,
+            "account": account,
+            "profile_id": account_id * 10,
+            "profile": f"{account} Website",
+            "lead_id": i,
+            "user_id": "0" * 32,
+            "lead_type": rng.choice(LEAD_TYPES),
+            "lead_status": "Unique",
+            "date_created": f"{rng.choice(dates)}T{rng.randrange(24):02d}:15:00Z",
+            "quotable": "Not Set",
+            "quote_value": 0,
+            "sales_value": 0,
+            "spotted_keywords": None,
+            "lead_score": None,
+            "lead_state": "Completed",
+            "lead_source": "google",
+            "lead_medium": "cpc",
+            "lead_campaign": "Brand",
+            "lead_content": None,
+            "lead_keyword": "plumber near me",
+            "lead_url": "https://example.com/contact",
+            "landing_url": "https://example.com/",
+            "ip_address": "203.0.113.7",
+            "city": "Springfield",
+            "state": "IL",
+            "country": "US",
+            "additional_fields": {"Service": "Repair", "Budget": "500"},
+            "customer_journey": {"first_touch": {"source": "google"}},
+        })
+    return leads
+
+
+def aggregate_dataframe(leads):
+    # Reference implementation of the old main() transform.
+    df = pd.DataFrame(leads)
+    df['date'] = pd.to_datetime(df['date_created']).dt.date
+    df['phone_call'] = (df['lead_type'].str.lower() == 'phone call').astype(int)
+    df['web_form'] = (df['lead_type'].str.lower() == 'web form').astype(int)
+    return df.groupby(['date', 'account_id', 'account'], as_index=False)[['phone_call', 'web_form']].sum()
+
+
+def aggregate_lean(leads):
+    return aggregate_leads(project_leads(leads))
+
+
+def measure(fn, leads):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(leads)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--leads", type=int, default=1000000)
+    parser.add_argument("--accounts", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Generating {args.leads} synthetic leads...")
+    leads = synthetic_leads(args.leads, accounts=args.accounts)
+
+    print(f"{'impl':<12}{'seconds':>10}{'leads/s':>14}{'peak MiB':>12}")
+    results = {}
+    for impl, fn in (("dataframe", aggregate_dataframe), ("lean", aggregate_lean)):
+        result, elapsed, peak = measure(fn, leads)
+        results[impl] = result
+        print(f"{impl:<12}{elapsed:>10.2f}{args.leads / elapsed:>14,.0f}{peak / 2**20:>12.1f}")
+
+    expected = results["dataframe"].reset_index(drop=True)
+    actual = results["lean"].reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, actual)
+    print(f"Outputs match ({len(actual)} groups).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+# Legacy schema type names that differ from their GoogleSQL spelling
+SQL_TYPES = {"INTEGER": "INT64", "FLOAT": "FLOAT64", "BOOLEAN": "BOOL"}
+
+
+class TableSchemaError(Exception):
+    """Raised by ensure_table() when an existing table's column types don't match the schema."""
+
+
+def build_table(table_ref, schema, partition_field=None, clustering_fields=None,
+                partition_type=bigquery.TimePartitioningType.DAY):
+    """
+    Table definition partitioned on partition_field by partition_type (DAY,
+    or MONTH for data spanning more days than a job may write partitions)
+    and clustered on clustering_fields.
+    """
+    table = bigquery.Table(table_ref, schema=schema)
+    if partition_field:
+        table.time_partitioning = bigquery.TimePartitioning(type_=partition_type, field=partition_field)
+    if clustering_fields:
+        table.clustering_fields = list(clustering_fields)
+    return table
+
+
+def has_layout(table, partition_field=None, clustering_fields=None,
+               partition_type=bigquery.TimePartitioningType.DAY):
+    partitioning = table.time_partitioning
+    current_partition = (partitioning.field, partitioning.type_) if partitioning else None
+    return (current_partition == ((partition_field, partition_type) if partition_field else None)
+            and list(table.clustering_fields or []) == list(clustering_fields or []))
+
+
+def type_conflicts(table, schema):
+    """Columns of schema that the existing table has with another type."""
+    existing = {field.name: SQL_TYPES.get(field.field_type, field.field_type) for field in table.schema}
+    return [field.name for field in schema
+            if field.name in existing and existing[field.name] != SQL_TYPES.get(field.field_type, field.field_type)]
+
+
+@contextmanager
+def staging_table(client, table_ref):
+    """
+    Yields a reference to a staging table for one load into table_ref,
+    named table_staging_<random hex> so runs loading the same table at the
+    same time (a backfill and the daily run, mapped DAG loads) never share
+    staging rows. The table is dropped on exit, whether or not the load
+    succeeded.
+    """
+    dataset_ref = bigquery.DatasetReference(table_ref.project, table_ref.dataset_id)
+    staging_ref = dataset_ref.table(f"{table_ref.table_id}_staging_{uuid.uuid4().hex[:12]}")
+    try:
+        yield staging_ref
+    finally:
+        client.delete_table(staging_ref, not_found_ok=True)
+
+
+def partition_ref(table, day):
+    """Reference to one day partition of a table (the table$YYYYMMDD decorator)."""
+    dataset_ref = bigquery.DatasetReference(table.project, table.dataset_id)
+    return dataset_ref.table(f"{table.table_id}${day:%Y%m%d}")
+
+
+def ensure_table(client, table_ref, schema, partition_field=None, clustering_fields=None,
+                 migrate=False, casts=None, partition_type=bigquery.TimePartitioningType.DAY):
+    """
+    Returns the table, creating it partitioned and clustered if it does not
+    exist. An existing table with a different layout is left as it is
+    unless migrate is set, in which case it is rebuilt with migrate_table().
+    Loads can't write into columns of another type, so if any column's
+    type differs TableSchemaError is raised instead, unless migrate is set.
+    """
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        table = client.create_table(
+            build_table(table_ref, schema, partition_field, clustering_fields, partition_type)
+        )
+        print(f"Table {table_ref.table_id} created "
+              f"(partitioned by {partition_field} per {partition_type}, clustered by {clustering_fields}).")
+        return table
+
+    conflicts = type_conflicts(table, schema)
+    if has_layout(table, partition_field, clustering_fields, partition_type) and not conflicts:
+        print(f"Table {table_ref.table_id} already exists.")
+        return table
+    if not migrate:
+        if conflicts:
+            raise TableSchemaError(
+                f"Table {table_ref.table_id} has column(s) {conflicts} with another type than this "
+                f"connector loads; rerun with --migrate-tables to convert them."
+            )
+        print(f"Table {table_ref.table_id} exists but is not partitioned by {partition_field} "
+              f"per {partition_type} and clustered by {clustering_fields}; "
+              f"rerun with --migrate-tables to rebuild it.")
+        return table
+    return migrate_table(client, table, schema, partition_field, clustering_fields, casts, partition_type)
+
+
+def ensure_tables(client, tables, migrate=False):
+    """
+    Runs ensure_table() for several tables concurrently. Each table is a
+    dict of ensure_table() keyword arguments (table_ref, schema,
+    partition_field, ...). Returns the tables in the same order.
+    """
+    with ThreadPoolExecutor(max_workers=max(len(tables), 1)) as executor:
+        futures = [executor.submit(ensure_table, client, migrate=migrate, **table) for table in tables]
+        return [future.result() for future in futures]
+
+
+def migrate_table(client, table, schema, partition_field=None, clustering_fields=None, casts=None,
+                  partition_type=bigquery.TimePartitioningType.DAY):
+    """
+    Rebuilds an existing table with the given partitioning and clustering.
+
+    A new table is created with the full schema (keeping column modes), the
+    rows are copied over with INSERT ... SELECT, then the old table is
+    dropped and the new one renamed in its place. Columns whose type
+    changes are converted with casts[column], a SQL expression, or a plain
+    CAST; columns missing from the old table are filled with NULL, and
+    columns not in schema are kept as they are.
+    """
+    existing = {field.name: field.field_type for field in table.schema}
+    # Columns the caller doesn't know about are carried over unchanged
+    names = {field.name for field in schema}
+    schema = list(schema) + [field for field in table.schema if field.name not in names]
+    select = []
+    for field in schema:
+        sql_type = SQL_TYPES.get(field.field_type, field.field_type)
+        if field.name not in existing:
+            select.append(f"CAST(NULL AS {sql_type}) AS {field.name}")
+        elif existing[field.name] != field.field_type:
+            expression = (casts or {}).get(field.name, f"CAST({field.name} AS {sql_type})")
+            select.append(f"{expression} AS {field.name}")
+        else:
+            select.append(field.name)
+
+    dataset_ref = bigquery.DatasetReference(table.project, table.dataset_id)
+    new_ref = dataset_ref.table(f"{table.table_id}__migrating")
+    client.delete_table(new_ref, not_found_ok=True)
+    client.create_table(build_table(new_ref, schema, partition_field, clustering_fields, partition_type))
+
+    source = f"`{table.project}.{table.dataset_id}.{table.table_id}`"
+    target = f"`{new_ref.project}.{new_ref.dataset_id}.{new_ref.table_id}`"
+    columns = ", ".join(field.name for field in schema)
+    script = f"""
+        INSERT INTO {target} ({columns})
+        SELECT {", ".join(select)} FROM {source};
+        DROP TABLE {source};
+        ALTER TABLE {target} RENAME TO `{table.table_id}`;
+    """
+    client.query(script).result()  # Wait for the script to complete
+    print(f"Table {table.table_id} migrated "
+          f"(partitioned by {partition_field} per {partition_type}, clustered by {clustering_fields}).")
+    return client.get_table(table.reference)
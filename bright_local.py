@@ -1,9 +1,18 @@
+import argparse
 import time
-import requests
 import os
 from datetime import datetime
 from google.cloud import bigquery
 
+import instrumentation
+from bq_tables import ensure_tables, staging_table
+from http_client import make_session
+from change_manifest import ChangeManifest
+from incremental_reviews import PLACE_FINGERPRINT_FIELDS, ReviewIndex, keyed_reviews, merge_staged_reviews, review_key
+from load_jobs import LoadJobManager
+from polling import backoff_delays
+from review_summary import RATINGS, WINDOWS, add_reviews, empty_columns, summarize_reviews, summary_records
+
 # Set your Google Cloud credentials (if not already set in your environment)
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = ""
 
@@ -12,17 +21,55 @@ API_KEY = ''
 BASE_URL = 'https://tools.brightlocal.com/seo-tools/api/v4'
 BATCH_URL = f'{BASE_URL}/batch'
 FETCH_REVIEWS_URL = f'{BASE_URL}/ld/fetch-reviews'
+PROFILE_URL = ""
+
+# Review index for this profile; kept apart from bright_local_scaling.py's
+# index so both can run at the same time (see run_all.py)
+INDEX_FILE = "bright_local_review_index.json"
+# Fingerprint of the profile's reviews as last loaded by a full run
+MANIFEST_FILE = "bright_local_manifest.json"
+
+# Keep-alive session for all BrightLocal calls, with retries, backoff and timeouts
+SESSION = make_session(pool_size=1)
+
+# Source name of this connector's stages in the run metrics
+METRICS_SOURCE = "bright_local"
+
+# Batch status polling: first check after a few seconds, backing off to at most 2 minutes
+POLL_INITIAL_SECONDS = 5
+POLL_MAX_SECONDS = 120
 
 # BigQuery dataset and table names
 DATASET_ID = ''
 SUMMARY_TABLE = ''
 DETAILED_TABLE = ''
 
+SUMMARY_SCHEMA = [
+    bigquery.SchemaField("total_reviews", "INTEGER"),
+    bigquery.SchemaField("average_rating", "FLOAT"),
+    bigquery.SchemaField("rating_0", "INTEGER"),
+    bigquery.SchemaField("rating_1", "INTEGER"),
+    bigquery.SchemaField("rating_2", "INTEGER"),
+    bigquery.SchemaField("rating_3", "INTEGER"),
+    bigquery.SchemaField("rating_4", "INTEGER"),
+    bigquery.SchemaField("rating_5", "INTEGER"),
+    bigquery.SchemaField("batch_timestamp", "TIMESTAMP"),
+]
+
+DETAILED_SCHEMA = [
+    bigquery.SchemaField("author", "STRING"),
+    bigquery.SchemaField("rating", "FLOAT"),
+    bigquery.SchemaField("timestamp", "TIMESTAMP"),
+    bigquery.SchemaField("text", "STRING"),
+    bigquery.SchemaField("rid", "STRING"),
+    bigquery.SchemaField("author_avatar", "STRING"),
+]
+
 # ---- BrightLocal API Functions ----
 
 def create_batch(api_key):
     payload = {'api-key': api_key}
-    response = requests.post(BATCH_URL, data=payload)
+    response = SESSION.post(BATCH_URL, data=payload)
     if response.status_code == 201:
         data = response.json()
         if data.get('success'):
@@ -38,10 +85,10 @@ def fetch_reviews(api_key, batch_id):
     payload = {
         'batch-id': batch_id,
         'api-key': api_key,
-        "profile-url": "",
+        "profile-url": PROFILE_URL,
         "country": "USA"
     }
-    response = requests.post(FETCH_REVIEWS_URL, data=payload)
+    response = SESSION.post(FETCH_REVIEWS_URL, data=payload)
     if response.status_code == 201:
         data = response.json()
         if data.get('success'):
@@ -55,7 +102,7 @@ def fetch_reviews(api_key, batch_id):
 
 def commit_batch(api_key, batch_id):
     payload = {'batch-id': batch_id, 'api-key': api_key}
-    response = requests.put(BATCH_URL, data=payload)
+    response = SESSION.put(BATCH_URL, data=payload)
     if response.status_code == 200:
         data = response.json()
         if data.get('success'):
@@ -67,7 +114,7 @@ def commit_batch(api_key, batch_id):
 
 def check_batch_status(api_key, batch_id):
     payload = {'batch-id': batch_id, 'api-key': api_key}
-    response = requests.get(BATCH_URL, params=payload)
+    response = SESSION.get(BATCH_URL, params=payload)
     if response.status_code == 200:
         data = response.json()
         if data.get('success'):
@@ -86,36 +133,21 @@ def check_batch_status(api_key, batch_id):
                         print("No reviews found.")
                         return None
 
-                    # Calculate summary statistics
-                    total_reviews = len(reviews)
-                    sum_ratings = sum(review.get("rating", 0) for review in reviews if review.get("rating") is not None)
-                    avg_rating = sum_ratings / total_reviews if total_reviews > 0 else 0
-
-                    # Build count per rating (assuming ratings 1-5)
-                    reviews_by_rating = {}
-                    for review in reviews:
-                        rating = review.get("rating")
-                        if rating is not None:
-                            reviews_by_rating[rating] = reviews_by_rating.get(rating, 0) + 1
-                    print(reviews_by_rating)
-                    summary_data = {
-                        "total_reviews": total_reviews,
-                        "average_rating": avg_rating,
-                        "rating_0": reviews_by_rating.get(0, 0),
-                        "rating_1": reviews_by_rating.get(1, 0),
-                        "rating_2": reviews_by_rating.get(2, 0),
-                        "rating_3": reviews_by_rating.get(3, 0),
-                        "rating_4": reviews_by_rating.get(4, 0),
-                        "rating_5": reviews_by_rating.get(5, 0),
-                        "batch_timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-                    }
+                    # Calculate summary statistics in one vectorized pass
+                    columns = empty_columns()
+                    add_reviews(columns, reviews, place_id=PROFILE_URL)
+                    summary = summary_records(summarize_reviews(columns))[0]
+                    summary_data = {field.name: summary[field.name] for field in SUMMARY_SCHEMA}
 
                     print("Review Summary:")
                     print("-" * 50)
-                    print(f"Total Reviews: {total_reviews}")
-                    print(f"Average Rating: {avg_rating:.2f}")
-                    for rating in sorted(reviews_by_rating, reverse=True):
-                        print(f"  Rating {rating}: {reviews_by_rating[rating]} review(s)")
+                    print(f"Total Reviews: {summary['total_reviews']}")
+                    print(f"Average Rating: {summary['average_rating']:.2f}")
+                    for rating in reversed(RATINGS):
+                        if summary[f"rating_{rating}"]:
+                            print(f"  Rating {rating}: {summary[f'rating_{rating}']} review(s)")
+                    for window in WINDOWS:
+                        print(f"Last {window} days: {summary[f'reviews_last_{window}d']} review(s)")
                     print("-" * 50)
                     print("Batch processing completed.")
                     return reviews, summary_data
@@ -165,14 +197,14 @@ def clean_review_data(review):
 
     # Map review text, review id, and avatar URL to match the schema
     cleaned["text"] = review.get("text") or "No review text provided"
-    cleaned["rid"] = review.get("rid") or ""
+    cleaned["rid"] = review_key(review)
     cleaned["author_avatar"] = review.get("author_avatar") or ""
 
     return cleaned
 
 # ---- BigQuery Functions ----
 
-def create_dataset_and_tables(client, dataset_id):
+def create_dataset_and_tables(client, dataset_id, migrate=False):
     dataset_ref = client.dataset(dataset_id)
     try:
         client.get_dataset(dataset_ref)
@@ -183,104 +215,128 @@ def create_dataset_and_tables(client, dataset_id):
         client.create_dataset(dataset)
         print(f"Dataset {dataset_id} created.")
 
-    # Create reviews_summary table
-    summary_table_ref = dataset_ref.table(SUMMARY_TABLE)
-    try:
-        client.get_table(summary_table_ref)
-        print(f"Table {SUMMARY_TABLE} already exists in dataset {dataset_id}.")
-    except Exception:
-        summary_schema = [
-            bigquery.SchemaField("total_reviews", "INTEGER"),
-            bigquery.SchemaField("average_rating", "FLOAT"),
-            bigquery.SchemaField("rating_0", "INTEGER"),
-            bigquery.SchemaField("rating_1", "INTEGER"),
-            bigquery.SchemaField("rating_2", "INTEGER"),
-            bigquery.SchemaField("rating_3", "INTEGER"),
-            bigquery.SchemaField("rating_4", "INTEGER"),
-            bigquery.SchemaField("rating_5", "INTEGER"),
-            bigquery.SchemaField("batch_timestamp", "TIMESTAMP"),
-        ]
-        summary_table = bigquery.Table(summary_table_ref, schema=summary_schema)
-        client.create_table(summary_table)
-        print(f"Table {SUMMARY_TABLE} created in dataset {dataset_id}.")
-
-    # Create reviews_detailed table
-    detailed_table_ref = dataset_ref.table(DETAILED_TABLE)
-    try:
-        client.get_table(detailed_table_ref)
-        print(f"Table {DETAILED_TABLE} already exists in dataset {dataset_id}.")
-    except Exception:
-        detailed_schema = [
-            bigquery.SchemaField("author", "STRING"),
-            bigquery.SchemaField("rating", "FLOAT"),
-            bigquery.SchemaField("timestamp", "TIMESTAMP"),
-            bigquery.SchemaField("text", "STRING"),
-            bigquery.SchemaField("rid", "STRING"),
-            bigquery.SchemaField("author_avatar", "STRING"),
-        ]
-        detailed_table = bigquery.Table(detailed_table_ref, schema=detailed_schema)
-        client.create_table(detailed_table)
-        print(f"Table {DETAILED_TABLE} created in dataset {dataset_id}.")
-
-def load_reviews_summary_into_bigquery(client, summary_data, dataset_id, table_name):
-    table_ref = client.dataset(dataset_id).table(table_name)
-    job_config = bigquery.LoadJobConfig(
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+    # Create the reviews_summary table and the reviews_detailed table,
+    # partitioned by review month (review histories span more days than a
+    # job may write partitions) and clustered by rid (the merge key),
+    # checking both at once; returns the detailed table
+    _, detailed_table = ensure_tables(client, [
+        {"table_ref": dataset_ref.table(SUMMARY_TABLE), "schema": SUMMARY_SCHEMA},
+        {"table_ref": dataset_ref.table(DETAILED_TABLE), "schema": DETAILED_SCHEMA,
+         "partition_field": "timestamp", "clustering_fields": ["rid"],
+         "partition_type": bigquery.TimePartitioningType.MONTH},
+    ], migrate=migrate)
+    return detailed_table
+
+# The loaders below only submit their load job to the run's LoadJobManager;
+# loads.wait() reports and raises on errors once all of them are done.
+
+def load_reviews_summary_into_bigquery(loads, summary_data, dataset_id, table_name):
+    table_ref = loads.client.dataset(dataset_id).table(table_name)
+    loads.submit_rows(
+        [summary_data], table_ref, SUMMARY_SCHEMA, bigquery.WriteDisposition.WRITE_TRUNCATE
     )
-    load_job = client.load_table_from_json([summary_data], table_ref, job_config=job_config)
-    load_job.result()  # Waits for the job to complete
-    if load_job.errors:
-        print("Errors while inserting summary data:", load_job.errors)
-    else:
-        print("Summary data loaded successfully into BigQuery.")
 
-def load_reviews_detailed_into_bigquery(client, reviews, dataset_id, table_name):
-    table_ref = client.dataset(dataset_id).table(table_name)
-    cleaned_reviews = [clean_review_data(review) for review in reviews]
-    job_config = bigquery.LoadJobConfig(
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+def load_reviews_detailed_into_bigquery(loads, reviews, dataset_id, table_name):
+    table_ref = loads.client.dataset(dataset_id).table(table_name)
+    # Reviews are cleaned lazily as the Parquet staging file is written
+    cleaned_reviews = (clean_review_data(review) for review in reviews)
+    loads.submit_rows(
+        cleaned_reviews, table_ref, DETAILED_SCHEMA, bigquery.WriteDisposition.WRITE_TRUNCATE
     )
-    load_job = client.load_table_from_json(cleaned_reviews, table_ref, job_config=job_config)
-    load_job.result()  # Waits for the job to complete
-    if load_job.errors:
-        print("Errors while inserting detailed reviews:", load_job.errors)
-    else:
-        print("Detailed reviews loaded successfully into BigQuery.")
 
 
 # ---- Main Orchestration ----
 
-def main():
-    client = bigquery.Client()
+@instrumentation.exports_metrics
+def main(argv=None, bq_client=None):
+    parser = argparse.ArgumentParser(description="Load BrightLocal reviews into BigQuery.")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Load only new or edited detailed reviews (by rid) and MERGE them into the table."
+    )
+    parser.add_argument("--index-file", default=INDEX_FILE,
+                        help="Local index of loaded review ids and fingerprints.")
+    parser.add_argument(
+        "--migrate-tables", action="store_true",
+        help="Rebuild an existing unpartitioned detailed table as partitioned and clustered."
+    )
+    parser.add_argument("--manifest-file", default=MANIFEST_FILE,
+                        help="Local manifest of the fingerprint of the loaded reviews.")
+    parser.add_argument("--full-reload", action="store_true",
+                        help="Reload the detailed table even if the reviews did not change.")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
+    client = bq_client or bigquery.Client()
     
     # Create dataset and both tables if they don't exist
-    create_dataset_and_tables(client, DATASET_ID)
-
-    # Step 1: Create a new batch and get the batch ID from BrightLocal
-    batch_id = create_batch(API_KEY)
-    if not batch_id:
-        return
-
-    # Step 2: Fetch reviews using the BrightLocal API
-    job_id = fetch_reviews(API_KEY, batch_id)
-    if not job_id:
-        return
-
-    # Step 3: Commit the batch for processing
-    commit_batch(API_KEY, batch_id)
-
-    # Step 4: Poll for batch status until reviews are ready
-    result = None
-    while result is None:
-        time.sleep(60)  # Wait 60 seconds before checking again
-        result = check_batch_status(API_KEY, batch_id)
-    
-    # Unpack detailed reviews and summary data
-    reviews, summary_data = result
-
-    # Step 5: Load summary and detailed review data into BigQuery
-    load_reviews_summary_into_bigquery(client, summary_data, DATASET_ID, SUMMARY_TABLE)
-    load_reviews_detailed_into_bigquery(client, reviews, DATASET_ID, DETAILED_TABLE)
+    detailed_table = create_dataset_and_tables(client, DATASET_ID, migrate=args.migrate_tables)
+
+    # Steps 1-4 run against BrightLocal and count as fetch time
+    with instrumentation.stage("fetch", METRICS_SOURCE):
+        # Step 1: Create a new batch and get the batch ID from BrightLocal
+        batch_id = create_batch(API_KEY)
+        if not batch_id:
+            return
+
+        # Step 2: Fetch reviews using the BrightLocal API
+        job_id = fetch_reviews(API_KEY, batch_id)
+        if not job_id:
+            return
+
+        # Step 3: Commit the batch for processing
+        commit_batch(API_KEY, batch_id)
+
+        # Step 4: Poll for batch status until reviews are ready
+        result = None
+        delays = backoff_delays(POLL_INITIAL_SECONDS, POLL_MAX_SECONDS)
+        while result is None:
+            time.sleep(next(delays))  # Back off (with jitter) between checks
+            result = check_batch_status(API_KEY, batch_id)
+
+        # Unpack detailed reviews and summary data
+        reviews, summary_data = result
+        reviews = keyed_reviews(reviews)
+        instrumentation.record(rows=len(reviews))
+
+    # Step 5: Load summary and detailed review data into BigQuery; both load
+    # jobs are submitted first and run at the same time
+    # Incremental runs stage only new or edited reviews and merge them on rid
+    index = ReviewIndex(args.index_file, fresh=not args.incremental)
+    changed = index.changed(PROFILE_URL, reviews)
+    # Full runs skip the detailed load when the reviews are the ones last loaded
+    manifest = ChangeManifest(args.manifest_file, fresh=args.full_reload, table=detailed_table)
+    if args.incremental:
+        if changed:
+            manifest.forget(PROFILE_URL)
+        reload_detailed = False
+    else:
+        reload_detailed = manifest.changed(PROFILE_URL, reviews, PLACE_FINGERPRINT_FIELDS)
+    # Incremental runs stage the changed reviews in a table of their own,
+    # dropped once they are merged or the load failed
+    with staging_table(client, detailed_table) as staging_ref:
+        with LoadJobManager(client) as loads, instrumentation.stage("load", METRICS_SOURCE):
+            load_reviews_summary_into_bigquery(loads, summary_data, DATASET_ID, SUMMARY_TABLE)
+            if reload_detailed:
+                load_reviews_detailed_into_bigquery(loads, reviews, DATASET_ID, DETAILED_TABLE)
+            elif not args.incremental:
+                print("Reviews unchanged since the last load.")
+            elif changed:
+                load_reviews_detailed_into_bigquery(loads, changed, DATASET_ID, staging_ref.table_id)
+            else:
+                print("No new or edited reviews to load.")
+            loads.wait()
+
+        if args.incremental and changed:
+            with instrumentation.stage("load", METRICS_SOURCE):
+                merge_staged_reviews(
+                    client, DATASET_ID, staging_ref.table_id, DETAILED_TABLE,
+                    columns=[field.name for field in DETAILED_SCHEMA],
+                    key_columns=["rid"],
+                )
+    index.commit()
+    manifest.commit()
 
 if __name__ == '__main__':
     main()
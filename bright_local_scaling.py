@@ -1,10 +1,25 @@
+import argparse
+import json
 import time
-import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 from google.cloud import bigquery
 
+import instrumentation
+import raw_store
+from bq_tables import build_table, ensure_tables, staging_table
+from http_client import make_session
+from change_manifest import ChangeManifest
+from incremental_reviews import (
+    DEFAULT_INDEX_FILE, PLACE_FINGERPRINT_FIELDS, ReviewIndex, keyed_reviews, merge_staged_reviews
+)
+from load_jobs import LoadJobManager
+from polling import backoff_delays
+from rate_limit import print_rate_report
+from review_summary import add_reviews, empty_columns, summarize_reviews, summary_records
+
 # Set your Google Cloud credentials (if not already set in your environment)
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = ""
 
@@ -14,9 +29,61 @@ BASE_URL = 'https://tools.brightlocal.com/seo-tools/api/v4'
 BATCH_URL = f'{BASE_URL}/batch'
 FETCH_REVIEWS_URL = f'{BASE_URL}/ld/fetch-reviews'
 
+# Profiles per BrightLocal batch, and concurrent requests when submitting jobs / polling batches
+BATCH_SIZE = 100
+MAX_WORKERS = 8
+
+# Keep-alive session shared by all BrightLocal calls, one pooled connection per
+# worker, with retries, backoff and timeouts
+SESSION = make_session(pool_size=MAX_WORKERS)
+
+# Batch status polling: first check after a few seconds, backing off to at most 2 minutes
+POLL_INITIAL_SECONDS = 5
+POLL_MAX_SECONDS = 120
+# Job statuses after which a job will not change any more
+TERMINAL_STATUSES = ('Completed', 'Failed')
+# Jobs still unfinished this long after polling started are given up on
+POLL_TIMEOUT_SECONDS = 3 * 60 * 60
+
+# Source name of this connector's stages in the run metrics
+METRICS_SOURCE = "bright_local_scaling"
+
+# Fingerprints of each place's reviews as last loaded by a full run
+MANIFEST_FILE = "bright_local_place_manifest.json"
+
 # BigQuery dataset and table name
 DATASET_ID = ''
 DETAILED_TABLE = ''
+SUMMARY_TABLE = ''
+
+DETAILED_SCHEMA = [
+    bigquery.SchemaField("author", "STRING"),
+    bigquery.SchemaField("rating", "FLOAT"),
+    # The API provides a date (e.g., "2025-04-05"), stored as a DATE type.
+    bigquery.SchemaField("date", "DATE"),
+    bigquery.SchemaField("text", "STRING"),
+    bigquery.SchemaField("rid", "STRING"),
+    bigquery.SchemaField("author_avatar", "STRING"),
+    bigquery.SchemaField("place_id", "STRING")
+]
+
+# One row per place, rebuilt from all fetched reviews on every run
+SUMMARY_SCHEMA = [
+    bigquery.SchemaField("place_id", "STRING"),
+    bigquery.SchemaField("total_reviews", "INTEGER"),
+    bigquery.SchemaField("average_rating", "FLOAT"),
+    bigquery.SchemaField("rating_0", "INTEGER"),
+    bigquery.SchemaField("rating_1", "INTEGER"),
+    bigquery.SchemaField("rating_2", "INTEGER"),
+    bigquery.SchemaField("rating_3", "INTEGER"),
+    bigquery.SchemaField("rating_4", "INTEGER"),
+    bigquery.SchemaField("rating_5", "INTEGER"),
+    bigquery.SchemaField("reviews_last_30d", "INTEGER"),
+    bigquery.SchemaField("average_rating_last_30d", "FLOAT"),
+    bigquery.SchemaField("reviews_last_90d", "INTEGER"),
+    bigquery.SchemaField("average_rating_last_90d", "FLOAT"),
+    bigquery.SchemaField("batch_timestamp", "TIMESTAMP"),
+]
 
 # List of profile IDs (place IDs) to process
 profile_ids = [
@@ -26,7 +93,7 @@ profile_ids = [
 
 def create_batch(api_key):
     payload = {'api-key': api_key}
-    response = requests.post(BATCH_URL, data=payload)
+    response = SESSION.post(BATCH_URL, data=payload)
     if response.status_code == 201:
         data = response.json()
         if data.get('success'):
@@ -46,7 +113,8 @@ def fetch_reviews(api_key, batch_id, profile_id):
         "reviews-limit": "all",
         "country": "USA"
     }
-    response = requests.post(FETCH_REVIEWS_URL, data=payload)
+    with instrumentation.key(profile_id):
+        response = SESSION.post(FETCH_REVIEWS_URL, data=payload)
     if response.status_code == 201:
         data = response.json()
         if data.get('success'):
@@ -59,7 +127,7 @@ def fetch_reviews(api_key, batch_id, profile_id):
 
 def commit_batch(api_key, batch_id):
     payload = {'batch-id': batch_id, 'api-key': api_key}
-    response = requests.put(BATCH_URL, data=payload)
+    response = SESSION.put(BATCH_URL, data=payload)
     if response.status_code == 200:
         data = response.json()
         if data.get('success'):
@@ -69,70 +137,159 @@ def commit_batch(api_key, batch_id):
     else:
         print('Error committing batch:', response.status_code, response.text)
 
-def check_batch_status(api_key, batch_id):
+def get_batch_jobs(api_key, batch_id):
     """
-    Checks the batch status and makes sure every job is completed.
-    Only when all jobs are marked as "Completed", the function aggregates
-    all review records (each with an extra "place_id" column) and returns them.
+    Returns the LdFetchReviews jobs of the batch with their current status,
+    or None if the status could not be retrieved.
     """
     payload = {'batch-id': batch_id, 'api-key': api_key}
-    response = requests.get(BATCH_URL, params=payload)
+    with instrumentation.key(batch_id):
+        response = SESSION.get(BATCH_URL, params=payload)
     if response.status_code == 200:
         data = response.json()
         if not data.get('success'):
             print('Failed to retrieve batch status:', data)
             return None
-
         results = data.get('results', {})
-        ld_fetch_reviews = results.get('LdFetchReviews', [])
+        return results.get('LdFetchReviews', [])
+    else:
+        print('Error checking batch status:', response.status_code, response.text)
+        return None
 
-        # Check if the number of jobs matches the number of profile_ids
-        if len(ld_fetch_reviews) < len(profile_ids):
-            print("Not all jobs are present in batch status yet.")
-            return None
+def submit_batch(api_key, place_ids, executor, errors=None):
+    """
+    Creates a batch, submits a review job for each place id concurrently and
+    commits the batch straight away so BrightLocal starts on it while the
+    next batch is being filled. Returns (batch_id, {job id: place id});
+    places whose job could not be created are added to errors.
+    """
+    errors = {} if errors is None else errors
+    batch_id = create_batch(api_key)
+    if not batch_id:
+        errors.update((place_id, "batch not created") for place_id in place_ids)
+        return None, {}
 
-        # Ensure that all jobs are completed
-        incomplete_jobs = [job for job in ld_fetch_reviews if job.get('status') != 'Completed']
-        if incomplete_jobs:
-            pending = {job.get("job-id"): job.get("status") for job in incomplete_jobs}
-            print("Waiting for all jobs to complete. Pending jobs:", pending)
-            return None
+    jobs = {}
+    submitted = executor.map(
+        instrumentation.propagate(lambda place_id: fetch_reviews(api_key, batch_id, place_id)), place_ids
+    )
+    for place_id, job_id in zip(place_ids, submitted):
+        if job_id:
+            print(f"Job {job_id} created for place id {place_id}")
+            jobs[str(job_id)] = place_id
+        else:
+            print(f"Job not created for place id {place_id}")
+            errors[place_id] = "job not created"
 
-        # If all jobs are complete, aggregate reviews
-        all_reviews = []  # List to accumulate reviews from all jobs
-        for job in ld_fetch_reviews:
-            # Extract place_id from the payload's "profile-url"
-            payload_job = job.get('payload', {})
-            profile_url = payload_job.get("profile-url", "")
-            parsed_url = urlparse(profile_url)
-            qs = parse_qs(parsed_url.query)
-            place_id = qs.get("placeid", ["Unknown"])[0]
-
-            # Extract reviews from job result
-            results_container = job.get("results", [])
-            if not results_container:
-                print(f"No results container found for place id {place_id}.")
-                continue
-            reviews_block = results_container[0]
-            reviews = reviews_block.get("reviews", [])
-            if not reviews:
-                print(f"No reviews found for place id {place_id}.")
-                continue
-
-            # Tag each review with the corresponding place_id
-            for review in reviews:
-                review["place_id"] = place_id
-            all_reviews.extend(reviews)
-
-        return all_reviews
+    commit_batch(api_key, batch_id)
+    return batch_id, jobs
 
-    else:
-        print('Error checking batch status:', response.status_code, response.text)
-        return None
+def submit_batches(api_key, place_ids, executor, errors):
+    """Submits the place ids in batches of BATCH_SIZE; returns {batch_id: {job id: place id}}."""
+    batches = {}
+    with instrumentation.stage("fetch", METRICS_SOURCE):
+        for i in range(0, len(place_ids), BATCH_SIZE):
+            batch_id, jobs = submit_batch(api_key, place_ids[i:i + BATCH_SIZE], executor, errors)
+            if batch_id and jobs:
+                batches[batch_id] = jobs
+    total_jobs = sum(len(jobs) for jobs in batches.values())
+    print(f"Submitted {total_jobs} jobs in {len(batches)} batch(es).")
+    return batches
+
+def poll_batches(api_key, batches, executor, errors, timeout=POLL_TIMEOUT_SECONDS):
+    """
+    Polls all batches ({batch_id: {job id: place id}}) in parallel with
+    backoff until every job has finished, yielding the jobs completed in
+    each round as soon as they are, so they can be processed while polling
+    continues. Places whose job failed, or hadn't finished after timeout
+    seconds, are added to errors.
+    """
+    total_jobs = sum(len(jobs) for jobs in batches.values())
+    finished_jobs = {batch_id: set() for batch_id in batches}
+    deadline = time.monotonic() + timeout
+    delays = backoff_delays(POLL_INITIAL_SECONDS, POLL_MAX_SECONDS)
+    while True:
+        open_batches = [b for b in batches if len(finished_jobs[b]) < len(batches[b])]
+        if not open_batches:
+            return
+        if time.monotonic() > deadline:
+            for batch_id in open_batches:
+                for job_id, place_id in batches[batch_id].items():
+                    if job_id not in finished_jobs[batch_id]:
+                        errors[place_id] = f"job {job_id} timed out"
+            print(f"Gave up on {total_jobs - sum(len(jobs) for jobs in finished_jobs.values())} "
+                  f"job(s) unfinished after {timeout}s.")
+            return
+
+        # Waiting on BrightLocal counts as fetch time
+        with instrumentation.stage("fetch", METRICS_SOURCE):
+            time.sleep(next(delays))
+            statuses = list(executor.map(
+                instrumentation.propagate(lambda b: get_batch_jobs(api_key, b)), open_batches
+            ))
+
+        completed = []
+        pending = 0
+        newly_finished = 0
+        for batch_id, jobs in zip(open_batches, statuses):
+            for job in jobs or []:
+                job_id = str(job.get('job-id'))
+                status = job.get('status')
+                if status not in TERMINAL_STATUSES:
+                    pending += 1
+                    continue
+                if job_id in finished_jobs[batch_id]:
+                    continue
+                finished_jobs[batch_id].add(job_id)
+                newly_finished += 1
+                if status == 'Completed':
+                    completed.append(job)
+                else:
+                    print(f"Job {job_id} finished with status {status}")
+                    errors[batches[batch_id].get(job_id, job_place_id(job))] = f"job {job_id} {status}"
+
+        done = sum(len(jobs) for jobs in finished_jobs.values())
+        print(f"{done}/{total_jobs} jobs finished; {pending} pending.")
+        if newly_finished:
+            # Jobs are completing; check again soon
+            delays = backoff_delays(POLL_INITIAL_SECONDS, POLL_MAX_SECONDS)
+        yield completed
+
+def job_place_id(job):
+    """Extracts the place_id from a job payload's "profile-url"."""
+    payload_job = job.get('payload', {})
+    profile_url = payload_job.get("profile-url", "")
+    parsed_url = urlparse(profile_url)
+    qs = parse_qs(parsed_url.query)
+    return qs.get("placeid", ["Unknown"])[0]
+
+def extract_job_reviews(job):
+    """
+    Returns the review records of a completed job, each tagged with an
+    extra "place_id" column taken from the job's "profile-url" and keyed
+    (see keyed_reviews) so a place never has two reviews with one rid.
+    """
+    place_id = job_place_id(job)
+
+    # Extract reviews from job result
+    results_container = job.get("results", [])
+    if not results_container:
+        print(f"No results container found for place id {place_id}.")
+        return []
+    reviews_block = results_container[0]
+    reviews = reviews_block.get("reviews", [])
+    if not reviews:
+        print(f"No reviews found for place id {place_id}.")
+        return []
+
+    # Tag each review with the corresponding place_id
+    for review in reviews:
+        review["place_id"] = place_id
+    return keyed_reviews(reviews)
 
 # ---- BigQuery Functions ----
 
-def create_dataset_and_table(client, dataset_id):
+def create_dataset_and_table(client, dataset_id, migrate=False):
     dataset_ref = client.dataset(dataset_id)
     try:
         client.get_dataset(dataset_ref)
@@ -143,29 +300,26 @@ def create_dataset_and_table(client, dataset_id):
         client.create_dataset(dataset)
         print(f"Dataset {dataset_id} created.")
 
-    # Create the reviews_detailed table with the expected column data types.
+    # Create the reviews_detailed table with the expected column data types,
+    # partitioned by review month (review histories span more days than a
+    # job may write partitions) and clustered by place and review id, and
+    # the summary table, checking both at once.
     # The "timestamp" column is now defined as "date".
-    detailed_table_ref = dataset_ref.table(DETAILED_TABLE)
-    try:
-        client.get_table(detailed_table_ref)
-        print(f"Table {DETAILED_TABLE} already exists in dataset {dataset_id}.")
-    except Exception:
-        detailed_schema = [
-            bigquery.SchemaField("author", "STRING"),
-            bigquery.SchemaField("rating", "FLOAT"),
-            # The API provides a date (e.g., "2025-04-05"), stored as a DATE type.
-            bigquery.SchemaField("date", "DATE"),
-            bigquery.SchemaField("text", "STRING"),
-            bigquery.SchemaField("rid", "STRING"),
-            bigquery.SchemaField("author_avatar", "STRING"),
-            bigquery.SchemaField("place_id", "STRING")
-        ]
-        detailed_table = bigquery.Table(detailed_table_ref, schema=detailed_schema)
-        client.create_table(detailed_table)
-        print(f"Table {DETAILED_TABLE} created in dataset {dataset_id}.")
-
-def load_reviews_detailed_into_bigquery(client, reviews, dataset_id, table_name):
-    table_ref = client.dataset(dataset_id).table(table_name)
+    detailed_table, _ = ensure_tables(client, [
+        {"table_ref": dataset_ref.table(DETAILED_TABLE), "schema": DETAILED_SCHEMA,
+         "partition_field": "date", "clustering_fields": ["place_id", "rid"],
+         "partition_type": bigquery.TimePartitioningType.MONTH},
+        {"table_ref": dataset_ref.table(SUMMARY_TABLE), "schema": SUMMARY_SCHEMA,
+         "clustering_fields": ["place_id"]},
+    ], migrate=migrate)
+    return detailed_table
+
+# The loaders below only submit their load job to the run's LoadJobManager;
+# loads.wait() reports and raises on errors once all of them are done.
+
+def load_reviews_detailed_into_bigquery(loads, reviews, dataset_id, table_name,
+                                       write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE):
+    table_ref = loads.client.dataset(dataset_id).table(table_name)
     
     # Map the "timestamp" field from the API response to "date"
     mapped_reviews = []
@@ -175,49 +329,197 @@ def load_reviews_detailed_into_bigquery(client, reviews, dataset_id, table_name)
             del review["timestamp"]
         mapped_reviews.append(review)
     
-    # Since the API response is in the desired format, load the mapped reviews directly into BigQuery.
-    job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
-    load_job = client.load_table_from_json(mapped_reviews, table_ref, job_config=job_config)
-    load_job.result()  # Wait for the job to complete
-    if load_job.errors:
-        print("Errors while inserting detailed reviews:", load_job.errors)
-    else:
-        print("Detailed reviews loaded successfully into BigQuery.")
+    # Since the API response is in the desired format, stage the mapped reviews as Parquet and load them.
+    loads.submit_rows(mapped_reviews, table_ref, DETAILED_SCHEMA, write_disposition)
+
+def publish_staged_reviews(client, dataset_id, staging_table, table_name):
+    """
+    Replaces the detailed table with the staged reviews in a single copy job,
+    so readers never see a partially loaded table.
+    """
+    dataset_ref = client.dataset(dataset_id)
+    job_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    copy_job = client.copy_table(
+        dataset_ref.table(staging_table), dataset_ref.table(table_name), job_config=job_config
+    )
+    copy_job.result()  # Wait for the job to complete
+    print(f"Published staged reviews to {table_name}.")
+
+def load_summary_into_bigquery(loads, summary_rows, dataset_id, table_name):
+    table_ref = loads.client.dataset(dataset_id).table(table_name)
+    loads.submit_rows(summary_rows, table_ref, SUMMARY_SCHEMA, bigquery.WriteDisposition.WRITE_TRUNCATE)
 
 # ---- Main Orchestration ----
 
-def main():
-    client = bigquery.Client()
+@instrumentation.exports_metrics
+def main(argv=None, bq_client=None):
+    parser = argparse.ArgumentParser(description="Load BrightLocal reviews into BigQuery.")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Load only new or edited reviews (by rid) and MERGE them into the table."
+    )
+    parser.add_argument("--index-file", default=DEFAULT_INDEX_FILE,
+                        help="Local index of loaded review ids and fingerprints.")
+    parser.add_argument(
+        "--migrate-tables", action="store_true",
+        help="Rebuild existing unpartitioned tables as partitioned and clustered."
+    )
+    parser.add_argument("--manifest-file", default=MANIFEST_FILE,
+                        help="Local manifest of the fingerprints of each place's loaded reviews.")
+    parser.add_argument(
+        "--full-reload", action="store_true",
+        help="Replace the whole detailed table even where nothing changed, e.g. after removing profiles."
+    )
+    parser.add_argument("--places", type=lambda value: value.split(","), default=profile_ids,
+                        help="Comma-separated place ids to fetch instead of profile_ids.")
+    instrumentation.add_arguments(parser)
+    raw_store.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
+    # Completed jobs are saved as they arrive; a replay reloads a saved run
+    # the way it was loaded the first time, without calling BrightLocal
+    replay = raw_store.open_replay(args, METRICS_SOURCE)
+    if replay is not None:
+        args.incremental = replay.info.get("incremental", False)
+    store = raw_store.open_run(args, METRICS_SOURCE)
+
+    # Places whose job could not be created, failed or timed out
+    errors = dict(replay.errors) if replay is not None else {}
+
+    if args.fetch_only:
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        batches = submit_batches(API_KEY, args.places, executor, errors)
+        for jobs in poll_batches(API_KEY, batches, executor, errors):
+            for job in jobs:
+                store.put(job_place_id(job), json.dumps(job), job_id=str(job.get('job-id')))
+        executor.shutdown()
+        store.finish(errors, incremental=args.incremental)
+        print_rate_report()
+        if errors:
+            print(f"{len(errors)} place(s) failed: {sorted(errors)}")
+        return store.path
+
+    client = bq_client or bigquery.Client()
+    index = ReviewIndex(args.index_file, fresh=not args.incremental)
     
     # Create dataset and detailed reviews table if they do not exist
-    create_dataset_and_table(client, DATASET_ID)
+    detailed_table = create_dataset_and_table(client, DATASET_ID, migrate=args.migrate_tables)
 
-    # Step 1: Create a new batch
-    batch_id = create_batch(API_KEY)
-    if not batch_id:
-        return
+    # Once a full run has been loaded, full runs only replace the places
+    # whose reviews changed since; the others cost no load
+    manifest = ChangeManifest(args.manifest_file, fresh=args.full_reload, table=detailed_table)
+    replace_places = not args.incremental and len(manifest) > 0
+    changed_places = set()
 
-    # Step 2: Submit a review job for each profile ID
-    for place_id in profile_ids:
-        job_id = fetch_reviews(API_KEY, batch_id, place_id)
-        if job_id:
-            print(f"Job {job_id} created for place id {place_id}")
-        else:
-            print(f"Job not created for place id {place_id}")
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
-    # Step 3: Commit the batch for processing
-    commit_batch(API_KEY, batch_id)
+    # Steps 1-3: Split the profiles into batches of BATCH_SIZE; each batch is
+    # created, filled with concurrently submitted jobs and committed at once
+    if replay is not None:
+        # The saved jobs stand in for one already finished polling round
+        rounds = [[json.loads(body) for _, _, body in replay]]
+    else:
+        batches = submit_batches(API_KEY, args.places, executor, errors)
+        rounds = poll_batches(API_KEY, batches, executor, errors)
 
-    # Step 4: Poll until all jobs are completed
-    all_reviews = None
-    while all_reviews is None:
-        time.sleep(60)  # Wait 60 seconds before checking again
-        all_reviews = check_batch_status(API_KEY, batch_id)
-        if all_reviews is None:
-            print("Waiting for all jobs to complete...")
+    # Step 4: Poll all batches in parallel with backoff, loading each job's
+    # reviews into a staging table as soon as it completes instead of
+    # waiting for the slowest one. Staging loads run in the background
+    # while polling continues and are awaited together at the end.
+    # Staged in a table of this run's own, dropped once it is published or
+    # merged, or the run failed
+    with staging_table(client, detailed_table) as staging_ref:
+        # The staging table gets the detailed table's layout so the copy job can replace it
+        partitioning = detailed_table.time_partitioning
+        client.create_table(build_table(
+            staging_ref, DETAILED_SCHEMA,
+            partition_field=partitioning.field if partitioning else None,
+            clustering_fields=detailed_table.clustering_fields,
+            partition_type=partitioning.type_ if partitioning else bigquery.TimePartitioningType.MONTH,
+        ))
+        loads = LoadJobManager(client)
+        staged_any = False
+        # Rating and date of every fetched review, summarized per place at the end
+        summary_columns = empty_columns()
+        for jobs in rounds:
+            reviews = []
+            with instrumentation.stage("transform", METRICS_SOURCE):
+                for job in jobs:
+                    if store is not None:
+                        store.put(job_place_id(job), json.dumps(job), job_id=str(job.get('job-id')))
+                    job_reviews = extract_job_reviews(job)
+                    if job_reviews:
+                        add_reviews(summary_columns, job_reviews)
+                        # Only stage reviews the index hasn't seen in this form
+                        place_id = job_reviews[0]["place_id"]
+                        instrumentation.record(rows=len(job_reviews), key=place_id)
+                        changed = index.changed(place_id, job_reviews)
+                        if args.incremental:
+                            reviews.extend(changed)
+                            if changed:
+                                manifest.forget(place_id)
+                        elif manifest.changed(place_id, job_reviews, PLACE_FINGERPRINT_FIELDS):
+                            reviews.extend(job_reviews)
+                            changed_places.add(place_id)
 
-    # Step 5: All jobs are completed, load the detailed reviews into BigQuery
-    load_reviews_detailed_into_bigquery(client, all_reviews, DATASET_ID, DETAILED_TABLE)
+            if reviews:
+                # The staging table starts empty, so every round appends
+                with instrumentation.stage("load", METRICS_SOURCE):
+                    load_reviews_detailed_into_bigquery(
+                        loads, reviews, DATASET_ID, staging_ref.table_id,
+                        write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+                    )
+                staged_any = True
+        executor.shutdown()
+        if store is not None:
+            store.finish(errors, incremental=args.incremental)
+        print_rate_report()
+        if errors:
+            print(f"{len(errors)} place(s) failed: {sorted(errors)}")
+            # Swapping in the staged reviews would drop the failed places' reviews,
+            # so only the places fetched are replaced
+            replace_places = not args.incremental
+
+        # Every place's reviews were fetched in full, so the summary covers
+        # unchanged reviews as well and replaces the table on each run
+        with instrumentation.stage("transform", METRICS_SOURCE):
+            summary = summarize_reviews(summary_columns)
+        with instrumentation.stage("load", METRICS_SOURCE):
+            if len(summary):
+                load_summary_into_bigquery(loads, summary_records(summary), DATASET_ID, SUMMARY_TABLE)
+            # Nothing is merged or published unless every load succeeded
+            loads.wait()
+            loads.shutdown()
+
+        # Step 5: All jobs are finished. Incremental runs merge the staged new and
+        # edited reviews on (place_id, rid); full runs replace the changed places'
+        # reviews, or swap the staged reviews in on the first (or a --full-reload) run.
+        if replace_places:
+            print(f"{len(changed_places)} place(s) new or changed since the last load.")
+        if not staged_any:
+            if args.incremental:
+                print("No new or edited reviews to load.")
+            else:
+                print("No changed reviews to load." if replace_places else "No reviews to load.")
+            return
+        if args.incremental:
+            merge_staged_reviews(
+                client, DATASET_ID, staging_ref.table_id, DETAILED_TABLE,
+                columns=[field.name for field in DETAILED_SCHEMA],
+                key_columns=["place_id", "rid"],
+            )
+        elif replace_places:
+            merge_staged_reviews(
+                client, DATASET_ID, staging_ref.table_id, DETAILED_TABLE,
+                columns=[field.name for field in DETAILED_SCHEMA],
+                key_columns=["place_id", "rid"],
+                scope=("place_id", changed_places),
+            )
+        else:
+            publish_staged_reviews(client, DATASET_ID, staging_ref.table_id, DETAILED_TABLE)
+    index.commit()
+    manifest.commit()
 
 if __name__ == '__main__':
     main()
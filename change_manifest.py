@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+
+def rows_fingerprint(rows, fields=None):
+    """
+    Fingerprint of a slice of normalized rows: the same rows give the same
+    fingerprint whatever order they come in. With fields, only those
+    columns count.
+    """
+    if fields is not None:
+        rows = ({field: row.get(field) for field in fields} for row in rows)
+    encoded = sorted(json.dumps(row, sort_keys=True, default=str) for row in rows)
+    digest = hashlib.sha1()
+    for line in encoded:
+        digest.update(line.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _created(table):
+    """When table was created, as stored in a manifest, or None without a table."""
+    if table is None or table.created is None:
+        return None
+    return table.created.isoformat()
+
+
+def group_rows(rows, slice_key):
+    """Groups rows into {slice: [row, ...]} by slice_key(row), keeping first-seen order."""
+    slices = {}
+    for row in rows:
+        slices.setdefault(slice_key(row), []).append(row)
+    return slices
+
+
+class ChangeManifest:
+    """
+    Local manifest of the fingerprint each slice of a table (a location's
+    month, a place...) was last loaded with, as {slice: fingerprint}.
+
+    changed() tells whether a slice differs from the last committed run, so
+    unchanged slices can skip their load; like ReviewIndex, the new
+    fingerprints are only written by commit(), once the load succeeded.
+    A missing manifest means every slice is new; fresh=True ignores the
+    existing file, for runs that replace the whole table.
+
+    table is the BigQuery table the slices are loaded into. The manifest
+    records when that table was created and is ignored if the table has
+    been created since (dropped and recreated, migrated) or is empty, as
+    none of the slices it lists are in the table any more.
+    """
+
+    def __init__(self, path, fresh=False, table=None):
+        self.path = path
+        self.slices = {}
+        self._pending = {}
+        self.table_created = _created(table)
+        if not fresh and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if "slices" not in data:
+                data = {"table_created": None, "slices": data}  # Written before tables were recorded
+            if table is None or (table.num_rows and data["table_created"] == self.table_created):
+                self.slices = data["slices"]
+            elif data["slices"]:
+                print(f"Table {table.table_id} was recreated or is empty; ignoring {path}.")
+
+    def __len__(self):
+        return len(self.slices)
+
+    def changed(self, slice_key, rows, fields=None):
+        fingerprint = rows_fingerprint(rows, fields)
+        if self.slices.get(str(slice_key)) == fingerprint:
+            return False
+        self._pending[str(slice_key)] = fingerprint
+        return True
+
+    def forget(self, slice_key):
+        """Drops a slice loaded some other way (e.g. merged incrementally), so it is reloaded next time."""
+        self._pending[str(slice_key)] = None
+
+    def commit(self):
+        for slice_key, fingerprint in self._pending.items():
+            if fingerprint is None:
+                self.slices.pop(slice_key, None)
+            else:
+                self.slices[slice_key] = fingerprint
+        self._pending = {}
+        # Write to a temp file and rename so a crash never leaves a truncated manifest.
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"table_created": self.table_created, "slices": self.slices}, f)
+        os.replace(tmp_path, self.path)
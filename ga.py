@@ -1,14 +1,31 @@
+import argparse
+import json
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import (
+    BatchRunReportsRequest,
     DateRange,
     Dimension,
     Metric,
     RunReportRequest,
+    RunReportResponse,
 )
+from google.api_core.exceptions import ResourceExhausted
 from google.cloud import bigquery
-from google.cloud.bigquery import LoadJobConfig
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+import instrumentation
+import raw_store
+from bq_tables import build_table, ensure_table as ensure_bq_table, staging_table
+from ga_quota import QuotaExhaustedError, QuotaScheduler
+from rate_limit import limiter_for, print_rate_report
+from load_jobs import LoadJobManager, submit_partition_files
+from parquet_sink import merge_partition_files, write_parquet_partitions
+from sharding import HashRing, run_sharded, worker_names
 
 # --- Configuration ---
 PROPERTY_IDS = [
@@ -23,84 +40,637 @@ BIGQUERY_PROJECT_ID = ""
 BIGQUERY_DATASET_ID = ""
 BIGQUERY_TABLE_ID = ""
 
-# Table schema must match the fields below
+# Table schema must match the fields below; the table is partitioned by date
+# and clustered by property_id
 SCHEMA = [
     bigquery.SchemaField("property_id", "STRING", mode="REQUIRED"),
-    bigquery.SchemaField("date", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("date", "DATE", mode="REQUIRED"),
     bigquery.SchemaField("sessions", "INTEGER", mode="NULLABLE"),
     bigquery.SchemaField("engaged_sessions", "INTEGER", mode="NULLABLE"),
     bigquery.SchemaField("event_count", "INTEGER", mode="NULLABLE"),
     bigquery.SchemaField("key_events", "INTEGER", mode="NULLABLE"),
 ]
 
+# batchRunReports accepts at most 5 reports, all for the same property
+MAX_REPORTS_PER_BATCH = 5
+# Properties fetched in parallel in batched mode
+MAX_CONCURRENT_BATCHES = 10
+# Rows requested per report page (the API caps a single response at 250,000)
+PAGE_SIZE = 25000
+# Host of the GA4 Data API, for the shared per-host rate limiter
+GA_API_HOST = "analyticsdata.googleapis.com"
+# Rows converted to Parquet at a time while staging a load; bounds the rows held in memory
+LOAD_CHUNK_ROWS = 50000
+# Source name of this connector's stages in the run metrics
+METRICS_SOURCE = "ga"
 
-def run_ga4_report_and_load_to_bigquery(property_ids):
-    analytics_client = BetaAnalyticsDataClient()
-    bq_client = bigquery.Client(project=BIGQUERY_PROJECT_ID)
-    dataset_ref = bq_client.dataset(BIGQUERY_DATASET_ID)
-    table_ref = dataset_ref.table(BIGQUERY_TABLE_ID)
-
-    # Ensure table exists
-    try:
-        bq_client.get_table(table_ref)
-        print(f"Table exists: {BIGQUERY_DATASET_ID}.{BIGQUERY_TABLE_ID}")
-    except Exception:
-        print(f"Table not found. Creating {BIGQUERY_TABLE_ID}...")
-        table = bigquery.Table(table_ref, schema=SCHEMA)
-        bq_client.create_table(table)
-        print("Table created.")
-
-    all_rows = []
-    yesterday = datetime.now() - timedelta(days=1)
-    date_str = yesterday.date().isoformat()
 
-    for prop in property_ids:
-        print(f"Fetching GA4 data for property {prop} on {date_str}...")
-        request = RunReportRequest(
+def build_report_request(prop, start_date, end_date, offset=0, limit=PAGE_SIZE):
+    return RunReportRequest(
+        property=f"properties/{prop}",
+        dimensions=[Dimension(name="date")],
+        metrics=[
+            Metric(name="sessions"),
+            Metric(name="engagedSessions"),
+            Metric(name="eventCount"),
+            Metric(name="keyEvents"),
+        ],
+        date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+        offset=offset,
+        limit=limit,
+        return_property_quota=True,
+    )
+
+
+def report_to_rows(prop, response):
+    for row in response.rows:
+        yield {
+            "property_id": prop,
+            "date": row.dimension_values[0].value,
+            "sessions": int(row.metric_values[0].value or 0),
+            "engaged_sessions": int(row.metric_values[1].value or 0),
+            "event_count": int(row.metric_values[2].value or 0),
+            "key_events": int(row.metric_values[3].value or 0),
+        }
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def call_with_quota(scheduler, prop, call, reports=1):
+    """
+    Runs call() once the scheduler grants the property a slot. A quota
+    rejection from the API marks the property's hour as spent and retries,
+    which defers it; QuotaExhaustedError propagates once it gives up.
+    Every call also goes through the Data API host's rate limiter, which
+    backs off concurrency on quota rejections, and is timed and counted
+    under the property in the current stage's metrics.
+    """
+    limiter = limiter_for(GA_API_HOST)
+    for attempt in range(scheduler.max_deferrals + 1):
+        scheduler.acquire(prop, reports)
+        limiter.acquire()
+        throttled, succeeded = False, False
+        try:
+            with instrumentation.key(prop):
+                instrumentation.record(requests=1, retries=1 if attempt else 0)
+                result = call()
+            succeeded = True
+            return result
+        except ResourceExhausted as e:
+            throttled = True
+            print(f"Quota exceeded for property {prop}: {e}")
+            scheduler.mark_exhausted(prop)
+        finally:
+            limiter.release(throttled, succeeded)
+            scheduler.release(prop)
+    raise QuotaExhaustedError(f"property {prop} kept exceeding its quota")
+
+
+def iter_report_pages(analytics_client, prop, start_date, end_date, scheduler, first_page=None,
+                      store=None):
+    """
+    Yields the rows of one report, requesting further pages with
+    limit/offset until row_count rows have been read. first_page is an
+    already fetched first response (e.g. from batchRunReports). Every page
+    is saved to `store` (a raw_store.RawRun) before its rows are yielded.
+    """
+    response = first_page
+    offset = 0
+    while True:
+        if response is None:
+            request = build_report_request(prop, start_date, end_date, offset=offset)
+            with instrumentation.stage("fetch"):
+                response = call_with_quota(
+                    scheduler, prop, lambda: analytics_client.run_report(request)
+                )
+        scheduler.record(prop, response.property_quota)
+        if store is not None:
+            store.put(prop, RunReportResponse.to_json(response),
+                      start_date=start_date, end_date=end_date, offset=offset)
+        yield from report_to_rows(prop, response)
+        offset += len(response.rows)
+        if not response.rows or offset >= response.row_count:
+            return
+        response = None
+
+
+def iter_property_rows(analytics_client, prop, date_ranges, scheduler, store=None):
+    """
+    Yields rows for one report per (start_date, end_date) in date_ranges.
+    First pages are fetched through batchRunReports calls of up to
+    MAX_REPORTS_PER_BATCH reports; longer reports continue with run_report.
+    """
+    for i in range(0, len(date_ranges), MAX_REPORTS_PER_BATCH):
+        chunk = date_ranges[i:i + MAX_REPORTS_PER_BATCH]
+        batch_request = BatchRunReportsRequest(
             property=f"properties/{prop}",
-            dimensions=[Dimension(name="date")],
-            metrics=[
-                Metric(name="sessions"),
-                Metric(name="engagedSessions"),
-                Metric(name="eventCount"),
-                Metric(name="keyEvents"),
-            ],
-            date_ranges=[DateRange(start_date='2025-05-04', end_date='2025-05-04')],
+            requests=[build_report_request(prop, start, end) for start, end in chunk],
         )
+        with instrumentation.stage("fetch"):
+            response = call_with_quota(
+                scheduler, prop,
+                lambda: analytics_client.batch_run_reports(batch_request),
+                reports=len(chunk),
+            )
+        for (start, end), report in zip(chunk, response.reports):
+            yield from iter_report_pages(
+                analytics_client, prop, start, end, scheduler, first_page=report, store=store
+            )
+
+
+def iter_rows_serial(analytics_client, property_ids, date_ranges, scheduler, errors, store=None):
+    """Yields rows one property and page at a time with run_report."""
+    for prop in property_ids:
+        print(f"Fetching GA4 data for property {prop}...")
+        count = 0
         try:
-            response = analytics_client.run_report(request)
-            for row in response.rows:
-                all_rows.append({
-                    "property_id": prop,
-                    "date": row.dimension_values[0].value,
-                    "sessions": int(row.metric_values[0].value or 0),
-                    "engaged_sessions": int(row.metric_values[1].value or 0),
-                    "event_count": int(row.metric_values[2].value or 0),
-                    "key_events": int(row.metric_values[3].value or 0),
-                })
-            print(f"Collected {len(response.rows)} rows for property {prop}.")
+            for start, end in date_ranges:
+                for row in iter_report_pages(analytics_client, prop, start, end, scheduler, store=store):
+                    count += 1
+                    yield row
+            with instrumentation.stage("fetch"):
+                instrumentation.record(rows=count, key=prop)
+            print(f"Collected {count} rows for property {prop}.")
         except Exception as e:
+            errors[prop] = str(e)
             print(f"Error on property {prop}: {e}")
 
-    if not all_rows:
-        print("No data to load.")
-        return
 
-    # Configure batch load job
-    job_config = LoadJobConfig(
-        schema=SCHEMA,
-        write_disposition="WRITE_APPEND" 
+def iter_rows_concurrent(analytics_client, property_ids, date_ranges, scheduler, errors,
+                         max_concurrency=MAX_CONCURRENT_BATCHES, store=None):
+    """
+    Fetches properties concurrently (at most max_concurrency in flight) and
+    yields their rows as they arrive. Workers hand over rows through a
+    bounded queue, so they pause instead of piling rows up in memory when
+    the consumer falls behind.
+    """
+    pages = queue.Queue(maxsize=max_concurrency * 2)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def worker(prop):
+        count = 0
+        try:
+            rows = iter_property_rows(analytics_client, prop, date_ranges, scheduler, store)
+            for page in chunked(rows, 1000):
+                if stop.is_set():
+                    return
+                put(page)
+                count += len(page)
+            instrumentation.record(rows=count, key=prop)
+            print(f"Collected {count} rows for property {prop}.")
+        except Exception as e:
+            errors[prop] = str(e)
+            print(f"Error on property {prop}: {e}")
+        finally:
+            put(done)
+
+    # Workers record their requests and rows under "fetch", and the time
+    # the consumer waits for rows counts as fetch time
+    with instrumentation.stage("fetch"):
+        worker = instrumentation.propagate(worker)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for prop in property_ids:
+            executor.submit(worker, prop)
+        try:
+            finished = 0
+            while finished < len(property_ids):
+                with instrumentation.stage("fetch"):
+                    page = pages.get()
+                if page is done:
+                    finished += 1
+                    continue
+                yield from page
+        finally:
+            # Unblock workers if the consumer stopped early.
+            stop.set()
+
+
+def replay_rows(replay):
+    """Yields the rows of the report pages saved in a raw_store.Replay, without calling the API."""
+    for prop, _, body in replay:
+        yield from report_to_rows(prop, RunReportResponse.from_json(body.decode(), ignore_unknown_fields=True))
+
+
+def ensure_table(bq_client, migrate=False):
+    table_ref = bq_client.dataset(BIGQUERY_DATASET_ID).table(BIGQUERY_TABLE_ID)
+    # Tables created before partitioning stored date as a YYYYMMDD string
+    return ensure_bq_table(
+        bq_client, table_ref, SCHEMA,
+        partition_field="date", clustering_fields=["property_id"],
+        migrate=migrate, casts={"date": "PARSE_DATE('%Y%m%d', date)"}
     )
 
-    print(f"Starting batch load of {len(all_rows)} rows to BigQuery...")
-    load_job = bq_client.load_table_from_json(
-        all_rows,
-        table_ref,
-        job_config=job_config
+
+def merge_days(bq_client, table, files):
+    """
+    Upserts the rows of the staged day files ({date: path} from
+    write_parquet_partitions) into the table on (property_id, date), so
+    loading the same rows again changes nothing and other properties' rows
+    on those days are left alone. The files are loaded into a staging
+    table of this call's own (see bq_tables.staging_table), one partition
+    each, and merged with a single MERGE bounded to their days. Returns
+    the number of rows staged.
+    """
+    keys = ["property_id", "date"]
+    metrics = [field.name for field in SCHEMA if field.name not in keys]
+    columns = ", ".join(keys + metrics)
+    with staging_table(bq_client, table) as staging_ref:
+        staging = bq_client.create_table(build_table(staging_ref, SCHEMA, "date", ["property_id"]))
+        with LoadJobManager(bq_client) as loads:
+            submit_partition_files(loads, files, staging, SCHEMA, "WRITE_TRUNCATE")
+            staged = sum(result.rows for result in loads.wait())
+
+        merge_sql = f"""
+            MERGE `{table.project}.{table.dataset_id}.{table.table_id}` T
+            USING `{staging.project}.{staging.dataset_id}.{staging.table_id}` S
+            ON T.property_id = S.property_id
+               AND T.date = S.date
+               AND T.date IN UNNEST(@days)
+            WHEN MATCHED THEN UPDATE SET {", ".join(f"{m} = S.{m}" for m in metrics)}
+            WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({", ".join(f"S.{c}" for c in keys + metrics)})
+        """
+        query_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter("days", "DATE", sorted(files)),
+        ])
+        merge_job = bq_client.query(merge_sql, job_config=query_config)
+        merge_job.result()  # Wait for the job to complete
+    print(f"Merged {staged} rows into {table.table_id} "
+          f"({merge_job.num_dml_affected_rows} rows affected).")
+    return staged
+
+
+def fetch_shard(worker, property_ids, date_ranges, batched, max_concurrency, store_dir, run_name,
+                started, fetch_only):
+    """
+    Worker process of a sharded run: fetches its properties, saving the
+    pages to its part of the raw store run, and writes their rows to
+    Parquet day files (unless fetch_only). Returns (files, errors, the
+    worker's instrumentation snapshot).
+    """
+    scheduler = QuotaScheduler()
+    errors = {}
+    store = raw_store.worker_run(store_dir, METRICS_SOURCE, worker, run_name, started)
+    analytics_client = BetaAnalyticsDataClient()
+    if batched:
+        rows = iter_rows_concurrent(
+            analytics_client, property_ids, date_ranges, scheduler, errors, max_concurrency, store
+        )
+    else:
+        rows = iter_rows_serial(analytics_client, property_ids, date_ranges, scheduler, errors, store)
+    files = {}
+    if fetch_only:
+        with instrumentation.stage("fetch", METRICS_SOURCE):
+            for _ in rows:
+                pass
+    else:
+        with instrumentation.stage("serialize", METRICS_SOURCE):
+            files = write_parquet_partitions(rows, SCHEMA, "date", chunk_rows=LOAD_CHUNK_ROWS)
+    if store is not None:
+        store.finish(errors)
+    scheduler.report()
+    return files, errors, instrumentation.snapshot()
+
+
+def run_ga4_report_and_load_to_bigquery(property_ids, batched=False,
+                                        max_concurrency=MAX_CONCURRENT_BATCHES, migrate=False,
+                                        bq_client=None, store=None, replay=None, fetch_only=False,
+                                        workers=1, store_dir=None, run_name=None):
+    """
+    Fetches and loads the daily report. Pages are saved to `store` as they
+    arrive; with `replay` (a raw_store.Replay) the rows are rebuilt from a
+    saved run instead and only the load runs again. fetch_only stops once
+    every page is saved and returns the run's manifest path.
+
+    With workers > 1 the properties are spread over that many processes by
+    consistent hashing; each one fetches and stages its own Parquet day
+    files (and part of the raw store run under store_dir), which are
+    merged here into a single load. Every process has its own rate limiter and quota
+    scheduler, so lower max_concurrency to match.
+    """
+    scheduler = QuotaScheduler()
+
+    yesterday = datetime.now() - timedelta(days=1)
+    date_str = yesterday.date().isoformat()
+
+    date_ranges = [('2025-05-04', '2025-05-04')]
+    errors = {}
+    shard_files = None
+
+    if replay is not None:
+        # Properties that failed in the saved run still fail, so the load merges
+        errors.update(replay.errors)
+        rows = replay_rows(replay)
+    elif workers > 1:
+        shards = HashRing(worker_names(workers)).assign(property_ids)
+        started, manifest = raw_store.start_sharded_run(
+            store_dir, METRICS_SOURCE, [worker for worker, ids in shards.items() if ids], run_name
+        )
+        print(f"Fetching GA4 data for {len(property_ids)} properties on {date_str} "
+              f"in {workers} worker processes...")
+        with instrumentation.stage("fetch", METRICS_SOURCE):
+            results = run_sharded(
+                fetch_shard, shards, date_ranges, batched, max_concurrency, store_dir, run_name, started,
+                fetch_only
+            )
+        shard_files = [files for files, _, _ in results.values()]
+        for _, shard_errors, metrics in results.values():
+            errors.update(shard_errors)
+            instrumentation.merge_snapshot(metrics)
+        if manifest is not None:
+            print(f"Raw responses of this run saved in {manifest}.")
+        if fetch_only:
+            if errors:
+                print(f"{len(errors)} property(ies) failed: {sorted(errors)}")
+            return manifest
+    elif batched:
+        analytics_client = BetaAnalyticsDataClient()
+        print(f"Fetching GA4 data for {len(property_ids)} properties on {date_str} "
+              f"(up to {max_concurrency} at a time)...")
+        rows = iter_rows_concurrent(
+            analytics_client, property_ids, date_ranges, scheduler, errors, max_concurrency, store
+        )
+    else:
+        analytics_client = BetaAnalyticsDataClient()
+        rows = iter_rows_serial(analytics_client, property_ids, date_ranges, scheduler, errors, store)
+
+    if fetch_only:
+        for _ in rows:
+            pass
+        store.finish(errors)
+        scheduler.report()
+        print_rate_report()
+        if errors:
+            print(f"{len(errors)} property(ies) failed: {sorted(errors)}")
+        return store.path
+
+    bq_client = bq_client or bigquery.Client(project=BIGQUERY_PROJECT_ID)
+    table = ensure_table(bq_client, migrate=migrate)
+
+    # Rows stream from the API straight into one Parquet staging file per day;
+    # the time spent fetching them is split out into the "fetch" stage.
+    # Sharded runs only merge the day files the workers staged
+    with instrumentation.stage("serialize", METRICS_SOURCE):
+        if shard_files is not None:
+            files = merge_partition_files(shard_files, SCHEMA)
+        else:
+            files = write_parquet_partitions(rows, SCHEMA, "date", chunk_rows=LOAD_CHUNK_ROWS)
+    if store is not None:
+        store.finish(errors)
+
+    # If every configured property was fetched for these days, each day's
+    # partition is replaced, so a rerun doesn't duplicate rows. A run over
+    # part of the properties (--properties, one shard's load), with failed
+    # properties or without PROPERTY_IDS configured (so nothing says which
+    # properties a partition holds) would drop other properties' rows that
+    # way, so it merges on (property_id, date) instead.
+    configured = {str(prop) for prop in PROPERTY_IDS}
+    fetched = replay.entities() if replay is not None else {str(prop) for prop in property_ids}
+    fetched -= {str(prop) for prop in errors}
+    if table.time_partitioning and configured and fetched >= configured:
+        # The day loads are submitted together and run concurrently
+        with LoadJobManager(bq_client) as loads, instrumentation.stage("load", METRICS_SOURCE):
+            submit_partition_files(loads, files, table, SCHEMA, "WRITE_TRUNCATE")
+            total = sum(result.rows for result in loads.wait())
+    elif files:
+        with instrumentation.stage("load", METRICS_SOURCE):
+            total = merge_days(bq_client, table, files)
+    else:
+        total = 0
+
+    scheduler.report()
+    print_rate_report()
+    if errors:
+        print(f"{len(errors)} property(ies) failed: {sorted(errors)}")
+    if not total:
+        print("No data to load.")
+
+
+# --- Backfill ---
+
+DEFAULT_STATE_FILE = "ga_backfill_state.json"
+# Days covered by one work unit; a single report returns one row per day.
+DEFAULT_DAYS_PER_UNIT = 30
+# Rows buffered before they are merged and their days are checkpointed.
+DEFAULT_FLUSH_ROWS = 50000
+
+
+def day_key(prop, day):
+    """Checkpoint key of one property's day, e.g. "123|2025-01-31"."""
+    return f"{prop}|{day}"
+
+
+def unit_key(unit):
+    return "|".join(unit)
+
+
+def unit_day_keys(unit):
+    prop, start, end = unit
+    day, end = date.fromisoformat(start), date.fromisoformat(end)
+    keys = []
+    while day <= end:
+        keys.append(day_key(prop, day.isoformat()))
+        day += timedelta(days=1)
+    return keys
+
+
+def plan_backfill_units(property_ids, start_date, end_date, days_per_unit=DEFAULT_DAYS_PER_UNIT,
+                        completed=()):
+    """
+    Splits the days of [start_date, end_date] x property_ids that are not
+    in completed (day_key()s) into work units of (property_id, unit_start,
+    unit_end) with ISO date strings: runs of at most days_per_unit
+    consecutive pending days. Checkpoints are per day, so a resumed
+    backfill may use a different days_per_unit.
+    """
+    units = []
+    for prop in property_ids:
+        unit_start = unit_end = None
+        current = start_date
+        while current <= end_date:
+            done = day_key(prop, current.isoformat()) in completed
+            if not done:
+                unit_start = unit_start or current
+                unit_end = current
+            if unit_start is not None and (
+                done or current == end_date or (unit_end - unit_start).days + 1 == days_per_unit
+            ):
+                units.append((prop, unit_start.isoformat(), unit_end.isoformat()))
+                unit_start = None
+            current += timedelta(days=1)
+    return units
+
+
+def load_backfill_state(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        keys = json.load(f).get("completed", [])
+    completed = set()
+    for key in keys:
+        parts = key.split("|")
+        # State files written before per-day checkpoints hold whole units
+        completed.update(unit_day_keys(parts) if len(parts) == 3 else [key])
+    return completed
+
+
+def save_backfill_state(path, completed):
+    # Write to a temp file and rename so a crash never leaves a truncated state file.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"completed": sorted(completed)}, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_unit_rows(analytics_client, unit, scheduler):
+    prop, start, end = unit
+    return list(iter_property_rows(analytics_client, prop, [(start, end)], scheduler))
+
+
+def run_ga4_backfill(property_ids, start_date, end_date, workers=MAX_CONCURRENT_BATCHES,
+                     days_per_unit=DEFAULT_DAYS_PER_UNIT, state_file=DEFAULT_STATE_FILE,
+                     flush_rows=DEFAULT_FLUSH_ROWS, migrate=False, bq_client=None):
+    """
+    Backfills GA4 metrics for every property over [start_date, end_date].
+
+    Work units run on `workers` threads. Their rows are buffered and merged
+    every `flush_rows` rows; a unit's days are only recorded as completed
+    in `state_file` once its rows are merged, so rerunning after a crash
+    skips finished days and refetches the rest. The merge upserts on
+    (property_id, date), so days loaded just before a crash are not
+    duplicated when they are fetched again.
+    """
+    analytics_client = BetaAnalyticsDataClient()
+    bq_client = bq_client or bigquery.Client(project=BIGQUERY_PROJECT_ID)
+    table = ensure_table(bq_client, migrate=migrate)
+    scheduler = QuotaScheduler()
+
+    completed = load_backfill_state(state_file)
+    pending = plan_backfill_units(property_ids, start_date, end_date, days_per_unit, completed)
+    total_days = len(property_ids) * ((end_date - start_date).days + 1)
+    pending_days = sum(len(unit_day_keys(unit)) for unit in pending)
+    print(f"Backfill {start_date} to {end_date}: {total_days} property-days, "
+          f"{total_days - pending_days} already completed, {len(pending)} units to run.")
+
+    buffered_rows = []
+    buffered_keys = []
+    failed = {}
+
+    def flush():
+        if buffered_rows:
+            with instrumentation.stage("serialize", METRICS_SOURCE):
+                files = write_parquet_partitions(buffered_rows, SCHEMA, "date", chunk_rows=LOAD_CHUNK_ROWS)
+            with instrumentation.stage("load", METRICS_SOURCE):
+                merge_days(bq_client, table, files)
+        completed.update(buffered_keys)
+        save_backfill_state(state_file, completed)
+        buffered_rows.clear()
+        buffered_keys.clear()
+
+    # Time waiting for units counts as "fetch", flushes as "load"
+    with instrumentation.stage("fetch", METRICS_SOURCE), ThreadPoolExecutor(max_workers=workers) as executor:
+        fetch_unit = instrumentation.propagate(fetch_unit_rows)
+        futures = {
+            executor.submit(fetch_unit, analytics_client, unit, scheduler): unit
+            for unit in pending
+        }
+        for future in as_completed(futures):
+            # Drop the finished future so its rows are freed once flushed.
+            unit = futures.pop(future)
+            try:
+                rows = future.result()
+            except Exception as e:
+                failed[unit_key(unit)] = str(e)
+                print(f"Error on unit {unit_key(unit)}: {e}")
+                continue
+            buffered_rows.extend(rows)
+            buffered_keys.extend(unit_day_keys(unit))
+            if len(buffered_rows) >= flush_rows:
+                flush()
+    flush()
+
+    scheduler.report()
+    print_rate_report()
+    print(f"Backfill finished: {len(pending) - len(failed)} units loaded, {len(failed)} failed.")
+    if failed:
+        print("Rerun the same command to retry the failed units.")
+
+
+@instrumentation.exports_metrics
+def main(argv=None, bq_client=None):
+    parser = argparse.ArgumentParser(description="Load GA4 daily metrics into BigQuery.")
+    parser.add_argument(
+        "--batched", action="store_true",
+        help="Fetch properties concurrently through batchRunReports."
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, default=MAX_CONCURRENT_BATCHES,
+        help="Properties in flight at once in batched mode."
+    )
+    parser.add_argument(
+        "--migrate-tables", action="store_true",
+        help="Rebuild an existing unpartitioned table as partitioned by date and clustered by property_id."
     )
-    load_job.result()  # Wait for completion
-    print(f"Loaded {load_job.output_rows} rows into {BIGQUERY_TABLE_ID}.")
+    subparsers = parser.add_subparsers(dest="command")
+    parser.add_argument("--properties", type=lambda value: value.split(","), default=PROPERTY_IDS,
+                        help="Comma-separated property ids to load instead of PROPERTY_IDS.")
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="Worker processes to fetch and stage in; properties are assigned to them by consistent hashing."
+    )
+    backfill_parser = subparsers.add_parser(
+        "backfill", help="Load a historical date span, resuming from a state file."
+    )
+    backfill_parser.add_argument("--start", type=date.fromisoformat, required=True,
+                                 help="First day to load (YYYY-MM-DD).")
+    backfill_parser.add_argument("--end", type=date.fromisoformat, required=True,
+                                 help="Last day to load (YYYY-MM-DD).")
+    backfill_parser.add_argument("--threads", type=int, default=MAX_CONCURRENT_BATCHES,
+                                 help="Work units fetched concurrently.")
+    backfill_parser.add_argument("--days-per-unit", type=int, default=DEFAULT_DAYS_PER_UNIT)
+    backfill_parser.add_argument("--state-file", default=DEFAULT_STATE_FILE)
+    instrumentation.add_arguments(parser)
+    raw_store.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
+    if args.command == "backfill":
+        if args.replay is not None or args.fetch_only:
+            parser.error("--replay and --fetch-only apply to the daily run; a backfill resumes from its state file")
+        if args.processes > 1:
+            parser.error("--processes applies to the daily run; a backfill runs its units on --threads")
+        run_ga4_backfill(
+            args.properties, args.start, args.end, workers=args.threads,
+            days_per_unit=args.days_per_unit, state_file=args.state_file,
+            migrate=args.migrate_tables, bq_client=bq_client
+        )
+    else:
+        return run_ga4_report_and_load_to_bigquery(
+            args.properties, batched=args.batched, max_concurrency=args.max_concurrency,
+            migrate=args.migrate_tables, bq_client=bq_client,
+            store=raw_store.open_run(args, METRICS_SOURCE) if args.processes <= 1 else None,
+            replay=raw_store.open_replay(args, METRICS_SOURCE),
+            fetch_only=args.fetch_only,
+            workers=args.processes,
+            store_dir=None if args.no_raw_store else args.raw_store,
+            run_name=args.run_name,
+        )
 
 
 if __name__ == "__main__":
-    run_ga4_report_and_load_to_bigquery(PROPERTY_IDS)
+    main()
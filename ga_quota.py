@@ -0,0 +1,120 @@
+import threading
+import time
+
+# GA4 Standard properties allow 10 concurrent requests per property.
+DEFAULT_CONCURRENT_PER_PROPERTY = 10
+# How long to hold a property back when its hourly tokens run low.
+DEFAULT_DEFER_SECONDS = 300
+DEFAULT_MAX_DEFERRALS = 3
+# Token cost assumed for a property before any response has been seen.
+DEFAULT_REQUEST_COST = 10
+
+
+class QuotaExhaustedError(Exception):
+    pass
+
+
+class PropertyQuotaState:
+    def __init__(self, concurrent_limit):
+        self.slots = threading.BoundedSemaphore(concurrent_limit)
+        self.tokens_per_hour = None
+        self.tokens_per_day = None
+        self.concurrent_requests = None
+        self.avg_cost = DEFAULT_REQUEST_COST
+        self.requests = 0
+        self.tokens_consumed = 0
+
+
+class QuotaScheduler:
+    """
+    Paces GA4 Data API calls using the PropertyQuota returned with each
+    report (RunReportRequest.return_property_quota).
+
+    acquire() blocks until the property has a free concurrent slot and
+    enough hourly tokens for another request, deferring when it does not;
+    it raises QuotaExhaustedError once the daily tokens are gone or the
+    property has been deferred max_deferrals times. record() updates the
+    remaining tokens from a response, and report() prints them per property.
+    """
+
+    def __init__(self, concurrent_per_property=DEFAULT_CONCURRENT_PER_PROPERTY,
+                 defer_seconds=DEFAULT_DEFER_SECONDS, max_deferrals=DEFAULT_MAX_DEFERRALS,
+                 sleep=time.sleep):
+        self.concurrent_per_property = concurrent_per_property
+        self.defer_seconds = defer_seconds
+        self.max_deferrals = max_deferrals
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def _state(self, prop):
+        with self._lock:
+            if prop not in self._states:
+                self._states[prop] = PropertyQuotaState(self.concurrent_per_property)
+            return self._states[prop]
+
+    def acquire(self, prop, reports=1):
+        state = self._state(prop)
+        deferrals = 0
+        while True:
+            with self._lock:
+                needed = state.avg_cost * reports
+                day_left = state.tokens_per_day
+                hour_left = state.tokens_per_hour
+            if day_left is not None and day_left < needed:
+                raise QuotaExhaustedError(
+                    f"property {prop} has {day_left} daily tokens left, needs ~{needed:.0f}"
+                )
+            if hour_left is None or hour_left >= needed:
+                break
+            if deferrals >= self.max_deferrals:
+                raise QuotaExhaustedError(
+                    f"property {prop} still has only {hour_left} hourly tokens "
+                    f"after {deferrals} deferrals"
+                )
+            deferrals += 1
+            print(f"Property {prop}: {hour_left} hourly tokens left, "
+                  f"deferring {self.defer_seconds}s ({deferrals}/{self.max_deferrals})")
+            self._sleep(self.defer_seconds)
+            # The hourly window rolls forward; let the next response tell us
+            # the new figure instead of waiting on the stale one forever.
+            with self._lock:
+                state.tokens_per_hour = None
+        state.slots.acquire()
+
+    def release(self, prop):
+        self._state(prop).slots.release()
+
+    def mark_exhausted(self, prop):
+        # The API rejected a request for quota; treat the hour as spent.
+        state = self._state(prop)
+        with self._lock:
+            state.tokens_per_hour = 0
+
+    def record(self, prop, property_quota):
+        """Updates a property's remaining quota from a response's property_quota."""
+        if not property_quota:
+            return
+        state = self._state(prop)
+        with self._lock:
+            hour = property_quota.tokens_per_hour
+            day = property_quota.tokens_per_day
+            state.tokens_per_hour = hour.remaining
+            state.tokens_per_day = day.remaining
+            state.concurrent_requests = property_quota.concurrent_requests.remaining
+            state.requests += 1
+            state.tokens_consumed += hour.consumed
+            # Exponential moving average of tokens charged per request.
+            state.avg_cost = 0.8 * state.avg_cost + 0.2 * max(hour.consumed, 1)
+
+    def report(self):
+        print("GA4 quota remaining:")
+        print(f"  {'property':<20}{'requests':>10}{'consumed':>10}{'hour left':>11}{'day left':>10}")
+        with self._lock:
+            for prop, state in sorted(self._states.items()):
+                print(f"  {prop:<20}{state.requests:>10}{state.tokens_consumed:>10}"
+                      f"{_fmt(state.tokens_per_hour):>11}{_fmt(state.tokens_per_day):>10}")
+
+
+def _fmt(value):
+    return "?" if value is None else str(value)
@@ -1,12 +1,32 @@
+import argparse
 import os
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request, AuthorizedSession
+from google.auth.transport.requests import Request
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
 
-def main():
+import instrumentation
+from http_client import make_authorized_session
+from rate_limit import print_rate_report
+from gbp_metrics import MetricRowBuilder, fetch_locations, print_error_report
+
+# Source name of this connector's stages in the run metrics
+METRICS_SOURCE = "gbp"
+
+# Concurrent location requests over the shared session; 1 = serial
+MAX_IN_FLIGHT = 8
+
+@instrumentation.exports_metrics
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch GBP daily metrics.")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="Location requests sent at the same time; 1 = serial.")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
     # Define the required scope.
     SCOPES = ['https://www.googleapis.com/auth/business.manage']
     # Set your Google Cloud credentials (if not already set in your environment)
@@ -28,8 +48,9 @@ def main():
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
 
-    # Create an authorized session.
-    authed_session = AuthorizedSession(creds)
+    max_in_flight = args.max_in_flight
+    # Create an authorized session, pooled to max_in_flight connections with retries and backoff.
+    authed_session = make_authorized_session(creds, pool_size=max_in_flight)
 
     # Base URL for the API
     base_url = "https://businessprofileperformance.googleapis.com/v1"
@@ -60,59 +81,34 @@ def main():
         ('dailyRange.end_date.day', '22')
     ]
     
-    # Container for all rows across locations.
-    all_rows = []
+    # Rows keyed on (profile_id, date) across locations.
+    builder = MetricRowBuilder()
     
-    # Process each location.
-    for loc_id in location_ids:
-        # Build the endpoint URL using the current location id.
-        location_path = f"locations/{loc_id}"
-        endpoint = f"{base_url}/{location_path}:fetchMultiDailyMetricsTimeSeries"
-        
-        # Make the GET request.
-        response = authed_session.get(endpoint, params=params)
-        if response.status_code == 200:
-            data = response.json()
-        else:
-            print(f"Error for location {loc_id}: {response.status_code} {response.text}")
-            continue  # Proceed to the next location if one fails.
+    errors = {}
     
-        # Transform the JSON data into rows, adding a profile_id column.
-        # Instead of using a dictionary keyed solely by date (which could mix dates across locations), use a list.
-        # Each row is a dict with 'date', 'profile_id', and the metric values.
-        metric_names = []
-        time_series_list = data.get("multiDailyMetricTimeSeries", [])
-        if time_series_list:
-            # Save the metric names from the first location's first time series entry
-            for metric in time_series_list[0].get("dailyMetricTimeSeries", []):
-                metric_name = metric.get("dailyMetric")
-                metric_names.append(metric_name)
-                
-            # Process each metric time series into individual rows.
-            for metric in time_series_list[0].get("dailyMetricTimeSeries", []):
-                metric_name = metric.get("dailyMetric")
-                for entry in metric.get("timeSeries", {}).get("datedValues", []):
-                    date_info = entry.get("date")
-                    date_str = f"{date_info['year']}-{date_info['month']:02d}-{date_info['day']:02d}"
-                    
-                    # Find if a row for this date and location already exists.
-                    # If not, create it.
-                    row = next((r for r in all_rows if r.get("date") == date_str and r.get("profile_id") == loc_id), None)
-                    if not row:
-                        row = {'date': date_str, 'profile_id': loc_id}
-                        all_rows.append(row)
-                    
-                    # Add/overwrite the metric value
-                    if "value" in entry:
-                        try:
-                            value = int(entry["value"])
-                        except ValueError:
-                            value = entry["value"]
-                        row[metric_name] = value
-                    else:
-                        row[metric_name] = None
-        else:
-            print(f"No time series data for location {loc_id}.")
+    # Fetch every location over the shared session, max_in_flight at a time.
+    with instrumentation.stage("fetch", METRICS_SOURCE):
+        fetched = fetch_locations(
+            authed_session, base_url, location_ids, params,
+            max_in_flight=max_in_flight
+        )
+        for loc_id, data, error in fetched:
+            if error:
+                print(f"Error for location {loc_id}: {error}")
+                errors[loc_id] = error
+                continue  # Proceed to the next location if one fails.
+
+            # Transform the JSON data into rows, adding a profile_id column.
+            # Each row is a dict with 'date', 'profile_id', and the metric values.
+            with instrumentation.stage("transform"):
+                rows_before = len(builder)
+                if not builder.add_location(loc_id, data):
+                    print(f"No time series data for location {loc_id}.")
+                instrumentation.record(rows=len(builder) - rows_before, key=loc_id)
+
+    print_error_report(errors)
+    print_rate_report()
+    all_rows = builder.rows()
     print(all_rows)
     # Initialize BigQuery client.
     # bq_client = bigquery.Client()
@@ -137,7 +133,7 @@ def main():
     #     bigquery.SchemaField("date", "DATE"),
     #     bigquery.SchemaField("profile_id", "STRING")
     # ]
-    # unique_metrics = sorted(set(metric_names))
+    # unique_metrics = sorted(set(builder.metric_names))
     # for metric in unique_metrics:
     #     schema.append(bigquery.SchemaField(metric, "INTEGER", mode="NULLABLE"))
 
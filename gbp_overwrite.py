@@ -1,16 +1,137 @@
+import argparse
+import json
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request, AuthorizedSession
+from google.auth.transport.requests import Request
 
 from google.cloud import bigquery
-from google.cloud.bigquery import LoadJobConfig, WriteDisposition
+from google.cloud.bigquery import WriteDisposition, ScalarQueryParameter
 from google.api_core.exceptions import NotFound
 
-def main():
-    # --- Authentication / API Setup ---
+import instrumentation
+import raw_store
+from bq_tables import ensure_table, staging_table
+from change_manifest import ChangeManifest, group_rows
+from http_client import make_authorized_session
+from rate_limit import print_rate_report
+from gbp_metrics import MetricRowBuilder, build_params, fetch_locations, print_error_report, replay_locations
+from parquet_sink import load_rows_as_parquet
+from sharding import HashRing, run_sharded, worker_names
+
+# Range reloaded by a full (overwrite) run, and the starting point for
+# locations without a watermark in incremental mode.
+FULL_START_DATE = date(2024, 1, 1)
+FULL_END_DATE = date(2025, 5, 1)
+
+# GBP keeps revising the most recent days; incremental runs refetch this many
+# days before each location's watermark.
+DEFAULT_LOOKBACK_DAYS = 7
+
+# Business Profile Performance API and the locations to load
+BASE_URL = ""
+LOCATION_IDS = [
+]
+
+# Concurrent location requests over the shared session; 1 = serial
+MAX_IN_FLIGHT = 8
+
+# Source name of this connector's stages in the run metrics
+METRICS_SOURCE = "gbp_overwrite"
+
+# Fingerprints of the (location, month) slices loaded by the last full run
+MANIFEST_FILE = "gbp_overwrite_manifest.json"
+
+# ---- Incremental Sync ----
+
+def get_watermarks(bq, tbl_ref):
+    """
+    Returns {profile_id: last loaded date} from the target table, or an empty
+    dict if the table does not exist yet.
+    """
+    try:
+        bq.get_table(tbl_ref)
+    except NotFound:
+        return {}
+    query = (
+        "SELECT profile_id, MAX(date) AS last_date "
+        f"FROM `{tbl_ref.project}.{tbl_ref.dataset_id}.{tbl_ref.table_id}` "
+        "GROUP BY profile_id"
+    )
+    return {row.profile_id: row.last_date for row in bq.query(query).result()}
+
+
+def plan_incremental_ranges(location_ids, watermarks, end_date, lookback_days):
+    """
+    Groups locations by the start date they need to be fetched from:
+    the day after their watermark minus the lookback, or FULL_START_DATE
+    for locations never loaded. Locations already past end_date are skipped.
+    Returns {start_date: [loc_id, ...]}.
+    """
+    plan = {}
+    for loc_id in location_ids:
+        last = watermarks.get(loc_id)
+        if last is None:
+            start = FULL_START_DATE
+        else:
+            start = last + timedelta(days=1) - timedelta(days=lookback_days)
+        if start > end_date:
+            continue
+        plan.setdefault(start, []).append(loc_id)
+    return plan
+
+
+def month_slice(row):
+    """Change-detection slice of a row: its location and month, e.g. "123/2025-04"."""
+    return f"{row['profile_id']}/{row['date'][:7]}"
+
+
+def merge_rows(bq, tbl_ref, rows, schema, metric_names):
+    """
+    Upserts rows into the target table on (profile_id, date).
+
+    Rows are loaded into a staging table of this call's own (see
+    bq_tables.staging_table) and merged with a date-bounded MERGE, so only
+    the partitions covered by this run are read or rewritten.
+    """
+    with staging_table(bq, tbl_ref) as staging_ref:
+        load_rows_as_parquet(bq, rows, staging_ref, schema, WriteDisposition.WRITE_TRUNCATE)
+
+        target = f"`{tbl_ref.project}.{tbl_ref.dataset_id}.{tbl_ref.table_id}`"
+        staging = f"`{staging_ref.project}.{staging_ref.dataset_id}.{staging_ref.table_id}`"
+        metrics = sorted(set(metric_names))
+        update_set = ", ".join(f"{m} = S.{m}" for m in metrics)
+        columns = ", ".join(["date", "profile_id"] + metrics)
+        values = ", ".join(f"S.{c}" for c in ["date", "profile_id"] + metrics)
+        merge_sql = f"""
+            MERGE {target} T
+            USING {staging} S
+            ON T.profile_id = S.profile_id
+               AND T.date = S.date
+               AND T.date BETWEEN @min_date AND @max_date
+            WHEN MATCHED THEN UPDATE SET {update_set}
+            WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})
+        """
+        dates = [r["date"] for r in rows]
+        query_config = bigquery.QueryJobConfig(query_parameters=[
+            ScalarQueryParameter("min_date", "DATE", min(dates)),
+            ScalarQueryParameter("max_date", "DATE", max(dates)),
+        ])
+        merge_job = bq.query(merge_sql, job_config=query_config)
+        merge_job.result()
+    print(
+        f"Merged {len(rows)} rows into {tbl_ref.table_id} "
+        f"({min(dates)} to {max(dates)}, "
+        f"{merge_job.num_dml_affected_rows} rows affected)."
+    )
+
+
+# ---- Fetching ----
+
+def get_credentials():
+    """OAuth credentials from token.json, refreshed or (first time) obtained interactively."""
     SCOPES = ''
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = ""
     creds = None
@@ -27,88 +148,191 @@ def main():
             creds = flow.run_local_server(port=0)
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
-    authed_session = AuthorizedSession(creds)
+    return creds
 
-    # --- Parameters / Date Range ---
-    base_url = ""
-    location_ids = [
-    ]
-    # Example hard-coded range; adjust as needed
-    params = [
-        ('dailyMetrics', 'BUSINESS_IMPRESSIONS_DESKTOP_MAPS'),
-        ('dailyMetrics', 'BUSINESS_IMPRESSIONS_DESKTOP_SEARCH'),
-        ('dailyMetrics', 'BUSINESS_IMPRESSIONS_MOBILE_MAPS'),
-        ('dailyMetrics', 'BUSINESS_IMPRESSIONS_MOBILE_SEARCH'),
-        ('dailyMetrics', 'BUSINESS_CONVERSATIONS'),
-        ('dailyMetrics', 'BUSINESS_DIRECTION_REQUESTS'),
-        ('dailyMetrics', 'CALL_CLICKS'),
-        ('dailyMetrics', 'WEBSITE_CLICKS'),
-        ('dailyMetrics', 'BUSINESS_BOOKINGS'),
-        ('dailyMetrics', 'BUSINESS_FOOD_ORDERS'),
-        ('dailyMetrics', 'BUSINESS_FOOD_MENU_CLICKS'),
-        ('dailyRange.start_date.year', '2024'),
-        ('dailyRange.start_date.month', '01'),
-        ('dailyRange.start_date.day', '01'),
-        ('dailyRange.end_date.year', '2025'),
-        ('dailyRange.end_date.month', '05'),
-        ('dailyRange.end_date.day', '01'),
-    ]
 
-    # --- Fetch & Transform Metrics ---
-    all_rows = []
-    metric_names = []
+def fetch_metric_rows(fetches, builder, errors):
+    """
+    Pivots every location yielded by fetches ((loc_id, data, error)
+    iterators) into builder; failed locations are added to errors.
+    Requests, bytes and retries are recorded per location under "fetch";
+    row assembly is timed separately under "transform".
+    """
+    with instrumentation.stage("fetch", METRICS_SOURCE):
+        for fetched in fetches:
+            for loc_id, data, error in fetched:
+                print(f"Processing {loc_id}")
+                if error:
+                    print(f"Error for {loc_id}: {error}")
+                    errors[loc_id] = error
+                    continue
 
-    for loc_id in location_ids:
-        print(f"Processing {loc_id}")
-        endpoint = (
-            f"{base_url}/locations/{loc_id}:"
-            "fetchMultiDailyMetricsTimeSeries"
+                # Build rows per date × location
+                with instrumentation.stage("transform"):
+                    rows_before = len(builder)
+                    if not builder.add_location(loc_id, data):
+                        print(f"No data for {loc_id}")
+                    instrumentation.record(rows=len(builder) - rows_before, key=loc_id)
+
+
+def fetch_shard(worker, location_ids, token, plan, end_date, store_dir, run_name, started, incremental,
+                max_in_flight=MAX_IN_FLIGHT):
+    """
+    Worker process of a sharded run: fetches and pivots its locations of
+    the plan on its own session, saving the responses to its part of the
+    raw store run. token is the parent's credentials as JSON, so workers
+    never refresh token.json or start the OAuth flow themselves. Returns
+    (rows, metric_names, errors, the worker's instrumentation snapshot).
+    """
+    shard = set(location_ids)
+    creds = Credentials.from_authorized_user_info(json.loads(token))
+    authed_session = make_authorized_session(creds, pool_size=max_in_flight)
+    store = raw_store.worker_run(store_dir, METRICS_SOURCE, worker, run_name, started)
+    fetches = [
+        fetch_locations(
+            authed_session, BASE_URL, [loc_id for loc_id in loc_ids if loc_id in shard],
+            build_params(start_date, end_date), max_in_flight=max_in_flight, store=store
         )
-        resp = authed_session.get(endpoint, params=params)
-        if resp.status_code != 200:
-            print(f"Error for {loc_id}: {resp.status_code} {resp.text}")
-            continue
+        for start_date, loc_ids in plan.items()
+    ]
+    builder = MetricRowBuilder()
+    errors = {}
+    fetch_metric_rows(fetches, builder, errors)
+    if store is not None:
+        store.finish(errors, incremental=incremental)
+    return builder.rows(), builder.metric_names, errors, instrumentation.snapshot()
 
-        data = resp.json().get("multiDailyMetricTimeSeries", [])
-        if not data:
-            print(f"No data for {loc_id}")
-            continue
 
-        # Capture metric names once
-        if not metric_names:
-            for m in data[0].get("dailyMetricTimeSeries", []):
-                metric_names.append(m.get("dailyMetric"))
-
-        # Build rows per date × location
-        for m in data[0].get("dailyMetricTimeSeries", []):
-            name = m.get("dailyMetric")
-            for entry in m.get("timeSeries", {}).get("datedValues", []):
-                d = entry["date"]
-                date_str = f"{d['year']}-{d['month']:02d}-{d['day']:02d}"
-                # find or create the row
-                row = next(
-                    (r for r in all_rows
-                     if r["date"] == date_str and r["profile_id"] == loc_id),
-                    None
-                )
-                if not row:
-                    row = {"date": date_str, "profile_id": loc_id}
-                    all_rows.append(row)
-                # set the metric value (int or None)
-                val = entry.get("value")
-                try:
-                    row[name] = int(val) if val is not None else None
-                except (TypeError, ValueError):
-                    row[name] = val
+@instrumentation.exports_metrics
+def main(argv=None, bq_client=None):
+    parser = argparse.ArgumentParser(description="Load GBP daily metrics into BigQuery.")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Fetch only days after each location's last loaded date and MERGE them."
+    )
+    parser.add_argument(
+        "--lookback-days", type=int, default=DEFAULT_LOOKBACK_DAYS,
+        help="Days before the watermark to refetch for late revisions (incremental only)."
+    )
+    parser.add_argument(
+        "--migrate-tables", action="store_true",
+        help="Rebuild an existing unpartitioned table as partitioned by date and clustered by profile_id."
+    )
+    parser.add_argument("--manifest-file", default=MANIFEST_FILE,
+                        help="Local manifest of the fingerprints of the loaded location-month slices.")
+    parser.add_argument(
+        "--full-reload", action="store_true",
+        help="Overwrite the whole table even where nothing changed, e.g. after removing locations."
+    )
+    parser.add_argument("--locations", type=lambda value: value.split(","), default=LOCATION_IDS,
+                        help="Comma-separated location ids to fetch instead of LOCATION_IDS.")
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="Worker processes to fetch and pivot in; locations are assigned to them by consistent hashing."
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+        help="Location requests sent at the same time, per worker process; 1 = serial."
+    )
+    instrumentation.add_arguments(parser)
+    raw_store.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
+    # A replay reloads a saved run the way it was loaded the first time
+    replay = raw_store.open_replay(args, METRICS_SOURCE)
+    if replay is not None:
+        args.incremental = replay.info.get("incremental", False)
+    # Sharded runs save one raw store run per worker instead
+    sharded = args.processes > 1 and replay is None
+    store = None if sharded else raw_store.open_run(args, METRICS_SOURCE)
+    max_in_flight = args.max_in_flight
+
+    # --- Authentication / API Setup ---
+    # (not needed to replay saved responses; worker processes are handed
+    # these credentials and open their own sessions)
+    if replay is None:
+        creds = get_credentials()
+        if not sharded:
+            # Pooled to max_in_flight connections, with retries and backoff
+            authed_session = make_authorized_session(creds, pool_size=max_in_flight)
+
+    # --- Parameters / Date Range ---
+    base_url = BASE_URL
+    location_ids = args.locations
 
     # --- BigQuery Setup ---
-    bq = bigquery.Client()
+    bq = bq_client or bigquery.Client()
     proj = bq.project
     ds_id = ''
     tbl_id = ''
     ds_ref = bigquery.DatasetReference(proj, ds_id)
     tbl_ref = ds_ref.table(tbl_id)
 
+    # Work out which date range each location needs
+    if replay is not None:
+        plan = {}
+    elif args.incremental:
+        end_date = (datetime.now() - timedelta(days=1)).date()
+        watermarks = get_watermarks(bq, tbl_ref)
+        plan = plan_incremental_ranges(
+            location_ids, watermarks, end_date, args.lookback_days
+        )
+        print(f"Incremental sync of {sum(len(v) for v in plan.values())} "
+              f"location(s) through {end_date}")
+    else:
+        plan = {FULL_START_DATE: list(location_ids)}
+        end_date = FULL_END_DATE
+
+    # --- Fetch & Transform Metrics ---
+    builder = MetricRowBuilder()
+
+    errors = {}
+    raw_manifest = None
+
+    # Every response is saved to the raw store as it arrives
+    if replay is not None:
+        fetch_metric_rows([replay_locations(replay)], builder, errors)
+    elif sharded:
+        # Each worker process fetches and pivots its share of the locations;
+        # their rows are merged here into a single load
+        shards = HashRing(worker_names(args.processes)).assign(
+            [loc_id for loc_ids in plan.values() for loc_id in loc_ids]
+        )
+        store_dir = None if args.no_raw_store else args.raw_store
+        started, raw_manifest = raw_store.start_sharded_run(
+            store_dir, METRICS_SOURCE, [worker for worker, ids in shards.items() if ids], args.run_name
+        )
+        with instrumentation.stage("fetch", METRICS_SOURCE):
+            results = run_sharded(
+                fetch_shard, shards, creds.to_json(), plan, end_date, store_dir, args.run_name, started,
+                args.incremental, max_in_flight
+            )
+        for rows, metric_names, shard_errors, metrics in results.values():
+            builder.add_rows(rows, metric_names)
+            errors.update(shard_errors)
+            instrumentation.merge_snapshot(metrics)
+        if raw_manifest is not None:
+            print(f"Raw responses of this run saved in {raw_manifest}.")
+    else:
+        fetch_metric_rows([
+            fetch_locations(
+                authed_session, base_url, loc_ids, build_params(start_date, end_date),
+                max_in_flight=max_in_flight, store=store
+            )
+            for start_date, loc_ids in plan.items()
+        ], builder, errors)
+
+    if store is not None:
+        store.finish(errors, incremental=args.incremental)
+        raw_manifest = store.path
+    print_error_report(errors)
+    print_rate_report()
+    if args.fetch_only:
+        return raw_manifest
+    all_rows = builder.rows()
+    metric_names = builder.metric_names
+
     # Ensure dataset exists
     try:
         bq.get_dataset(ds_ref)
@@ -125,24 +349,45 @@ def main():
         for m in sorted(set(metric_names))
     ]
 
-    # Ensure table exists (optional; load job can create it too)
-    try:
-        bq.get_table(tbl_ref)
-    except NotFound:
-        bq.create_table(bigquery.Table(tbl_ref, schema=schema))
-        print(f"Created table {tbl_id}")
+    # Ensure table exists, partitioned by date so the date-bounded MERGE only
+    # touches the days being refreshed
+    table = ensure_table(bq, tbl_ref, schema, partition_field="date", clustering_fields=["profile_id"],
+                         migrate=args.migrate_tables)
 
-    # --- Overwrite via Load Job ---
-    job_config = LoadJobConfig(
-        schema=schema,
-        write_disposition=WriteDisposition.WRITE_TRUNCATE
-    )
-    load_job = bq.load_table_from_json(
-        all_rows,
-        tbl_ref,
-        job_config=job_config
-    )
-    load_job.result()  # wait for completion
+    changes = ChangeManifest(args.manifest_file, fresh=args.full_reload, table=table)
+    slices = group_rows(all_rows, month_slice)
+
+    if args.incremental:
+        if not all_rows:
+            print("No new rows to merge.")
+            return
+        with instrumentation.stage("load", METRICS_SOURCE):
+            merge_rows(bq, tbl_ref, all_rows, schema, metric_names)
+        # The merged months no longer match the fingerprints of the last full run
+        for slice_key in slices:
+            changes.forget(slice_key)
+        changes.commit()
+        return
+
+    # --- Change Detection ---
+    # Once a full run has been loaded, only the location-months whose rows
+    # differ from it are merged; unchanged ones cost no load job
+    if len(changes):
+        changed = [slice_key for slice_key, rows in slices.items() if changes.changed(slice_key, rows)]
+        print(f"{len(changed)} of {len(slices)} location-month slice(s) changed since the last load.")
+        if changed:
+            changed_rows = [row for slice_key in changed for row in slices[slice_key]]
+            with instrumentation.stage("load", METRICS_SOURCE):
+                merge_rows(bq, tbl_ref, changed_rows, schema, metric_names)
+            changes.commit()
+        return
+
+    # --- Overwrite via Parquet Load Job ---
+    for slice_key, rows in slices.items():
+        changes.changed(slice_key, rows)
+    with instrumentation.stage("load", METRICS_SOURCE):
+        load_rows_as_parquet(bq, all_rows, tbl_ref, schema, WriteDisposition.WRITE_TRUNCATE)
+    changes.commit()
     print(f"Table {tbl_id} overwritten with {len(all_rows)} rows.")
 
 if __name__ == '__main__':
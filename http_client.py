@@ -0,0 +1,124 @@
+from urllib.parse import urlparse
+
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+from rate_limit import limiter_for
+
+# (connect, read) timeout in seconds applied to every request that doesn't set its own
+DEFAULT_TIMEOUT = (10, 60)
+# Connections kept alive per host; size to the number of concurrent workers
+DEFAULT_POOL_SIZE = 10
+
+# Retries for connection errors, 429 and 5xx responses, backing off
+# 1s, 2s, 4s, ... (capped at RETRY_BACKOFF_MAX) unless the response sends Retry-After
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 1
+RETRY_BACKOFF_MAX = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ConnectorRetry(Retry):
+    """
+    urllib3 Retry that also resends non-idempotent requests (POST) on a
+    429: the server rejected them without processing, so it's safe. They
+    are still not retried on 5xx, where the request may have gone through.
+    Every resend takes a token from the host's rate limiter after backing
+    off, a 429 that is retried is reported to the limiter here (the one
+    handed back is reported by ConnectorAdapter), and every retry is
+    counted in the current stage's metrics.
+    """
+
+    # Host of the request being retried, set by increment() for sleep()
+    host = None
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and not self._is_method_retryable(method):
+            return bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # Raises once retries are exhausted, leaving the last response to the adapter
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if _pool is not None:
+            retry.host = _pool.host
+            if response is not None and response.status == 429:
+                limiter_for(_pool.host).concurrency.on_throttle()
+        instrumentation.record(retries=1)
+        return retry
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        # The request keeps its concurrency slot, but each resend is rate limited
+        if self.host is not None:
+            limiter_for(self.host).acquire_token()
+
+
+class ConnectorAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout to requests sent without one
+    and passes every request through its host's rate limiter (token bucket
+    and adaptive concurrency, see rate_limit.py); the slot is held while
+    ConnectorRetry resends it. Requests and response
+    bytes are counted in the current stage's metrics (see instrumentation.py).
+    """
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        limiter = limiter_for(urlparse(request.url).hostname)
+        limiter.acquire()
+        throttled, succeeded = False, False
+        try:
+            response = super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+            throttled = response.status_code == 429
+            succeeded = response.ok
+            # Streamed bodies are left unread; everything else is read here rather than by the session
+            size = len(response.content) if not kwargs.get("stream") else 0
+            instrumentation.record(requests=1, nbytes=size)
+            return response
+        finally:
+            limiter.release(throttled, succeeded)
+
+
+def build_retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF_FACTOR):
+    return ConnectorRetry(
+        total=total,
+        backoff_factor=backoff_factor,
+        backoff_max=RETRY_BACKOFF_MAX,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        # Hand the last response back so callers' raise_for_status() / status
+        # checks report it as before
+        raise_on_status=False,
+    )
+
+
+def mount_adapter(session, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retry=None):
+    """Mounts a pooled, retrying adapter with default timeouts on session; returns the session."""
+    adapter = ConnectorAdapter(
+        timeout=timeout,
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retry or build_retry(),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def make_session(pool_size=DEFAULT_POOL_SIZE, auth=None, timeout=DEFAULT_TIMEOUT):
+    """Keep-alive requests.Session with retries, backoff and default timeouts."""
+    session = requests.Session()
+    session.auth = auth
+    return mount_adapter(session, pool_size, timeout)
+
+
+def make_authorized_session(credentials, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+    """Google AuthorizedSession (token refresh on 401) with the same pooling and retries."""
+    return mount_adapter(AuthorizedSession(credentials), pool_size, timeout)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+
+from google.cloud import bigquery
+
+DEFAULT_INDEX_FILE = "review_index.json"
+
+# Raw review fields that make up a review's content; a change in any of them
+# means the review was edited and has to be reloaded.
+FINGERPRINT_FIELDS = ("author", "rating", "timestamp", "text", "author_avatar")
+# Fields that make up a place's loaded reviews, for change_manifest fingerprints
+PLACE_FINGERPRINT_FIELDS = ("rid",) + FINGERPRINT_FIELDS
+
+
+def review_fingerprint(review):
+    content = json.dumps(
+        {field: review.get(field) for field in FINGERPRINT_FIELDS},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def review_key(review):
+    """
+    The key a review is indexed and merged on: its rid or, for a review
+    returned without one, "sha1:" plus its fingerprint.
+    """
+    return review.get("rid") or f"sha1:{review_fingerprint(review)}"
+
+
+def keyed_reviews(reviews):
+    """
+    Sets every review's "rid" to its review_key() and drops repeats of a
+    key, so a MERGE never finds more than one staged row for a target row.
+    """
+    keyed = {}
+    for review in reviews:
+        review["rid"] = review_key(review)
+        keyed.setdefault(review["rid"], review)
+    return list(keyed.values())
+
+
+class ReviewIndex:
+    """
+    Local index of the reviews already loaded, as {place_id: {rid: fingerprint}}.
+
+    changed() returns only the reviews that are new or edited since the last
+    committed run; their fingerprints are held back until commit(), which is
+    called once the reviews are safely merged so a failed load is retried.
+    A missing index just means every review is treated as new; fresh=True
+    ignores the existing file, for runs that replace the whole table.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_FILE, fresh=False):
+        self.path = path
+        self.places = {}
+        self._pending = []
+        if not fresh and os.path.exists(path):
+            with open(path) as f:
+                self.places = json.load(f)
+
+    def __contains__(self, place_id):
+        return place_id in self.places
+
+    def changed(self, place_id, reviews):
+        known = self.places.get(place_id, {})
+        changed = []
+        for review in reviews:
+            rid = review_key(review)
+            fingerprint = review_fingerprint(review)
+            if known.get(rid) != fingerprint:
+                changed.append(review)
+                self._pending.append((place_id, rid, fingerprint))
+        return changed
+
+    def commit(self):
+        for place_id, rid, fingerprint in self._pending:
+            self.places.setdefault(place_id, {})[rid] = fingerprint
+        self._pending = []
+        # Write to a temp file and rename so a crash never leaves a truncated index.
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.places, f)
+        os.replace(tmp_path, self.path)
+
+
+def merge_staged_reviews(client, dataset_id, staging_table, table_name, columns, key_columns,
+                         scope=None):
+    """
+    Upserts the staged reviews into the target table on key_columns with a
+    single MERGE. The caller drops the staging table (see
+    bq_tables.staging_table).
+
+    scope=(column, values) replaces those slices of the target outright:
+    rows whose column is in values but that are not staged are deleted.
+    """
+    project = client.project
+    target = f"`{project}.{dataset_id}.{table_name}`"
+    staging = f"`{project}.{dataset_id}.{staging_table}`"
+    on_clause = " AND ".join(f"T.{c} = S.{c}" for c in key_columns)
+    update_set = ", ".join(f"{c} = S.{c}" for c in columns if c not in key_columns)
+    insert_columns = ", ".join(columns)
+    insert_values = ", ".join(f"S.{c}" for c in columns)
+    merge_sql = f"""
+        MERGE {target} T
+        USING {staging} S
+        ON {on_clause}
+        WHEN MATCHED THEN UPDATE SET {update_set}
+        WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values})
+    """
+    job_config = None
+    if scope is not None:
+        scope_column, scope_values = scope
+        merge_sql += f"    WHEN NOT MATCHED BY SOURCE AND T.{scope_column} IN UNNEST(@scope) THEN DELETE\n"
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter("scope", "STRING", sorted(scope_values)),
+        ])
+    merge_job = client.query(merge_sql, job_config=job_config)
+    merge_job.result()  # Wait for the job to complete
+    print(f"Merged staged reviews into {table_name} "
+          f"({merge_job.num_dml_affected_rows} rows affected).")
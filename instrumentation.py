@@ -0,0 +1,373 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# How often the resident set size is sampled while any stage is running
+RSS_SAMPLE_SECONDS = 0.01
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it can't be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # No procfs (macOS): fall back to the high-water mark, which never goes down
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Counters:
+    """Totals for one stage, or for one key (location, property, table...) within it."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.requests = 0
+        self.retries = 0
+
+    def as_dict(self):
+        return {"seconds": round(self.seconds, 6), "rows": self.rows, "bytes": self.bytes,
+                "requests": self.requests, "retries": self.retries}
+
+
+class StageStats(Counters):
+    def __init__(self, source, name):
+        super().__init__()
+        self.source = source
+        self.name = name
+        self.peak_rss = None
+        self.keys = {}
+
+    def key(self, key):
+        key = str(key)
+        if key not in self.keys:
+            self.keys[key] = Counters()
+        return self.keys[key]
+
+    def as_dict(self):
+        return dict(super().as_dict(), source=self.source, stage=self.name, peak_rss_bytes=self.peak_rss,
+                    keys={key: counters.as_dict() for key, counters in self.keys.items()})
+
+
+class _Frame:
+    def __init__(self, stats, key=None, timed=None):
+        self.stats = stats
+        self.key = key
+        # Counters whose seconds this frame accrues, or None for a frame that only carries context
+        self.timed = timed
+        # A nested stage stops the clock of the frame it runs in; a key doesn't
+        self.pauses_parent = timed is stats
+        self.started = None
+
+
+_stages = {}
+_active = {}  # StageStats -> number of threads currently inside it
+_lock = threading.Lock()
+_local = threading.local()
+_sampler = None
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _stage_stats(source, name):
+    with _lock:
+        if (source, name) not in _stages:
+            _stages[(source, name)] = StageStats(source, name)
+        return _stages[(source, name)]
+
+
+def _sample_rss(stats_list):
+    rss = current_rss()
+    if rss is None:
+        return
+    with _lock:
+        for stats in stats_list:
+            stats.peak_rss = rss if stats.peak_rss is None else max(stats.peak_rss, rss)
+
+
+def _sample_forever():
+    while True:
+        time.sleep(RSS_SAMPLE_SECONDS)
+        with _lock:
+            active = list(_active)
+        if active:
+            _sample_rss(active)
+
+
+@contextmanager
+def _push(frame):
+    """
+    Makes frame the thread's current one. Time spent in a nested stage is
+    not counted towards the enclosing stage or key, so stage seconds are
+    exclusive of each other on the same thread; key seconds are a
+    breakdown of their stage's time.
+    """
+    global _sampler
+    stack = _stack()
+    with _lock:
+        now = time.perf_counter()
+        if frame.pauses_parent and stack and stack[-1].timed is not None:
+            stack[-1].timed.seconds += now - stack[-1].started
+        frame.started = now
+        stack.append(frame)
+        first = frame.stats.peak_rss is None
+        _active[frame.stats] = _active.get(frame.stats, 0) + 1
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_forever, daemon=True)
+            _sampler.start()
+    if first:
+        _sample_rss([frame.stats])
+    try:
+        yield frame.stats
+    finally:
+        with _lock:
+            now = time.perf_counter()
+            stack.pop()
+            if frame.timed is not None:
+                frame.timed.seconds += now - frame.started
+            _active[frame.stats] -= 1
+            if not _active[frame.stats]:
+                del _active[frame.stats]
+            if frame.pauses_parent and stack:
+                stack[-1].started = now
+
+
+@contextmanager
+def stage(name, source=None):
+    """
+    Times a pipeline stage ("fetch", "transform", "load"...) of a source
+    and tracks the process's peak RSS while it runs. Rows, bytes, requests
+    and retries recorded on this thread inside it are added to the stage.
+    Re-entering a stage adds to its totals; entering the stage the thread
+    is already in (e.g. on a worker it was propagated to) is not timed
+    again. Without a source, the current stage's source is used; outside
+    any stage this does nothing.
+    """
+    stack = _stack()
+    source = source or (stack[-1].stats.source if stack else None)
+    if source is None:
+        yield None
+        return
+    stats = _stage_stats(source, name)
+    timed = None if stack and stack[-1].stats is stats else stats
+    with _push(_Frame(stats, timed=timed)) as stats:
+        yield stats
+
+
+@contextmanager
+def key(key):
+    """
+    Times work for one key (location, property, shard...) of the current
+    stage; requests, bytes and retries inside it count towards both the
+    key and the stage. Outside any stage this does nothing.
+    """
+    stack = _stack()
+    if not stack:
+        yield None
+        return
+    stats = stack[-1].stats
+    with _lock:
+        counters = stats.key(key)
+    with _push(_Frame(stats, key=str(key), timed=counters)):
+        yield counters
+
+
+def propagate(fn):
+    """
+    Wraps fn so that, on a worker thread, it runs inside the caller's
+    current stage (without adding the worker's time to the stage itself).
+    """
+    stack = _stack()
+    if not stack:
+        return fn
+    stats = stack[-1].stats
+
+    def run(*args, **kwargs):
+        with _push(_Frame(stats)):
+            return fn(*args, **kwargs)
+    return run
+
+
+def record(rows=0, nbytes=0, requests=0, retries=0, seconds=0.0, key=None):
+    """
+    Adds counts to the thread's current stage and key (or to `key` of the
+    current stage); seconds only apply to the key. Does nothing outside a
+    stage.
+    """
+    stack = _stack()
+    if not stack:
+        return
+    frame = stack[-1]
+    with _lock:
+        targets = [frame.stats]
+        if key is not None:
+            targets.append(frame.stats.key(key))
+        elif frame.key is not None:
+            targets.append(frame.stats.key(frame.key))
+        for counters in targets:
+            counters.rows += rows
+            counters.bytes += nbytes
+            counters.requests += requests
+            counters.retries += retries
+        if len(targets) > 1:
+            targets[1].seconds += seconds
+
+
+# ---- Export ----
+
+def snapshot():
+    with _lock:
+        stages = [stats.as_dict() for _, stats in sorted(_stages.items())]
+    return {"generated_at": time.time(), "stages": stages}
+
+
+def merge_snapshot(data):
+    """
+    Adds a snapshot() taken in another process (a worker of a sharded run)
+    to this process's stages and keys. Stage seconds are left out, since
+    the parent times the stage it waits for its workers in itself; key
+    seconds, a breakdown of the workers' time, are added. Peak RSS is the
+    highest of any process.
+    """
+    for stage_data in data["stages"]:
+        stats = _stage_stats(stage_data["source"], stage_data["stage"])
+        with _lock:
+            targets = [(stats, stage_data)] + [
+                (stats.key(key), counters) for key, counters in stage_data["keys"].items()
+            ]
+            for counters, values in targets:
+                counters.rows += values["rows"]
+                counters.bytes += values["bytes"]
+                counters.requests += values["requests"]
+                counters.retries += values["retries"]
+                if counters is not stats:
+                    counters.seconds += values["seconds"]
+            if stage_data["peak_rss_bytes"] is not None:
+                stats.peak_rss = max(stats.peak_rss or 0, stage_data["peak_rss_bytes"])
+
+
+def write_json(path):
+    data = snapshot()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# (metric suffix, field, help) exported per stage and per key
+PROMETHEUS_FIELDS = [
+    ("seconds", "seconds", "Seconds spent in the stage, excluding nested stages on the same thread."),
+    ("rows", "rows", "Rows processed."),
+    ("bytes", "bytes", "Bytes transferred: HTTP response bodies, or load job input bytes."),
+    ("requests", "requests", "HTTP requests sent."),
+    ("retries", "retries", "Requests retried after a 429, 5xx or connection error."),
+]
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items())
+
+
+def prometheus_text(data=None):
+    """Renders a snapshot in the Prometheus text exposition format."""
+    data = data or snapshot()
+    lines = []
+
+    def family(name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{{{labels}}} {value}")
+
+    for suffix, field, help_text in PROMETHEUS_FIELDS:
+        family(f"connector_stage_{suffix}", help_text, [
+            (_labels(source=s["source"], stage=s["stage"]), s[field]) for s in data["stages"]
+        ])
+    family("connector_stage_peak_rss_bytes", "Peak resident set size of the process while the stage ran.", [
+        (_labels(source=s["source"], stage=s["stage"]), s["peak_rss_bytes"])
+        for s in data["stages"] if s["peak_rss_bytes"] is not None
+    ])
+    for suffix, field, help_text in PROMETHEUS_FIELDS:
+        family(f"connector_key_{suffix}", f"{help_text} Per location, property, shard or table.", [
+            (_labels(source=s["source"], stage=s["stage"], key=k), counters[field])
+            for s in data["stages"] for k, counters in s["keys"].items()
+        ])
+    family("connector_metrics_generated_timestamp_seconds", "When these metrics were written.", [
+        (_labels(source=source), data["generated_at"])
+        for source in sorted({s["source"] for s in data["stages"]})
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path):
+    """Writes the metrics for node_exporter's textfile collector, replacing the file atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def add_arguments(parser):
+    parser.add_argument("--metrics-json", help="Write per-stage metrics to this JSON file when the run ends.")
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Write per-stage metrics in Prometheus text format (node_exporter textfile collector) when the run ends."
+    )
+
+
+def export(args):
+    """Writes the files requested with add_arguments()."""
+    if args.metrics_json:
+        write_json(args.metrics_json)
+        print(f"Metrics written to {args.metrics_json}.")
+    if args.metrics_textfile:
+        write_prometheus_textfile(args.metrics_textfile)
+        print(f"Metrics written to {args.metrics_textfile}.")
+
+
+_exports = threading.local()
+
+
+def export_on_return(args):
+    """Has the files requested with add_arguments() written when the current main() returns (see exports_metrics)."""
+    _exports.args = args
+
+
+def exports_metrics(main):
+    """
+    Decorates a connector's main(): the files it asked for with
+    export_on_return() are written when it returns, raises or exits.
+    This also covers main() called in-process (run_all.py, Airflow
+    tasks), where the process may end without running atexit handlers.
+    """
+    @functools.wraps(main)
+    def run(*args, **kwargs):
+        outer = getattr(_exports, "args", None)
+        _exports.args = None
+        try:
+            return main(*args, **kwargs)
+        finally:
+            if _exports.args is not None:
+                export(_exports.args)
+            _exports.args = outer
+    return run
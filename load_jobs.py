@@ -0,0 +1,124 @@
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import bigquery
+
+import instrumentation
+from bq_tables import partition_ref
+from parquet_sink import DEFAULT_CHUNK_ROWS, STAGING_DIR, stage_parquet, start_parquet_load
+
+# Staged files uploaded at once; the load jobs themselves then run in parallel on BigQuery
+MAX_UPLOADS = 4
+
+LoadResult = namedtuple(
+    "LoadResult", ["table_id", "rows", "input_bytes", "upload_seconds", "job_seconds", "error"]
+)
+
+
+class LoadJobError(Exception):
+    """Raised by LoadJobManager.wait() when any load job of the run failed."""
+
+
+class LoadJobManager:
+    """
+    Submits all load jobs of a run without blocking on each one, then
+    waits for them together in wait().
+
+    Staged Parquet files are uploaded on a small thread pool. Each upload
+    returns as soon as BigQuery has the file and the job runs server-side,
+    so uploads and load jobs for different tables overlap.
+    """
+
+    def __init__(self, client, max_uploads=MAX_UPLOADS):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_uploads)
+        self._submitted = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+    def submit_file(self, path, destination, schema, write_disposition):
+        """Uploads a staged Parquet file in the background and starts its load job; the file is removed after upload."""
+        future = self._executor.submit(self._upload, path, destination, schema, write_disposition)
+        self._submitted.append((destination.table_id, future))
+
+    def submit_rows(self, rows, destination, schema, write_disposition,
+                    chunk_rows=DEFAULT_CHUNK_ROWS, staging_dir=STAGING_DIR):
+        """Stages rows as Parquet (in the calling thread, so generators are fine) and submits the file."""
+        path = stage_parquet(rows, schema, destination.table_id, staging_dir, chunk_rows)
+        self.submit_file(path, destination, schema, write_disposition)
+
+    def _upload(self, path, destination, schema, write_disposition):
+        start = time.perf_counter()
+        try:
+            load_job = start_parquet_load(self.client, path, destination, schema, write_disposition)
+        finally:
+            os.remove(path)
+        return load_job, time.perf_counter() - start
+
+    def wait(self):
+        """
+        Waits for every submitted job and prints its rows, upload size and
+        timing, recording them per table in the current stage's metrics.
+        Returns a LoadResult per job, in submission order; raises
+        LoadJobError once all jobs have finished if any of them failed.
+        """
+        results = []
+        for table_id, future in self._submitted:
+            load_job, upload_seconds, error = None, None, None
+            try:
+                load_job, upload_seconds = future.result()
+                load_job.result()  # Wait for the job to complete
+            except Exception as e:
+                error = (load_job.errors if load_job is not None else None) or str(e)
+            job_seconds = None
+            if load_job is not None and load_job.started and load_job.ended:
+                job_seconds = (load_job.ended - load_job.started).total_seconds()
+            loaded = load_job is not None and not error
+            results.append(LoadResult(
+                table_id,
+                rows=(load_job.output_rows or 0) if loaded else 0,
+                input_bytes=(load_job.input_file_bytes or 0) if loaded else 0,
+                upload_seconds=upload_seconds,
+                job_seconds=job_seconds,
+                error=error,
+            ))
+        self._submitted = []
+        for result in results:
+            instrumentation.record(rows=result.rows, nbytes=result.input_bytes,
+                                   seconds=(result.upload_seconds or 0) + (result.job_seconds or 0),
+                                   key=result.table_id)
+
+        print(f"{'table':<40}{'rows':>12}{'MiB':>10}{'upload s':>10}{'job s':>10}  status")
+        for result in results:
+            upload = f"{result.upload_seconds:.1f}" if result.upload_seconds is not None else "-"
+            job = f"{result.job_seconds:.1f}" if result.job_seconds is not None else "-"
+            status = f"FAILED: {result.error}" if result.error else "ok"
+            print(f"{result.table_id:<40}{result.rows:>12}{result.input_bytes / 2**20:>10.1f}"
+                  f"{upload:>10}{job:>10}  {status}")
+
+        failed = [result.table_id for result in results if result.error]
+        if failed:
+            raise LoadJobError(f"{len(failed)} of {len(results)} load job(s) failed: {failed}")
+        return results
+
+
+def submit_partition_files(loads, paths, table, schema, write_disposition):
+    """
+    Submits each file from write_parquet_partitions() to its own day
+    partition (table$YYYYMMDD), so WRITE_TRUNCATE replaces only those days.
+    A table that is not partitioned (not migrated yet) is appended to instead.
+    """
+    for day, path in sorted(paths.items()):
+        if table.time_partitioning:
+            loads.submit_file(path, partition_ref(table, day), schema, write_disposition)
+        else:
+            loads.submit_file(path, table, schema, bigquery.WriteDisposition.WRITE_APPEND)
@@ -0,0 +1,190 @@
+import os
+import tempfile
+from itertools import islice
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+import instrumentation
+
+# Local directory the Parquet files are written to before upload; each file
+# is removed once its load job finishes.
+STAGING_DIR = "bq_staging"
+# Rows converted and written per Parquet row group; bounds the rows held in memory
+DEFAULT_CHUNK_ROWS = 50000
+DEFAULT_COMPRESSION = "zstd"
+
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+    "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+}
+
+
+def arrow_schema(schema):
+    """Arrow schema for a list of BigQuery SchemaFields (REQUIRED -> non-nullable)."""
+    return pa.schema([
+        pa.field(field.name, ARROW_TYPES[field.field_type], nullable=field.mode != "REQUIRED")
+        for field in schema
+    ])
+
+
+def _column(values, field):
+    arrow_type = ARROW_TYPES[field.field_type]
+    if field.field_type not in ("DATE", "TIMESTAMP"):
+        return pa.array(values, type=arrow_type)
+    # The APIs return dates and timestamps as ISO strings ("2025-04-05",
+    # "2025-04-05 10:00:00", "2025-04-05T10:00:00Z"); anything else is NULL.
+    parsed = pd.to_datetime(pd.Series(values, dtype="object"), errors="coerce", utc=True, format="ISO8601")
+    timestamps = pa.array(parsed, type=pa.timestamp("us", tz="UTC"))
+    return timestamps.cast(arrow_type) if field.field_type == "DATE" else timestamps
+
+
+def rows_to_table(rows, schema):
+    """
+    Converts a list of row dicts to an Arrow table with the given BigQuery
+    schema. Keys not in the schema are dropped; missing keys become NULL.
+    """
+    columns = [_column([row.get(field.name) for row in rows], field) for field in schema]
+    return pa.Table.from_arrays(columns, schema=arrow_schema(schema))
+
+
+def write_parquet(rows, schema, path, chunk_rows=DEFAULT_CHUNK_ROWS, compression=DEFAULT_COMPRESSION):
+    """
+    Writes an iterable of row dicts to a Parquet file, one row group per
+    chunk_rows rows, so only one chunk is held in memory. Returns the
+    number of rows written.
+    """
+    rows = iter(rows)
+    total = 0
+    with pq.ParquetWriter(path, arrow_schema(schema), compression=compression) as writer:
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            writer.write_table(rows_to_table(chunk, schema))
+            total += len(chunk)
+    return total
+
+
+def write_parquet_partitions(rows, schema, partition_field, staging_dir=STAGING_DIR,
+                             chunk_rows=DEFAULT_CHUNK_ROWS, compression=DEFAULT_COMPRESSION):
+    """
+    Writes an iterable of row dicts to one Parquet file per day of
+    partition_field in staging_dir. Each day buffers at most chunk_rows rows
+    before they are written out as a row group. Returns {date: path}.
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    days = {}
+    buffers = {}
+    writers = {}
+    paths = {}
+
+    def write(day):
+        if day not in writers:
+            fd, paths[day] = tempfile.mkstemp(dir=staging_dir, prefix=f"{day:%Y%m%d}_", suffix=".parquet")
+            os.close(fd)
+            writers[day] = pq.ParquetWriter(paths[day], arrow_schema(schema), compression=compression)
+        writers[day].write_table(rows_to_table(buffers[day], schema))
+        buffers[day] = []
+
+    try:
+        for row in rows:
+            value = row[partition_field]
+            if value not in days:
+                days[value] = pd.Timestamp(value).date()
+            day = days[value]
+            buffers.setdefault(day, []).append(row)
+            if len(buffers[day]) >= chunk_rows:
+                write(day)
+        for day, buffered in buffers.items():
+            if buffered:
+                write(day)
+    except BaseException:
+        for path in paths.values():
+            os.remove(path)
+        raise
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return paths
+
+
+def merge_partition_files(partition_maps, schema, staging_dir=STAGING_DIR, compression=DEFAULT_COMPRESSION):
+    """
+    Combines several write_parquet_partitions() results (e.g. one per
+    worker process) into one file per day, copying row groups without
+    converting them again. The per-worker files of days that had to be
+    combined are removed. Returns {date: path}.
+    """
+    by_day = {}
+    for paths in partition_maps:
+        for day, path in paths.items():
+            by_day.setdefault(day, []).append(path)
+    merged = {}
+    for day, paths in by_day.items():
+        if len(paths) == 1:
+            merged[day] = paths[0]
+            continue
+        fd, merged[day] = tempfile.mkstemp(dir=staging_dir, prefix=f"{day:%Y%m%d}_", suffix=".parquet")
+        os.close(fd)
+        with pq.ParquetWriter(merged[day], arrow_schema(schema), compression=compression) as writer:
+            for path in paths:
+                parquet_file = pq.ParquetFile(path)
+                for i in range(parquet_file.num_row_groups):
+                    writer.write_table(parquet_file.read_row_group(i))
+        for path in paths:
+            os.remove(path)
+    return merged
+
+
+def stage_parquet(rows, schema, name, staging_dir=STAGING_DIR, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Writes rows to a new Parquet file in staging_dir named after `name`; returns its path."""
+    os.makedirs(staging_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=staging_dir, prefix=f"{name}_", suffix=".parquet")
+    os.close(fd)
+    try:
+        write_parquet(rows, schema, path, chunk_rows=chunk_rows)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def start_parquet_load(client, path, table_ref, schema, write_disposition):
+    """Uploads a Parquet file and returns its load job without waiting for it."""
+    job_config = bigquery.LoadJobConfig(
+        schema=schema,
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition=write_disposition,
+    )
+    with open(path, "rb") as f:
+        return client.load_table_from_file(f, table_ref, job_config=job_config)
+
+
+def load_rows_as_parquet(client, rows, table_ref, schema, write_disposition,
+                         chunk_rows=DEFAULT_CHUNK_ROWS, staging_dir=STAGING_DIR):
+    """
+    Loads an iterable of row dicts into table_ref with a single load job:
+    the rows are written to a typed, compressed Parquet file in staging_dir
+    and uploaded with load_table_from_file. Returns the finished load job
+    and records its rows and size under the table in the current stage's
+    metrics.
+    """
+    path = stage_parquet(rows, schema, table_ref.table_id, staging_dir, chunk_rows)
+    try:
+        load_job = start_parquet_load(client, path, table_ref, schema, write_disposition)
+    finally:
+        os.remove(path)
+    load_job.result()  # Wait for the job to complete
+    instrumentation.record(rows=load_job.output_rows or 0, nbytes=load_job.input_file_bytes or 0,
+                           key=table_ref.table_id)
+    return load_job
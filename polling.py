@@ -0,0 +1,13 @@
+import random
+
+
+def backoff_delays(initial, maximum, factor=2.0, jitter=0.25):
+    """
+    Yields sleep intervals that start at `initial` seconds and grow by
+    `factor` up to `maximum`. Each interval is randomised by +/- `jitter`
+    (a fraction) so concurrent pollers don't hit the API in lockstep.
+    """
+    delay = initial
+    while True:
+        yield min(delay * random.uniform(1 - jitter, 1 + jitter), maximum)
+        delay = min(delay * factor, maximum)
@@ -0,0 +1,137 @@
+import threading
+import time
+
+# Sustained requests per second and burst size per API host. These are
+# starting points below each vendor's documented per-project limits; a
+# host missing here gets adaptive concurrency only.
+HOST_RATES = {
+    "tools.brightlocal.com": (5, 10),
+    "app.whatconverts.com": (5, 10),
+    "businessprofileperformance.googleapis.com": (5, 10),
+    "analyticsdata.googleapis.com": (10, 10),
+}
+
+# Adaptive concurrency per host: start here, add one slot per window of
+# successful requests, multiply by AIMD_DECREASE on a 429 (at most once per
+# AIMD_COOLDOWN_SECONDS, so one burst of 429s counts once).
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 64
+AIMD_DECREASE = 0.5
+AIMD_COOLDOWN_SECONDS = 1.0
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, in bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase / multiplicative decrease.
+
+    Each successful request adds 1/limit, so the limit grows by one slot per
+    window of `limit` successes; a throttled request multiplies it by
+    `decrease`. acquire() blocks while `limit` requests are in flight.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY,
+                 maximum=MAX_CONCURRENCY, decrease=AIMD_DECREASE,
+                 cooldown=AIMD_COOLDOWN_SECONDS, clock=time.monotonic):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.acquired = 0
+        self.throttles = 0
+        self._clock = clock
+        self._last_decrease = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.acquired += 1
+
+    def release(self, throttled=False, succeeded=True):
+        """Frees a slot; only successes grow the limit, errors leave it as is."""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.on_throttle()
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.throttles += 1
+            now = self._clock()
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class HostLimiter:
+    """Token bucket (if the host has a configured rate) plus AIMD concurrency for one API host."""
+
+    def __init__(self, host, rate=None, burst=None):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AIMDLimiter()
+
+    def acquire(self):
+        self.concurrency.acquire()
+        self.acquire_token()
+
+    def acquire_token(self):
+        """Waits for the host's rate (if it has one) without taking a concurrency slot, e.g. to resend."""
+        if self.bucket:
+            self.bucket.acquire()
+
+    def release(self, throttled=False, succeeded=True):
+        self.concurrency.release(throttled, succeeded)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(host):
+    """Returns the process-wide limiter for an API host, creating it on first use."""
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(host, *HOST_RATES.get(host, (None, None)))
+        return _limiters[host]
+
+
+def print_rate_report():
+    """Prints requests, 429s and the concurrency each host settled at."""
+    for host, limiter in sorted(_limiters.items()):
+        print(f"{host}: {limiter.concurrency.acquired} request(s), {limiter.concurrency.throttles} throttled, "
+              f"concurrency limit {limiter.concurrency.limit:.1f}")
@@ -0,0 +1,259 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+# Local directory raw API responses are kept in:
+#   objects/ab/abcdef...json.gz          gzip-compressed response bodies, named by SHA-256
+#   <source>/<YYYY-MM-DD>/<HHMMSS>.jsonl one manifest per run: entity, metadata and object per line
+#                                        (<HHMMSS>-<name>.jsonl for named runs)
+#   <source>/<YYYY-MM-DD>/<HHMMSS>-<name>.part.jsonl
+#                                        one part per shard of a sharded run; the run's own
+#                                        manifest only lists its parts
+# Identical responses are stored once. Old run directories can be deleted at
+# any time; objects no manifest refers to any more can go with them.
+RAW_STORE_DIR = "raw_responses"
+
+
+def _object_path(root, digest):
+    return os.path.join(root, "objects", digest[:2], f"{digest}.json.gz")
+
+
+def _manifest_path(root, source, started, name=None, part=False):
+    filename = f"{started:%H%M%S}-{name}" if name else f"{started:%H%M%S}"
+    filename += ".part.jsonl" if part else ".jsonl"
+    return os.path.join(root, source, f"{started:%Y-%m-%d}", filename)
+
+
+def _read_parts(root, path):
+    """The part manifests a sharded run's manifest lists, or [path] for an ordinary run."""
+    with open(path) as f:
+        line = f.readline()
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return [path]
+    if "parts" not in record:
+        return [path]
+    return [os.path.join(root, part) for part in record["parts"]]
+
+
+class RawRun:
+    """
+    Write-through store for one run of a connector. put() saves a response
+    body as a compressed, content-addressed object and appends it to the
+    run's manifest; finish() marks the fetch as complete, so the run can
+    be replayed (see Replay).
+    """
+
+    def __init__(self, root, source, started=None, name=None, part=False):
+        started = started or datetime.now()
+        self.root = root
+        self.source = source
+        self.path = _manifest_path(root, source, started, name, part)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._manifest = open(self.path, "a")
+        self._lock = threading.Lock()
+
+    def put(self, entity, data, **meta):
+        """Stores one response body (bytes or str) for entity (location, property, place...)."""
+        if isinstance(data, str):
+            data = data.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        path = _object_path(self.root, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(data))
+            os.replace(tmp_path, path)
+        line = json.dumps({"entity": str(entity), "object": digest, "meta": meta})
+        with self._lock:
+            self._manifest.write(line + "\n")
+            self._manifest.flush()
+
+    def finish(self, errors=None, **info):
+        """
+        Records that every response of the run was fetched, which entities
+        failed, and any run options (info) a replay needs to load the same way.
+        """
+        with self._lock:
+            record = {"finished": True, "errors": errors or {}, "info": info}
+            self._manifest.write(json.dumps(record) + "\n")
+            self._manifest.close()
+        print(f"Raw responses of this run saved in {self.path}.")
+
+
+class Replay:
+    """
+    The stored responses of one or more runs (e.g. the shards of one
+    sharded run), read back in the order they were fetched. The manifest of
+    a sharded run stands for all of its parts. finished is only true if
+    every run (and part) finished; info comes from the first one.
+    """
+
+    def __init__(self, root, paths):
+        self.root = root
+        self.paths = [part for path in paths for part in _read_parts(root, path)]
+        self.entries = []
+        self.finished = True
+        self.errors = {}
+        self.info = {}
+        for i, path in enumerate(self.paths):
+            if not os.path.exists(path):
+                # A worker of a sharded run that never started
+                self.finished = False
+                continue
+            finished = False
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Partial last line of an interrupted run
+                    if record.get("finished"):
+                        finished = True
+                        self.errors.update(record.get("errors") or {})
+                        if i == 0:
+                            self.info = record.get("info") or {}
+                    else:
+                        self.entries.append(record)
+            self.finished = self.finished and finished
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entities(self):
+        """The entities with at least one stored response."""
+        return {record["entity"] for record in self.entries}
+
+    def __iter__(self):
+        """Yields (entity, meta, body bytes) for every stored response."""
+        for record in self.entries:
+            with open(_object_path(self.root, record["object"]), "rb") as f:
+                yield record["entity"], record["meta"], gzip.decompress(f.read())
+
+
+def _worker_name(worker, run_name=None):
+    return f"{run_name}-{worker}" if run_name else worker
+
+
+def write_run_set(root, source, parts, name=None, started=None):
+    """
+    Writes the manifest of a run made of several part manifests (the
+    shards of a sharded run or of a DAG run) and returns its path.
+    Replaying it, including as the latest run, replays every part.
+    """
+    path = _manifest_path(root, source, started or datetime.now(), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(json.dumps({"parts": [os.path.relpath(part, root) for part in parts]}) + "\n")
+    return path
+
+
+def start_sharded_run(root, source, workers, run_name=None):
+    """
+    Writes the manifest of a sharded run before its workers start, listing
+    the part each worker saves (see worker_run), so a worker that dies
+    leaves the run unfinished rather than missing. Returns (started,
+    manifest path), or (started, None) if root is None (store disabled).
+    """
+    started = datetime.now()
+    if root is None:
+        return started, None
+    parts = [_manifest_path(root, source, started, _worker_name(worker, run_name), part=True)
+             for worker in workers]
+    return started, write_run_set(root, source, parts, run_name, started)
+
+
+def worker_run(root, source, worker, run_name=None, started=None):
+    """
+    The RawRun of one worker process of a sharded run (see sharding.py),
+    the part named after the worker, or None if root is None (store disabled).
+    """
+    if root is None:
+        return None
+    return RawRun(root, source, started, _worker_name(worker, run_name), part=True)
+
+
+def find_run(root, source, run="latest"):
+    """
+    Path of a run manifest: the latest run of the source ("latest"), the
+    latest run on a day ("YYYY-MM-DD"), or a manifest path. Parts of a
+    sharded run are never picked on their own, only through their run.
+    """
+    if os.path.isfile(run):
+        return run
+    source_dir = os.path.join(root, source)
+    days = sorted(os.listdir(source_dir)) if os.path.isdir(source_dir) else []
+    if run != "latest":
+        days = [day for day in days if day == run]
+    for day in reversed(days):
+        manifests = sorted(
+            name for name in os.listdir(os.path.join(source_dir, day))
+            if name.endswith(".jsonl") and not name.endswith(".part.jsonl")
+        )
+        if manifests:
+            return os.path.join(source_dir, day, manifests[-1])
+    return None
+
+
+def add_arguments(parser):
+    parser.add_argument("--raw-store", default=RAW_STORE_DIR,
+                        help="Directory the raw API responses are saved in.")
+    parser.add_argument("--no-raw-store", action="store_true",
+                        help="Don't save the raw API responses of this run.")
+    parser.add_argument(
+        "--fetch-only", action="store_true",
+        help="Only fetch and save the raw responses; load them later with --replay. "
+             "main() returns the run's manifest path."
+    )
+    parser.add_argument("--run-name", help="Suffix for this run's manifest, e.g. the shard it fetches.")
+    parser.add_argument(
+        "--run-part", action="store_true",
+        help="Save this run as one part of a larger run (e.g. a DAG shard): it is only replayed "
+             "by path or through the manifest listing all parts, never as the latest run."
+    )
+    parser.add_argument(
+        "--replay", nargs="*", metavar="RUN",
+        help="Rebuild and load the rows from saved responses instead of calling the API: "
+             "the latest run (default), the latest run on a day (YYYY-MM-DD) or manifest paths, "
+             "e.g. one per shard."
+    )
+
+
+def open_run(args, source):
+    """The RawRun to write this run's responses through, or None if disabled or replaying."""
+    if args.fetch_only and (args.no_raw_store or args.replay is not None):
+        print("--fetch-only saves the responses; it can't be combined with --no-raw-store or --replay.")
+        sys.exit(2)
+    if args.no_raw_store or args.replay is not None:
+        return None
+    return RawRun(args.raw_store, source, name=args.run_name, part=args.run_part)
+
+
+def open_replay(args, source):
+    """
+    The Replay requested with --replay, or None. Exits if there is no such
+    run, or if a fetch never finished: reloading part of the responses
+    would overwrite complete data with partial data.
+    """
+    if args.replay is None:
+        return None
+    paths = []
+    for run in args.replay or ["latest"]:
+        path = find_run(args.raw_store, source, run)
+        if path is None:
+            print(f"No saved {source} run matching {run!r} in {args.raw_store}.")
+            sys.exit(1)
+        paths.append(path)
+    replay = Replay(args.raw_store, paths)
+    if not replay.finished:
+        print(f"A run in {paths} did not finish fetching; rerun without --replay.")
+        sys.exit(1)
+    print(f"Replaying {len(replay)} saved response(s) from {', '.join(paths)}.")
+    return replay
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+RATINGS = range(0, 6)
+# Trailing windows (in days, ending at the run date) for the rolling stats
+WINDOWS = (30, 90)
+
+
+def empty_columns():
+    return {"place_id": [], "rating": [], "date": []}
+
+
+def add_reviews(columns, reviews, place_id=None):
+    """
+    Appends the fields the summary needs from raw review dicts: place_id
+    (or the given one), rating, and the review date from "timestamp" or,
+    once mapped for loading, "date".
+    """
+    for review in reviews:
+        columns["place_id"].append(place_id if place_id is not None else review.get("place_id"))
+        columns["rating"].append(review.get("rating"))
+        columns["date"].append(review.get("timestamp") or review.get("date"))
+
+
+def summarize_reviews(columns, as_of=None):
+    """
+    Computes per-place review statistics in one grouped pass:
+    total_reviews, average_rating (sum of ratings over all reviews),
+    rating_0..rating_5 counts, and for each trailing window the review
+    count and average rating of rated reviews.
+    """
+    place_ids = pd.Categorical(pd.Series(columns["place_id"], dtype="object").fillna(""))
+    rating = pd.to_numeric(pd.Series(columns["rating"], dtype="object"), errors="coerce").to_numpy(dtype=float)
+    dates = pd.to_datetime(pd.Series(columns["date"], dtype="object").str[:10], errors="coerce")
+    as_of = pd.Timestamp(as_of or pd.Timestamp.utcnow().date()).normalize()
+    age_days = (as_of - dates).dt.days.to_numpy(dtype=float)
+
+    rated = ~np.isnan(rating)
+    rating_or_zero = np.where(rated, rating, 0.0)
+    features = {
+        "total_reviews": np.ones(len(rating), dtype=np.int64),
+        "rating_sum": rating_or_zero,
+    }
+    for value in RATINGS:
+        features[f"rating_{value}"] = (rating == value).astype(np.int64)
+    for window in WINDOWS:
+        in_window = (age_days >= 0) & (age_days < window)
+        features[f"reviews_last_{window}d"] = in_window.astype(np.int64)
+        features[f"rated_last_{window}d"] = (in_window & rated).astype(np.int64)
+        features[f"rating_sum_last_{window}d"] = np.where(in_window, rating_or_zero, 0.0)
+
+    grouped = pd.DataFrame(features).groupby(place_ids, observed=True).sum()
+
+    summary = pd.DataFrame({"place_id": grouped.index.astype(str)})
+    summary["total_reviews"] = grouped["total_reviews"].to_numpy()
+    summary["average_rating"] = (grouped["rating_sum"] / grouped["total_reviews"]).to_numpy()
+    for value in RATINGS:
+        summary[f"rating_{value}"] = grouped[f"rating_{value}"].to_numpy()
+    for window in WINDOWS:
+        rated_count = grouped[f"rated_last_{window}d"]
+        summary[f"reviews_last_{window}d"] = grouped[f"reviews_last_{window}d"].to_numpy()
+        summary[f"average_rating_last_{window}d"] = (
+            grouped[f"rating_sum_last_{window}d"] / rated_count.where(rated_count > 0)
+        ).to_numpy()
+    summary["batch_timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    return summary
+
+
+def summary_records(summary):
+    """Summary rows as JSON-ready dicts (NaN averages become None)."""
+    return summary.astype(object).where(summary.notna(), None).to_dict("records")
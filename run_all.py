@@ -0,0 +1,133 @@
+"""
+Runs the source connectors concurrently in one process.
+
+Each connector's main() runs on its own worker thread from a single asyncio
+event loop, so the run takes about as long as the slowest source instead
+of the sum of all of them. All connectors share one BigQuery client per
+project, plus the process-wide HTTP sessions and per-host rate limiters.
+A connector that raises or exits non-zero is reported as failed without
+stopping the others. --metrics-json / --metrics-textfile write every
+connector's stage metrics to one file.
+
+    python run_all.py
+    python run_all.py --sources ga,whatconvert
+    python run_all.py --source-args gbp_overwrite="--incremental --lookback-days 3"
+"""
+import argparse
+import asyncio
+import shlex
+import sys
+import threading
+import time
+import traceback
+
+from google.cloud import bigquery
+
+import bright_local
+import bright_local_scaling
+import ga
+import gbp
+import gbp_overwrite
+import instrumentation
+import whatconvert
+
+# Connector entry points, called as fn(argv, clients)
+SOURCES = {
+    "ga": lambda argv, clients: ga.main(argv, bq_client=clients.get(ga.BIGQUERY_PROJECT_ID)),
+    "gbp": lambda argv, clients: gbp.main(argv),
+    "gbp_overwrite": lambda argv, clients: gbp_overwrite.main(argv, bq_client=clients.get()),
+    "whatconvert": lambda argv, clients: whatconvert.main(argv),
+    "bright_local": lambda argv, clients: bright_local.main(argv, bq_client=clients.get()),
+    "bright_local_scaling": lambda argv, clients: bright_local_scaling.main(argv, bq_client=clients.get()),
+}
+# gbp.py only fetches and prints; gbp_overwrite.py fetches the same metrics and loads them
+DEFAULT_SOURCES = ("ga", "gbp_overwrite", "whatconvert", "bright_local", "bright_local_scaling")
+
+
+class SharedClients:
+    """One BigQuery client per project (None = the environment's default), created on first use."""
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, project=None):
+        project = project or None
+        with self._lock:
+            if project not in self._clients:
+                self._clients[project] = bigquery.Client(project=project)
+            return self._clients[project]
+
+
+def run_source(name, argv, clients):
+    """Runs one connector, returning (name, status, seconds); never raises."""
+    start = time.perf_counter()
+    try:
+        SOURCES[name](argv, clients)
+        status = "ok"
+    except SystemExit as e:
+        status = "ok" if e.code in (None, 0) else f"exited with status {e.code}"
+    except Exception as e:
+        traceback.print_exc()
+        status = f"failed: {type(e).__name__}: {e}"
+    return name, status, time.perf_counter() - start
+
+
+async def run_sources(names, source_args, clients):
+    return await asyncio.gather(*(
+        asyncio.to_thread(run_source, name, source_args.get(name, []), clients)
+        for name in names
+    ))
+
+
+def parse_source_args(values):
+    source_args = {}
+    for value in values:
+        name, _, args = value.partition("=")
+        if name not in SOURCES:
+            raise argparse.ArgumentTypeError(f"unknown source {name!r}")
+        source_args[name] = shlex.split(args)
+    return source_args
+
+
+@instrumentation.exports_metrics
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run all source connectors concurrently.")
+    parser.add_argument(
+        "--sources", default=",".join(DEFAULT_SOURCES),
+        help=f"Comma-separated connectors to run, from: {', '.join(SOURCES)}."
+    )
+    parser.add_argument(
+        "--source-args", action="append", default=[], metavar="SOURCE=ARGS",
+        help="Command-line arguments for one connector; repeat per connector."
+    )
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
+    names = [name.strip() for name in args.sources.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(unknown)}")
+    try:
+        source_args = parse_source_args(args.source_args)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_sources(names, source_args, SharedClients()))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'source':<24}{'seconds':>10}  status")
+    for name, status, seconds in results:
+        print(f"{name:<24}{seconds:>10.1f}  {status}")
+    print(f"All sources finished in {elapsed:.1f}s "
+          f"(sum of sources {sum(seconds for _, _, seconds in results):.1f}s).")
+
+    failed = [name for name, status, _ in results if status != "ok"]
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import bisect
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Points per worker on the hash ring; more points spread entities more evenly
+DEFAULT_VNODES = 64
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash assignment of entities (locations, properties...) to
+    workers. Each worker owns DEFAULT_VNODES points on a ring, and an entity
+    goes to the owner of the first point at or after its hash, so adding or
+    removing a worker only moves the entities next to that worker's points
+    (about 1/N of them) instead of reshuffling everything.
+    """
+
+    def __init__(self, workers, vnodes=DEFAULT_VNODES):
+        self.workers = list(workers)
+        if not self.workers:
+            raise ValueError("a hash ring needs at least one worker")
+        points = sorted((_hash(f"{worker}#{i}"), worker) for worker in self.workers for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def worker_for(self, entity):
+        i = bisect.bisect_left(self._hashes, _hash(entity))
+        return self._owners[i % len(self._owners)]
+
+    def assign(self, entities):
+        """Returns {worker: [entity, ...]} for every worker, keeping the entities' order."""
+        shards = {worker: [] for worker in self.workers}
+        for entity in entities:
+            shards[self.worker_for(entity)].append(entity)
+        return shards
+
+
+def worker_names(count):
+    return [f"worker{i}" for i in range(count)]
+
+
+def run_sharded(fn, shards, *args):
+    """
+    Runs fn(worker, entities, *args) in its own process for every non-empty
+    shard of HashRing.assign() and returns {worker: result}. fn and args
+    must be picklable (module-level functions); processes are spawned, not
+    forked, so they don't inherit the parent's threads or open connections.
+    """
+    shards = {worker: entities for worker, entities in shards.items() if entities}
+    if not shards:
+        return {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+        futures = {
+            worker: executor.submit(fn, worker, entities, *args) for worker, entities in shards.items()
+        }
+        return {worker: future.result() for worker, future in futures.items()}
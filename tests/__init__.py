@@ -0,0 +1,8 @@
+"""
+Unit tests of the connectors' pure logic: planning, sharding, row
+assembly, aggregation, change detection, rate limiting and the raw
+response store. They need no credentials or network access.
+
+Run from the repository root:
+    python -m unittest discover -s tests -t .
+"""
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from change_manifest import ChangeManifest, group_rows, rows_fingerprint
+
+ROWS = [{"profile_id": "a", "date": "2025-01-01", "calls": 1}, {"profile_id": "a", "date": "2025-01-02", "calls": 2}]
+
+
+def table(created=datetime(2025, 1, 1), num_rows=10):
+    return SimpleNamespace(table_id="t", created=created, num_rows=num_rows)
+
+
+class RowsFingerprintTest(unittest.TestCase):
+    def test_ignores_row_order(self):
+        self.assertEqual(rows_fingerprint(ROWS), rows_fingerprint(list(reversed(ROWS))))
+
+    def test_changes_with_any_value(self):
+        edited = [dict(ROWS[0], calls=5), ROWS[1]]
+        self.assertNotEqual(rows_fingerprint(ROWS), rows_fingerprint(edited))
+
+    def test_only_counts_the_given_fields(self):
+        edited = [dict(row, calls=0) for row in ROWS]
+        self.assertEqual(rows_fingerprint(ROWS, ["profile_id", "date"]), rows_fingerprint(edited, ["profile_id", "date"]))
+
+    def test_group_rows_keeps_first_seen_order(self):
+        rows = [{"k": "b"}, {"k": "a"}, {"k": "b"}]
+        self.assertEqual(list(group_rows(rows, lambda row: row["k"]).items()),
+                         [("b", [{"k": "b"}, {"k": "b"}]), ("a", [{"k": "a"}])])
+
+
+class ChangeManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+
+    def committed(self, **kwargs):
+        manifest = ChangeManifest(self.path, **kwargs)
+        self.assertTrue(manifest.changed("a/2025-01", ROWS))
+        manifest.commit()
+
+    def test_unchanged_slices_are_skipped_once_committed(self):
+        manifest = ChangeManifest(self.path)
+        self.assertTrue(manifest.changed("a/2025-01", ROWS))
+        # Not committed yet: a failed load is retried
+        self.assertTrue(ChangeManifest(self.path).changed("a/2025-01", ROWS))
+        manifest.commit()
+        self.assertFalse(ChangeManifest(self.path).changed("a/2025-01", ROWS))
+        self.assertTrue(ChangeManifest(self.path).changed("a/2025-01", ROWS[:1]))
+
+    def test_forget_reloads_a_slice(self):
+        self.committed()
+        manifest = ChangeManifest(self.path)
+        manifest.forget("a/2025-01")
+        manifest.commit()
+        self.assertEqual(len(ChangeManifest(self.path)), 0)
+
+    def test_fresh_ignores_the_file(self):
+        self.committed()
+        self.assertTrue(ChangeManifest(self.path, fresh=True).changed("a/2025-01", ROWS))
+
+    def test_kept_while_the_table_is_the_same(self):
+        self.committed(table=table())
+        self.assertFalse(ChangeManifest(self.path, table=table()).changed("a/2025-01", ROWS))
+
+    def test_ignored_once_the_table_is_recreated(self):
+        self.committed(table=table())
+        manifest = ChangeManifest(self.path, table=table(created=datetime(2025, 2, 1)))
+        self.assertEqual(len(manifest), 0)
+
+    def test_ignored_when_the_table_is_empty(self):
+        self.committed(table=table())
+        self.assertEqual(len(ChangeManifest(self.path, table=table(num_rows=0))), 0)
+
+    def test_manifests_without_a_table_are_reset_once(self):
+        with open(self.path, "w") as f:
+            json.dump({"a/2025-01": rows_fingerprint(ROWS)}, f)
+        self.assertEqual(len(ChangeManifest(self.path)), 1)
+        self.assertEqual(len(ChangeManifest(self.path, table=table())), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from ga import day_key, load_backfill_state, plan_backfill_units, unit_day_keys
+
+
+class PlanBackfillUnitsTest(unittest.TestCase):
+    def test_splits_every_property_into_runs_of_days(self):
+        units = plan_backfill_units(["1", "2"], date(2025, 1, 1), date(2025, 1, 5), days_per_unit=2)
+        self.assertEqual(units, [
+            ("1", "2025-01-01", "2025-01-02"),
+            ("1", "2025-01-03", "2025-01-04"),
+            ("1", "2025-01-05", "2025-01-05"),
+            ("2", "2025-01-01", "2025-01-02"),
+            ("2", "2025-01-03", "2025-01-04"),
+            ("2", "2025-01-05", "2025-01-05"),
+        ])
+
+    def test_completed_days_split_units(self):
+        completed = {day_key("1", "2025-01-02"), day_key("1", "2025-01-03")}
+        units = plan_backfill_units(["1"], date(2025, 1, 1), date(2025, 1, 5), days_per_unit=30,
+                                    completed=completed)
+        self.assertEqual(units, [("1", "2025-01-01", "2025-01-01"), ("1", "2025-01-04", "2025-01-05")])
+
+    def test_resumes_with_another_unit_size(self):
+        first = plan_backfill_units(["1"], date(2025, 1, 1), date(2025, 1, 10), days_per_unit=4)
+        completed = set(unit_day_keys(first[0]))
+        units = plan_backfill_units(["1"], date(2025, 1, 1), date(2025, 1, 10), days_per_unit=3,
+                                    completed=completed)
+        self.assertEqual(units, [("1", "2025-01-05", "2025-01-07"), ("1", "2025-01-08", "2025-01-10")])
+
+    def test_nothing_left_once_every_day_is_completed(self):
+        completed = set(unit_day_keys(("1", "2025-01-01", "2025-01-31")))
+        self.assertEqual(plan_backfill_units(["1"], date(2025, 1, 1), date(2025, 1, 31), completed=completed), [])
+
+
+class LoadBackfillStateTest(unittest.TestCase):
+    def test_missing_file_means_nothing_completed(self):
+        self.assertEqual(load_backfill_state(os.path.join(tempfile.mkdtemp(), "state.json")), set())
+
+    def test_expands_unit_checkpoints_of_older_state_files(self):
+        path = os.path.join(tempfile.mkdtemp(), "state.json")
+        with open(path, "w") as f:
+            json.dump({"completed": ["1|2025-01-01|2025-01-03", day_key("2", "2025-01-01")]}, f)
+        self.assertEqual(load_backfill_state(path), {
+            day_key("1", "2025-01-01"), day_key("1", "2025-01-02"), day_key("1", "2025-01-03"),
+            day_key("2", "2025-01-01"),
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
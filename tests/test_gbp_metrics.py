@@ -0,0 +1,90 @@
+import json
+import unittest
+
+from gbp_metrics import MetricRowBuilder, fetch_locations
+
+
+def series(metric, *days):
+    """One dailyMetricTimeSeries entry with a value per (YYYY-MM-DD, value) day."""
+    values = []
+    for day, value in days:
+        year, month, dom = (int(part) for part in day.split("-"))
+        entry = {"date": {"year": year, "month": month, "day": dom}}
+        if value is not None:
+            entry["value"] = value
+        values.append(entry)
+    return {"dailyMetric": metric, "timeSeries": {"datedValues": values}}
+
+
+def response(*metrics):
+    return [{"dailyMetricTimeSeries": list(metrics)}]
+
+
+class MetricRowBuilderTest(unittest.TestCase):
+    def test_rows_in_first_seen_order(self):
+        builder = MetricRowBuilder()
+        builder.add_location("b", response(
+            series("CALL_CLICKS", ("2025-01-02", "1"), ("2025-01-01", "2")),
+            series("WEBSITE_CLICKS", ("2025-01-02", "3"), ("2025-01-01", None)),
+        ))
+        builder.add_location("a", response(series("CALL_CLICKS", ("2025-01-01", "4"))))
+        self.assertEqual(builder.rows(), [
+            {"date": "2025-01-02", "profile_id": "b", "CALL_CLICKS": 1, "WEBSITE_CLICKS": 3},
+            {"date": "2025-01-01", "profile_id": "b", "CALL_CLICKS": 2, "WEBSITE_CLICKS": None},
+            {"date": "2025-01-01", "profile_id": "a", "CALL_CLICKS": 4},
+        ])
+        self.assertEqual(builder.metric_names, ["CALL_CLICKS", "WEBSITE_CLICKS"])
+
+    def test_empty_response_adds_nothing(self):
+        builder = MetricRowBuilder()
+        self.assertFalse(builder.add_location("a", []))
+        self.assertEqual(len(builder), 0)
+
+    def test_add_rows_merges_another_builder(self):
+        worker = MetricRowBuilder()
+        worker.add_location("b", response(series("BUSINESS_BOOKINGS", ("2025-01-01", "5"))))
+        builder = MetricRowBuilder()
+        builder.add_location("a", response(series("CALL_CLICKS", ("2025-01-01", "1"))))
+        builder.add_rows(worker.rows(), worker.metric_names)
+        self.assertEqual([row["profile_id"] for row in builder.rows()], ["a", "b"])
+        self.assertEqual(builder.metric_names, ["CALL_CLICKS", "BUSINESS_BOOKINGS"])
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.text = body
+        self.content = body.encode()
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeSession:
+    """Answers every location with bodies[loc_id]."""
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def get(self, url, params=None):
+        loc_id = url.rsplit("/", 1)[1].split(":")[0]
+        return self.bodies[loc_id]
+
+
+class FetchLocationsTest(unittest.TestCase):
+    def test_failed_locations_are_reported_in_order(self):
+        session = FakeSession({
+            "a": FakeResponse('{"multiDailyMetricTimeSeries": []}'),
+            "b": FakeResponse("<html>Service Unavailable</html>"),
+            "c": FakeResponse("quota", status_code=429),
+            "d": FakeResponse('{"multiDailyMetricTimeSeries": [{}]}'),
+        })
+        for max_in_flight in (1, 4):
+            results = list(fetch_locations(session, "base", ["a", "b", "c", "d"], [], max_in_flight=max_in_flight))
+            self.assertEqual([loc_id for loc_id, _, _ in results], ["a", "b", "c", "d"])
+            self.assertEqual([error is None for _, _, error in results], [True, False, False, True])
+            self.assertEqual(results[2][2], "429 quota")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from datetime import date
+
+from gbp_overwrite import FULL_START_DATE, month_slice, plan_incremental_ranges
+
+
+class PlanIncrementalRangesTest(unittest.TestCase):
+    def test_locations_never_loaded_start_at_the_full_start_date(self):
+        plan = plan_incremental_ranges(["a", "b"], {}, date(2025, 5, 1), lookback_days=7)
+        self.assertEqual(plan, {FULL_START_DATE: ["a", "b"]})
+
+    def test_refetches_the_lookback_before_the_watermark(self):
+        plan = plan_incremental_ranges(["a"], {"a": date(2025, 4, 20)}, date(2025, 5, 1), lookback_days=7)
+        self.assertEqual(plan, {date(2025, 4, 14): ["a"]})
+
+    def test_groups_locations_by_start_date(self):
+        watermarks = {"a": date(2025, 4, 20), "b": date(2025, 4, 20), "c": date(2025, 4, 25)}
+        plan = plan_incremental_ranges(["a", "b", "c", "d"], watermarks, date(2025, 5, 1), lookback_days=1)
+        self.assertEqual(plan, {
+            date(2025, 4, 20): ["a", "b"],
+            date(2025, 4, 25): ["c"],
+            FULL_START_DATE: ["d"],
+        })
+
+    def test_skips_locations_already_past_the_end_date(self):
+        plan = plan_incremental_ranges(["a", "b"], {"a": date(2025, 5, 1)}, date(2025, 5, 1), lookback_days=0)
+        self.assertEqual(plan, {FULL_START_DATE: ["b"]})
+
+
+class MonthSliceTest(unittest.TestCase):
+    def test_slices_by_location_and_month(self):
+        self.assertEqual(month_slice({"profile_id": "123", "date": "2025-04-30"}), "123/2025-04")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from rate_limit import AIMDLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_bursts_up_to_capacity_then_waits_for_the_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(clock.slept, [])
+        bucket.acquire()
+        self.assertEqual(clock.slept, [0.5])
+
+    def test_refills_while_idle_but_not_past_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=2, clock=clock, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        clock.now += 60
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(clock.slept, [])
+        bucket.acquire()
+        self.assertEqual(clock.slept, [1.0])
+
+
+class AIMDLimiterTest(unittest.TestCase):
+    def test_successes_add_one_slot_per_window(self):
+        limiter = AIMDLimiter(initial=4)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release()
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.1)
+
+    def test_throttle_multiplies_the_limit_down(self):
+        clock = FakeClock()
+        limiter = AIMDLimiter(initial=8, decrease=0.5, clock=clock)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_a_burst_of_throttles_counts_once(self):
+        clock = FakeClock()
+        limiter = AIMDLimiter(initial=8, decrease=0.5, cooldown=1.0, clock=clock)
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 4)
+        clock.now += 1.0
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.throttles, 3)
+
+    def test_limit_stays_within_bounds(self):
+        clock = FakeClock()
+        limiter = AIMDLimiter(initial=2, minimum=1, maximum=3, cooldown=0, clock=clock)
+        for _ in range(5):
+            limiter.on_throttle()
+        self.assertEqual(limiter.limit, 1)
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release()
+        self.assertEqual(limiter.limit, 3)
+
+    def test_errors_leave_the_limit_alone(self):
+        limiter = AIMDLimiter(initial=4)
+        limiter.acquire()
+        limiter.release(succeeded=False)
+        self.assertEqual(limiter.limit, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
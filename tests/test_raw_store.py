@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from raw_store import RawRun, Replay, find_run, start_sharded_run, worker_run, write_run_set
+
+
+class RawStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_replays_a_finished_run(self):
+        run = RawRun(self.root, "gbp", started=datetime(2025, 1, 1, 9, 0, 0))
+        run.put("a", b'{"rows": 1}', page=1)
+        run.put("b", '{"rows": 2}')
+        run.put("a", b'{"rows": 1}', page=2)
+        run.finish({"c": "500 error"}, incremental=True)
+
+        replay = Replay(self.root, [run.path])
+        self.assertTrue(replay.finished)
+        self.assertEqual(list(replay), [
+            ("a", {"page": 1}, b'{"rows": 1}'),
+            ("b", {}, b'{"rows": 2}'),
+            ("a", {"page": 2}, b'{"rows": 1}'),
+        ])
+        self.assertEqual(replay.entities(), {"a", "b"})
+        self.assertEqual(replay.errors, {"c": "500 error"})
+        self.assertEqual(replay.info, {"incremental": True})
+        # Identical bodies are stored once
+        objects = [name for _, _, names in os.walk(os.path.join(self.root, "objects")) for name in names]
+        self.assertEqual(len(objects), 2)
+
+    def test_unfinished_run_is_not_finished(self):
+        run = RawRun(self.root, "gbp", started=datetime(2025, 1, 1, 9, 0, 0))
+        run.put("a", b"{}")
+        self.assertFalse(Replay(self.root, [run.path]).finished)
+
+    def test_find_run_picks_the_latest_run(self):
+        for started in (datetime(2025, 1, 1, 9), datetime(2025, 1, 2, 8), datetime(2025, 1, 2, 7)):
+            RawRun(self.root, "gbp", started=started).finish()
+        self.assertTrue(find_run(self.root, "gbp").endswith(os.path.join("2025-01-02", "080000.jsonl")))
+        self.assertTrue(find_run(self.root, "gbp", "2025-01-01").endswith("090000.jsonl"))
+        self.assertIsNone(find_run(self.root, "gbp", "2024-12-31"))
+        self.assertIsNone(find_run(self.root, "ga"))
+
+    def test_sharded_run_replays_every_part(self):
+        started, manifest = start_sharded_run(self.root, "ga", ["worker0", "worker1"], run_name="daily")
+        for worker in ("worker0", "worker1"):
+            run = worker_run(self.root, "ga", worker, "daily", started)
+            run.put(worker, worker.encode())
+            run.finish()
+
+        # The run is found as a whole, never one of its parts
+        self.assertEqual(find_run(self.root, "ga"), manifest)
+        replay = Replay(self.root, [manifest])
+        self.assertTrue(replay.finished)
+        self.assertEqual(sorted(body for _, _, body in replay), [b"worker0", b"worker1"])
+
+    def test_sharded_run_with_a_missing_part_is_not_finished(self):
+        started, manifest = start_sharded_run(self.root, "ga", ["worker0", "worker1"])
+        run = worker_run(self.root, "ga", "worker0", started=started)
+        run.put("1", b"{}")
+        run.finish()
+        self.assertFalse(Replay(self.root, [manifest]).finished)
+
+    def test_run_set_of_explicit_parts(self):
+        parts = []
+        for i, name in enumerate(("shard0", "shard1")):
+            run = RawRun(self.root, "gbp", started=datetime(2025, 1, 1, 9, 0, i), name=name, part=True)
+            run.put(name, name.encode())
+            run.finish()
+            parts.append(run.path)
+        manifest = write_run_set(self.root, "gbp", parts, name="dag", started=datetime(2025, 1, 1, 10))
+        self.assertEqual(find_run(self.root, "gbp"), manifest)
+        self.assertEqual([body for _, _, body in Replay(self.root, [manifest])], [b"shard0", b"shard1"])
+
+    def test_store_disabled(self):
+        self.assertEqual(start_sharded_run(None, "ga", ["worker0"])[1], None)
+        self.assertIsNone(worker_run(None, "ga", "worker0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from sharding import HashRing, worker_names
+
+ENTITIES = [f"location{i}" for i in range(1000)]
+
+
+class HashRingTest(unittest.TestCase):
+    def test_assignment_is_stable_across_rings(self):
+        first = HashRing(worker_names(4)).assign(ENTITIES)
+        second = HashRing(worker_names(4)).assign(ENTITIES)
+        self.assertEqual(first, second)
+
+    def test_assign_covers_every_entity_once_in_order(self):
+        shards = HashRing(worker_names(3)).assign(ENTITIES)
+        self.assertEqual(sorted(e for entities in shards.values() for e in entities), sorted(ENTITIES))
+        for entities in shards.values():
+            owned = set(entities)
+            self.assertTrue(entities)
+            self.assertEqual(entities, [e for e in ENTITIES if e in owned])
+
+    def test_adding_a_worker_only_moves_entities_to_it(self):
+        before = HashRing(worker_names(3))
+        after = HashRing(worker_names(4))
+        moved = [e for e in ENTITIES if before.worker_for(e) != after.worker_for(e)]
+        self.assertTrue(moved)
+        self.assertEqual({after.worker_for(e) for e in moved}, {"worker3"})
+        # Roughly the new worker's share, not a reshuffle
+        self.assertLess(len(moved), len(ENTITIES) / 2)
+
+    def test_removing_a_worker_keeps_the_others_entities(self):
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "c"])
+        for entity in ENTITIES:
+            if before.worker_for(entity) != "b":
+                self.assertEqual(after.worker_for(entity), before.worker_for(entity))
+
+    def test_needs_a_worker(self):
+        with self.assertRaises(ValueError):
+            HashRing([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from datetime import date
+
+from whatconvert import aggregate_leads, project_leads
+
+
+def lead(date_created, lead_type, account_id=1, account="Acme"):
+    return {"date_created": date_created, "lead_type": lead_type, "account_id": account_id,
+            "account": account, "lead_url": "https://example.com"}
+
+
+def counts(leads):
+    result = aggregate_leads(project_leads(leads))
+    return sorted(
+        (row["date"], row["account_id"], row["account"], row["phone_call"], row["web_form"])
+        for row in result.to_dict("records")
+    )
+
+
+class AggregateLeadsTest(unittest.TestCase):
+    def test_counts_calls_and_forms_per_day_and_account(self):
+        self.assertEqual(counts([
+            lead("2025-01-01 09:00:00", "Phone Call"),
+            lead("2025-01-01 10:00:00", "phone call"),
+            lead("2025-01-01 11:00:00", "Web Form"),
+            lead("2025-01-01 12:00:00", "Chat"),
+            lead("2025-01-02 09:00:00", "WEB FORM"),
+            lead("2025-01-01 09:00:00", "Phone Call", account_id=2, account="Other"),
+        ]), [
+            (date(2025, 1, 1), 1, "Acme", 2, 1),
+            (date(2025, 1, 1), 2, "Other", 1, 0),
+            (date(2025, 1, 2), 1, "Acme", 0, 1),
+        ])
+
+    def test_leads_without_a_lead_type_count_as_neither(self):
+        self.assertEqual(counts([
+            lead("2025-01-01 09:00:00", None),
+            lead("2025-01-01 10:00:00", None),
+        ]), [(date(2025, 1, 1), 1, "Acme", 0, 0)])
+
+    def test_non_string_lead_types_count_as_neither(self):
+        self.assertEqual(counts([
+            lead("2025-01-01 09:00:00", 7),
+            lead("2025-01-01 10:00:00", "Web Form"),
+        ]), [(date(2025, 1, 1), 1, "Acme", 0, 1)])
+
+    def test_no_leads(self):
+        self.assertEqual(counts([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
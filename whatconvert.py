@@ -1,11 +1,183 @@
+import argparse
+import sys
 import requests
 import os
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
 
-def main():
+import instrumentation
+from http_client import make_session as make_http_session
+from rate_limit import print_rate_report
+
+# The API returns at most 2500 leads per page
+LEADS_PER_PAGE = 2500
+MAX_WORKERS = 8
+API_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Only these lead fields are used by the aggregation
+LEAD_FIELDS = ("date_created", "lead_type", "account_id", "account")
+
+# Source name of this connector's stages in the run metrics
+METRICS_SOURCE = "whatconverts"
+
+# ---- WhatConverts API Functions ----
+
+def make_session(username, password, pool_size=MAX_WORKERS):
+    """Keep-alive session with basic auth, a connection per worker, retries and timeouts."""
+    return make_http_session(pool_size=pool_size, auth=(username, password))
+
+
+def shard_key(params):
+    """Names a shard in the run metrics by its account and window start."""
+    return f"{params.get('account_id', 'all')}:{params['start_date']}"
+
+
+def fetch_leads_page(session, url, params, page_number):
+    page_params = dict(params, page_number=page_number)
+    with instrumentation.key(shard_key(params)):
+        response = session.get(url, params=page_params)
+        response.raise_for_status()
+        return response.json()
+
+
+def build_shards(start_date, end_date, account_ids=None, window_days=None):
+    """
+    Splits the request into independent query parameter sets, one per
+    account_id x date window. Without account_ids or window_days a single
+    shard covers the whole range across all accounts.
+    """
+    # Windows are inclusive on both ends, so each one stops a second
+    # before the next begins.
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = end_date
+        if window_days:
+            window_end = min(window_start + timedelta(days=window_days, seconds=-1), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(seconds=1)
+
+    shards = []
+    for account_id in (account_ids or [None]):
+        for window_start, window_end in windows:
+            params = {
+                "start_date": window_start.strftime(API_DATE_FORMAT),
+                "end_date": window_end.strftime(API_DATE_FORMAT),
+                "leads_per_page": str(LEADS_PER_PAGE),
+            }
+            if account_id is not None:
+                params["account_id"] = account_id
+            shards.append(params)
+    return shards
+
+
+def fetch_all_leads(session, url, shards, max_workers=MAX_WORKERS):
+    """
+    Fetches every page of every shard. The first page of each shard is
+    requested concurrently to read total_pages, then all remaining pages are
+    fetched on the same pool. Leads come back in shard and page order.
+    Requests, bytes and leads are recorded per shard in the current stage's
+    metrics.
+    """
+    fetch_page = instrumentation.propagate(fetch_leads_page)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        first_pages = list(executor.map(
+            lambda params: fetch_page(session, url, params, 1), shards
+        ))
+        remaining = [
+            (shard_index, page)
+            for shard_index, first in enumerate(first_pages)
+            for page in range(2, int(first.get("total_pages", 1)) + 1)
+        ]
+        later_pages = list(executor.map(
+            lambda job: fetch_page(session, url, shards[job[0]], job[1]), remaining
+        ))
+
+    pages_by_shard = [[first] for first in first_pages]
+    for (shard_index, _), data in zip(remaining, later_pages):
+        pages_by_shard[shard_index].append(data)
+
+    leads = []
+    for shard_index, pages in enumerate(pages_by_shard):
+        expected = int(pages[0].get("total_leads", 0))
+        shard_leads = [lead for data in pages for lead in data.get("leads", [])]
+        instrumentation.record(rows=len(shard_leads), key=shard_key(shards[shard_index]))
+        if expected and len(shard_leads) != expected:
+            print(f"Shard {shards[shard_index]} returned {len(shard_leads)} of {expected} leads.")
+        leads.extend(shard_leads)
+    print(f"Fetched {len(leads)} leads from {len(shards)} shard(s), "
+          f"{len(shards) + len(remaining)} page(s).")
+    return leads
+
+
+# ---- Transformation ----
+
+def project_leads(leads):
+    """
+    Keeps only LEAD_FIELDS from the raw lead dicts, as one list per field,
+    so the nested columns of the API response never reach pandas.
+    """
+    columns = {field: [] for field in LEAD_FIELDS}
+    appenders = [(field, columns[field].append) for field in LEAD_FIELDS]
+    for lead in leads:
+        for field, append in appenders:
+            append(lead.get(field))
+    return columns
+
+
+def aggregate_leads(columns):
+    """
+    Counts phone calls and web forms per date, account_id and account.
+
+    The date is the YYYY-MM-DD prefix of date_created. Grouping keys are
+    categoricals, and lead_type is classified once per distinct value and
+    then broadcast through the category codes; leads without a string
+    lead_type count as neither.
+    """
+    date = pd.Categorical(pd.Series(columns["date_created"], dtype="object").str[:10])
+    lead_type = pd.Categorical(columns["lead_type"])
+    # Non-string lead types match neither kind, and the trailing entry is
+    # what the code -1 of a missing lead_type picks
+    kinds = [kind.lower() if isinstance(kind, str) else None for kind in lead_type.categories] + [None]
+    is_phone = np.array([kind == 'phone call' for kind in kinds])[lead_type.codes]
+    is_web = np.array([kind == 'web form' for kind in kinds])[lead_type.codes]
+
+    df = pd.DataFrame({
+        "date": date,
+        "account_id": pd.Categorical(columns["account_id"]),
+        "account": pd.Categorical(columns["account"]),
+        "phone_call": is_phone.astype("int64"),
+        "web_form": is_web.astype("int64"),
+    })
+    result = df.groupby(['date', 'account_id', 'account'], observed=True, as_index=False)[['phone_call', 'web_form']].sum()
+
+    # Back to plain columns for printing and loading
+    result['date'] = pd.to_datetime(result['date'].astype(str)).dt.date
+    result['account_id'] = result['account_id'].astype(result['account_id'].cat.categories.dtype)
+    result['account'] = result['account'].astype(result['account'].cat.categories.dtype)
+    return result
+
+
+@instrumentation.exports_metrics
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate WhatConverts leads.")
+    parser.add_argument(
+        "--account-id", action="append", dest="account_ids",
+        help="Shard by account; repeat for each account id."
+    )
+    parser.add_argument(
+        "--window-days", type=int,
+        help="Shard the date range into windows of this many days."
+    )
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.export_on_return(args)
+
     # -----------------------
     # Step 1: Retrieve and Process API Data
     # -----------------------
@@ -15,43 +187,37 @@ def main():
     username = ""
     password = ""
     yesterday = datetime.now() - timedelta(days=1)
-    params = {
-        "start_date": f"2025-04-14T00:00:00Z",
-        "leads_per_page": "2500"
-    }
-
-    # Perform a GET request using HTTP Basic Authentication
-    response = requests.get(url, auth=(username, password), params=params)
-
-    if response.status_code == 200:
-        data = response.json()  # Parse the JSON response
-        print("Leads retrieved successfully!")
-        
-        leads = data.get('leads', [])
-        if not leads:
-            print("No leads found in the response.")
-            exit()
-        
-        # Convert the list of leads to a DataFrame
-        df = pd.DataFrame(leads)
-        
-        # Extract the date from 'date_created' (removing the time)
-        df['date'] = pd.to_datetime(df['date_created']).dt.date
-        
-        # Create columns for counting phone calls and web forms based on lead_type
-        # (Assuming that the lead_type field is either "Phone Call" or "Web Form")
-        df['phone_call'] = (df['lead_type'].str.lower() == 'phone call').astype(int)
-        df['web_form'] = (df['lead_type'].str.lower() == 'web form').astype(int)
-        
-        # Group by date, account_id, and account to aggregate counts
-        result = df.groupby(['date', 'account_id', 'account'], as_index=False)[['phone_call', 'web_form']].sum()
-        
-        print("Processed DataFrame:")
-        print(result)
-    else:
-        print(f"Request failed with status code {response.status_code}")
-        print("Response:", response.text)
-        exit()
+    start_date = datetime(2025, 4, 14)
+    # Pin the end of the range so pages don't shift as new leads arrive mid-fetch
+    end_date = datetime.utcnow()
+    shards = build_shards(start_date, end_date, args.account_ids, args.window_days)
+
+    # Fetch every page over a pooled session using HTTP Basic Authentication
+    session = make_session(username, password, args.max_workers)
+    try:
+        with instrumentation.stage("fetch", METRICS_SOURCE):
+            leads = fetch_all_leads(session, url, shards, args.max_workers)
+    except requests.RequestException as e:
+        print(f"Request failed: {e}")
+        if e.response is not None:
+            print("Response:", e.response.text)
+        sys.exit(1)
+
+    print("Leads retrieved successfully!")
+    print_rate_report()
+    
+    if not leads:
+        print("No leads found in the response.")
+        return
+    
+    # Project the needed fields and count phone calls / web forms
+    # per date, account_id and account in one vectorized pass
+    with instrumentation.stage("transform", METRICS_SOURCE):
+        result = aggregate_leads(project_leads(leads))
+        instrumentation.record(rows=len(leads))
+    
+    print("Processed DataFrame:")
+    print(result)
 
     # -----------------------
     # Step 2: Dump the DataFrame into BigQuery
@@ -105,4 +271,4 @@ def main():
     # print(f"Loaded data into BigQuery table '{full_table_id}'.")
     
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()